@@ -1,11 +1,123 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from dotenv import load_dotenv
 import os
+import random
+import time
 
-DATABASE_URL = "sqlite:///./booktable.db"
+load_dotenv()
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Engine settings, overridable from the environment
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./booktable.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+
+# Per-connection SQLite settings: WAL lets readers run alongside the writer,
+# NORMAL sync is durable in WAL mode except on power loss, and a busy timeout
+# makes a writer wait for the lock instead of failing at once
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+
+
+# Async driver for each sync URL scheme, used by the async engine
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "mysql": "mysql+aiomysql"}
+
+
+def make_engine(url: str = DATABASE_URL, use_async: bool = False):
+    url = make_url(url)
+    if use_async:
+        url = url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    # In-memory SQLite uses a single shared connection, not a sized pool
+    if url.database not in (None, "", ":memory:"):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        if use_async:
+            # aiosqlite would otherwise default to opening a connection per checkout
+            options["poolclass"] = AsyncAdaptedQueuePool
+    new_engine = create_async_engine(url, **options) if use_async else create_engine(url, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(new_engine.sync_engine if use_async else new_engine, "connect", _sqlite_pragmas)
+    return new_engine
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    finally:
+        cursor.close()
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine over the same database for `async def` read endpoints, so waiting
+# on the database does not hold one of the threadpool's workers
+async_engine = make_engine(use_async=True)
+
+
+# Sync session class behind AsyncSession, so session event listeners can be attached to it
+class AsyncBackedSession(Session):
+    pass
+
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False, sync_session_class=AsyncBackedSession
+)
+
+
+# Connection pool usage of an engine, for monitoring
+def pool_stats(target=engine) -> dict:
+    pool = target.pool
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    if hasattr(pool, "timeout"):
+        stats["timeout"] = pool.timeout()
+        stats["max_overflow"] = DB_MAX_OVERFLOW
+    return stats
+
 Base = declarative_base()
+
+
+# Start the session's transaction with SQLite's write lock held, so reads made
+# to validate a write cannot be invalidated by a concurrent writer
+def begin_immediate(db):
+    if db.get_bind().dialect.name == "sqlite":
+        db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+
+
+# "database is locked" / "database is busy" errors are worth retrying
+def is_locked_error(error) -> bool:
+    message = str(getattr(error, "orig", error)).lower()
+    return "locked" in message or "busy" in message
+
+
+# Run `work` (which starts its transaction with begin_immediate) again while another
+# writer holds the lock, backing off exponentially; other errors propagate at once
+def retry_on_lock(db, work, attempts: int = 5, delay: float = 0.05):
+    for attempt in range(attempts):
+        try:
+            return work()
+        except OperationalError as e:
+            db.rollback()
+            if not is_locked_error(e) or attempt == attempts - 1:
+                raise
+            time.sleep(delay * 2 ** attempt * (1 + random.random()))
@@ -0,0 +1,105 @@
+import logging
+from typing import Callable, List, Optional, Set
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.db import models
+
+logger = logging.getLogger(__name__)
+
+# Restaurant columns that decide which restaurants a search returns
+CATALOG_FIELDS = {"name", "cuisine", "cost_rating", "city", "state", "zip_code", "latitude", "longitude"}
+
+# Child rows whose changes only affect the stats of their restaurant. Reservations
+# and tables are left out: they only decide availability, which no listener keeps,
+# and the booking counters they drive are restaurant columns, caught as such
+CHILD_MODELS = (models.Review,)
+
+
+class RestaurantChanges:
+    """
+    Restaurants touched by one committed transaction.
+
+    `ids` holds the affected restaurant ids (None when a bulk statement touched
+    an unknown set), and `catalog` is set when a restaurant was added, removed
+    or had a searchable field changed, so any search result may be stale.
+    """
+
+    def __init__(self):
+        self.ids: Optional[Set[int]] = set()
+        self.catalog = False
+
+    def add(self, restaurant_id):
+        if self.ids is not None and restaurant_id is not None:
+            self.ids.add(restaurant_id)
+
+    def touches(self, restaurant_ids) -> bool:
+        return self.ids is None or not self.ids.isdisjoint(restaurant_ids)
+
+
+_listeners: List[Callable[[RestaurantChanges], None]] = []
+
+
+# Register a callback run after every commit that touched restaurant data
+def on_restaurants_changed(callback: Callable[[RestaurantChanges], None]):
+    _listeners.append(callback)
+    return callback
+
+
+def _pending(session: Session) -> RestaurantChanges:
+    return session.info.setdefault("restaurant_changes", RestaurantChanges())
+
+
+def _collect_from_flush(session: Session, flush_context):
+    # after_flush still sees the pre-flush new/dirty/deleted sets and attribute history
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.Restaurant):
+            changes = _pending(session)
+            changes.add(obj.id)
+            if obj in session.new or obj in session.deleted:
+                changes.catalog = True
+            elif any(inspect(obj).attrs[f].history.has_changes() for f in CATALOG_FIELDS):
+                changes.catalog = True
+        elif isinstance(obj, CHILD_MODELS):
+            _pending(session).add(obj.restaurant_id)
+
+
+def _collect_from_bulk(orm_execute_state):
+    # Bulk UPDATE/DELETE through the ORM; callers can name the affected
+    # restaurants with .execution_options(restaurant_ids=[...])
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in (models.Restaurant,) + CHILD_MODELS:
+        return
+    changes = _pending(orm_execute_state.session)
+    restaurant_ids = orm_execute_state.execution_options.get("restaurant_ids")
+    if restaurant_ids is None:
+        changes.ids = None
+    else:
+        for restaurant_id in restaurant_ids:
+            changes.add(restaurant_id)
+    if mapper.class_ is models.Restaurant and orm_execute_state.is_delete:
+        changes.catalog = True
+
+
+def _dispatch(session: Session):
+    changes = session.info.pop("restaurant_changes", None)
+    if changes is None:
+        return
+    for callback in _listeners:
+        try:
+            callback(changes)
+        except Exception:
+            logger.exception("Restaurant change listener failed")
+
+
+def _discard(session: Session, *args):
+    session.info.pop("restaurant_changes", None)
+
+
+# Attach the listeners to every ORM session
+def install(session_factory):
+    event.listen(session_factory, "after_flush", _collect_from_flush)
+    event.listen(session_factory, "do_orm_execute", _collect_from_bulk)
+    event.listen(session_factory, "after_commit", _dispatch)
+    event.listen(session_factory, "after_rollback", _discard)
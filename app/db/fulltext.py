@@ -0,0 +1,73 @@
+import re
+from typing import Optional
+from sqlalchemy import Float, Integer, column, literal_column, select, table, text
+
+# External-content FTS5 index over the searchable restaurant columns.
+# Triggers keep it in sync with the restaurants table on insert, update and delete.
+FTS_COLUMNS = ("name", "cuisine", "city", "state", "zip_code")
+
+FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS restaurants_fts USING fts5(
+        {", ".join(FTS_COLUMNS)},
+        content='restaurants', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS restaurants_fts_ai AFTER INSERT ON restaurants BEGIN
+        INSERT INTO restaurants_fts(rowid, {", ".join(FTS_COLUMNS)})
+        VALUES (new.id, {", ".join("new." + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS restaurants_fts_ad AFTER DELETE ON restaurants BEGIN
+        INSERT INTO restaurants_fts(restaurants_fts, rowid, {", ".join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {", ".join("old." + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS restaurants_fts_au AFTER UPDATE OF {", ".join(FTS_COLUMNS)} ON restaurants BEGIN
+        INSERT INTO restaurants_fts(restaurants_fts, rowid, {", ".join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {", ".join("old." + c for c in FTS_COLUMNS)});
+        INSERT INTO restaurants_fts(rowid, {", ".join(FTS_COLUMNS)})
+        VALUES (new.id, {", ".join("new." + c for c in FTS_COLUMNS)});
+    END""",
+]
+
+# Lightweight handle for querying the virtual table; rank is FTS5's bm25 score (lower is better)
+restaurants_fts = table("restaurants_fts", column("rowid", Integer), column("rank", Float))
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# Columns matched as a whole value rather than by prefix
+EXACT_COLUMNS = ("zip_code",)
+
+
+# Create the FTS table and triggers, and index existing rows the first time
+def create_fulltext_index(conn):
+    existed = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'restaurants_fts'")
+    ).first()
+    for statement in FTS_DDL:
+        conn.exec_driver_sql(statement)
+    if not existed:
+        conn.exec_driver_sql("INSERT INTO restaurants_fts(restaurants_fts) VALUES ('rebuild')")
+
+
+# Quote user input as an FTS5 phrase with a trailing prefix match, e.g. san jo -> "san jo"*
+def _phrase(value: str, prefix: bool = True) -> Optional[str]:
+    tokens = _TOKEN.findall(value.lower())
+    return f'"{" ".join(tokens)}"{"*" if prefix else ""}' if tokens else None
+
+
+# Build a MATCH expression from free text plus per-column filters; None when nothing to match
+def match_expression(q: Optional[str] = None, **columns: Optional[str]) -> Optional[str]:
+    terms = []
+    if q:
+        terms.extend(f'"{token}"*' for token in _TOKEN.findall(q.lower()))
+    for name, value in columns.items():
+        phrase = _phrase(value, prefix=name not in EXACT_COLUMNS) if value else None
+        if phrase:
+            terms.append(f"{name} : {phrase}")
+    return " AND ".join(terms) if terms else None
+
+
+# Subquery of (rowid, rank) for restaurants matching an expression
+def matching_restaurants(expression: str):
+    return select(restaurants_fts.c.rowid, restaurants_fts.c.rank).where(
+        literal_column("restaurants_fts").match(expression)
+    ).subquery()
@@ -0,0 +1,235 @@
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from app.db import models
+from app.db.database import Base, is_locked_error
+from app.db.fulltext import create_fulltext_index
+from app.db.spatial import add_coordinate_columns, backfill_coordinates, create_spatial_index
+from app.utils.time_slots import build_table_slots
+from app.utils.ranking import recompute_rank_scores
+
+# Columns added to existing tables after their first release
+ADDED_COLUMNS = {
+    "restaurants": [
+        ("review_count", "INTEGER DEFAULT 0"),
+        ("review_sum", "INTEGER DEFAULT 0"),
+        ("booking_heat", "FLOAT DEFAULT 0.0"),
+        ("heat_updated_at", "DATETIME"),
+        ("rank_score", "FLOAT DEFAULT 0.0"),
+    ],
+    "reviews": [
+        ("created_at", "DATETIME"),
+    ],
+    "reservations": [
+        ("status", "VARCHAR NOT NULL DEFAULT 'confirmed'"),
+        ("hold_expires_at", "DATETIME"),
+    ],
+}
+
+
+# Indexes declared on tables that already existed before the index was added;
+# create_all only creates indexes together with a brand new table
+def create_missing_indexes(conn, tables=(models.Table, models.Restaurant, models.Reservation)):
+    for model in tables:
+        for index in model.__table__.indexes:
+            try:
+                index.create(bind=conn, checkfirst=True)
+            except IntegrityError as e:
+                # Existing rows violate a new unique index; leave it out until they are cleaned up
+                print(f"Could not create index {index.name}: {str(e.orig)}")
+
+
+# Indexes behind the hot reservation and review lookups (see app.db.query_plans).
+# ANALYZE gives the planner row estimates, so it prefers user_id or date over the
+# low-selectivity status column when a query filters on both
+def create_hot_path_indexes(conn):
+    create_missing_indexes(conn, (models.Reservation, models.Review))
+    conn.exec_driver_sql("ANALYZE")
+
+
+def add_missing_columns(conn):
+    inspector = inspect(conn)
+    for table_name, columns in ADDED_COLUMNS.items():
+        existing = {c["name"] for c in inspector.get_columns(table_name)}
+        for name, ddl in columns:
+            if name not in existing:
+                conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {name} {ddl}")
+
+
+# Score restaurants that have never been ranked (existing rows after the columns were added)
+def backfill_rank_scores(conn):
+    db = Session(bind=conn)
+    try:
+        unranked = [r.id for r in db.query(models.Restaurant.id).filter(models.Restaurant.heat_updated_at.is_(None))]
+        if unranked:
+            recompute_rank_scores(db, unranked)
+            db.commit()
+    finally:
+        db.close()
+
+
+# One-shot copy of the Table.available_times CSV column into table_slots.
+# Skipped once table_slots holds any rows.
+def migrate_table_slots(conn):
+    if conn.execute(text("SELECT 1 FROM table_slots LIMIT 1")).first():
+        return
+
+    db = Session(bind=conn)
+    try:
+        migrated = 0
+        for table in db.query(models.Table).filter(models.Table.available_times.isnot(None)).all():
+            table.slots = build_table_slots(table.available_times.split(","))
+            migrated += len(table.slots)
+        db.commit()
+        if migrated:
+            print(f"Migrated {migrated} table slots from available_times.")
+    finally:
+        db.close()
+
+
+def create_tables(conn):
+    Base.metadata.create_all(bind=conn)
+
+
+def create_booking_count_tables(conn):
+    Base.metadata.create_all(bind=conn, tables=[models.BookingCount.__table__, models.BookingCountMark.__table__])
+
+
+# create_all applies sqlite_autoincrement only to new tables; older ones reuse the
+# highest id after a delete, so they are rebuilt with AUTOINCREMENT
+def rebuild_autoincrement_tables(conn):
+    if conn.dialect.name != "sqlite":
+        return
+    for table in Base.metadata.sorted_tables:
+        if table.dialect_options["sqlite"]["autoincrement"]:
+            rebuild_with_autoincrement(conn, table)
+
+
+# Copy the table into a new one created from the model, swap it in and recreate its
+# indexes (inside the migration's transaction); ids carry over and sqlite_sequence
+# starts from the highest of them
+def rebuild_with_autoincrement(conn, table):
+    create_sql = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+    ).scalar()
+    if create_sql is None or "AUTOINCREMENT" in create_sql.upper():
+        return
+    staging = f"{table.name}_rebuild"
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    columns = ", ".join(c.name for c in table.columns if c.name in existing)
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {staging}")
+    conn.exec_driver_sql(
+        str(CreateTable(table).compile(conn)).replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {staging} ", 1)
+    )
+    conn.exec_driver_sql(f"INSERT INTO {staging} ({columns}) SELECT {columns} FROM {table.name}")
+    conn.exec_driver_sql(f"DROP TABLE {table.name}")
+    conn.exec_driver_sql(f"ALTER TABLE {staging} RENAME TO {table.name}")
+    for index in table.indexes:
+        try:
+            index.create(bind=conn)
+        except IntegrityError as e:
+            # As in create_missing_indexes: rows violating a unique index leave it out
+            print(f"Could not create index {index.name}: {str(e.orig)}")
+    # The planner statistics went with the old table
+    conn.exec_driver_sql(f"ANALYZE {table.name}")
+
+
+# Schema steps in the order they are applied, each step(conn) run inside the
+# transaction that records it. Append new steps with the next version number and
+# never renumber or edit released ones. Steps stay idempotent, since DDL outside
+# SQLite may not roll back with the transaction.
+MIGRATIONS = [
+    (1, "create_tables", create_tables),
+    (2, "add_coordinate_columns", add_coordinate_columns),
+    (3, "add_missing_columns", add_missing_columns),
+    (4, "create_missing_indexes", create_missing_indexes),
+    (5, "migrate_table_slots", migrate_table_slots),
+    (6, "create_fulltext_index", create_fulltext_index),
+    (7, "backfill_coordinates", backfill_coordinates),
+    (8, "create_spatial_index", create_spatial_index),
+    (9, "backfill_rank_scores", backfill_rank_scores),
+    (10, "create_hot_path_indexes", create_hot_path_indexes),
+    (11, "rebuild_autoincrement_tables", rebuild_autoincrement_tables),
+    (12, "create_booking_count_tables", create_booking_count_tables),
+]
+
+
+# A process waits this long (seconds) for another one's migration to finish
+MIGRATION_LOCK_SECONDS = 600
+
+
+def _applied(conn) -> set:
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at DATETIME NOT NULL)"
+    )
+    return {version for (version,) in conn.exec_driver_sql("SELECT version FROM schema_migrations")}
+
+
+def applied_versions(engine) -> set:
+    with engine.begin() as conn:
+        return _applied(conn)
+
+
+# Take the database's write lock (BEGIN IMMEDIATE on SQLite) for one migration step,
+# waiting while another process holds it
+def _lock(conn):
+    if conn.dialect.name != "sqlite":
+        conn.begin()
+        return
+    deadline = time.monotonic() + MIGRATION_LOCK_SECONDS
+    while True:
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            return
+        except OperationalError as e:
+            conn.rollback()
+            if not is_locked_error(e) or time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+# Apply the steps not yet recorded in schema_migrations, in version order. Each step
+# runs under the write lock: the applied versions are read again once it is held, so
+# two processes starting together (uvicorn --workers) never apply a step twice, and
+# the step is recorded in the transaction that applies it.
+def run_migrations(engine):
+    if MIGRATIONS[-1][0] in applied_versions(engine):
+        return
+    with engine.connect() as conn:
+        for version, name, step in MIGRATIONS:
+            _lock(conn)
+            if version in _applied(conn):
+                conn.rollback()
+                continue
+            print(f"Applying migration {version}: {name}")
+            step(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :at)"),
+                {"v": version, "n": name, "at": datetime.now()}
+            )
+            conn.commit()
+
+
+# python -m app.db.migrations [status|check]
+#   (no argument)  apply pending migrations
+#   status         list migrations and whether they are applied
+#   check          fail if a hot query plan scans a table
+if __name__ == "__main__":
+    from app.db.database import engine
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "upgrade":
+        run_migrations(engine)
+    elif command == "status":
+        applied = applied_versions(engine)
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>3} {name:<28} {'applied' if version in applied else 'pending'}")
+    elif command == "check":
+        from app.db.query_plans import check_query_plans
+        sys.exit(0 if check_query_plans(engine) else 1)
+    else:
+        sys.exit(f"Unknown command: {command}")
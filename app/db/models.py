@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Enum, Date, Time, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Enum, Date, DateTime, Time, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from app.db.database import Base
 
@@ -28,10 +28,22 @@ class Restaurant(Base):
     zip_code = Column(String, nullable=False)
     rating = Column(Float, default=0.0)
     total_bookings = Column(Integer, default=0)
+    latitude = Column(Float, nullable=True)  # defaults to the zip code centroid
+    longitude = Column(Float, nullable=True)
+    review_count = Column(Integer, default=0)  # running review aggregates behind `rating`
+    review_sum = Column(Integer, default=0)
+    booking_heat = Column(Float, default=0.0)  # bookings decayed to heat_updated_at
+    heat_updated_at = Column(DateTime, nullable=True)
+    rank_score = Column(Float, default=0.0)  # see app.utils.ranking
 
     tables = relationship("Table", back_populates="restaurant")
     reviews = relationship("Review", back_populates="restaurant")
 
+    __table_args__ = (
+        # Top-K by score, walked backwards for "best first"
+        Index("ix_restaurants_rank_score", "rank_score", "id"),
+    )
+
 
 # Table Model
 class Table(Base):
@@ -40,9 +52,30 @@ class Table(Base):
     id = Column(Integer, primary_key=True, index=True)
     restaurant_id = Column(Integer, ForeignKey("restaurants.id"))
     size = Column(Integer, nullable=False)  # number of seats
-    available_times = Column(String)  # e.g. "18:00,18:30,19:00"
+    available_times = Column(String)  # e.g. "18:00,18:30,19:00", kept for compatibility; slots are authoritative
 
     restaurant = relationship("Restaurant", back_populates="tables")
+    slots = relationship("TableSlot", back_populates="table", cascade="all, delete-orphan",
+                         order_by="TableSlot.minute_of_day")
+
+    __table_args__ = (
+        Index("ix_tables_restaurant_size", "restaurant_id", "size"),
+    )
+
+
+# Table Slot Model (one row per bookable start time of a table)
+class TableSlot(Base):
+    __tablename__ = "table_slots"
+
+    table_id = Column(Integer, ForeignKey("tables.id"), primary_key=True)
+    minute_of_day = Column(Integer, primary_key=True)  # e.g. 18:30 -> 1110
+
+    table = relationship("Table", back_populates="slots")
+
+    __table_args__ = (
+        # Range lookups by time first ("slots between T-30 and T+30"), then table
+        Index("ix_table_slots_minute_table", "minute_of_day", "table_id"),
+    )
 
 
 # Reservation Model
@@ -56,11 +89,55 @@ class Reservation(Base):
     date = Column(Date)
     time = Column(Time)
     number_of_people = Column(Integer)
+    status = Column(String, nullable=False, default="confirmed")  # "confirmed", or "held" during checkout
+    hold_expires_at = Column(DateTime, nullable=True)  # holds only
 
     user = relationship("User")
     restaurant = relationship("Restaurant")
     table = relationship("Table")
 
+    __table_args__ = (
+        # One reservation per table and start time, enforced by the database
+        Index("ux_reservations_table_slot", "table_id", "date", "time", unique=True),
+        # Live holds by expiry, for the hold sweeper's startup load
+        Index("ix_reservations_status_expiry", "status", "hold_expires_at"),
+        # A restaurant's bookings on a day (today's count, cancellations, admin cleanup)
+        Index("ix_reservations_restaurant_date", "restaurant_id", "date"),
+        # Bookings per day across restaurants (availability counts, analytics)
+        Index("ix_reservations_date_restaurant", "date", "restaurant_id"),
+        # A customer's reservations
+        Index("ix_reservations_user_date", "user_id", "date"),
+        # Ids are never reused; reservation shards start their ids at their own offset
+        {"sqlite_autoincrement": True},
+    )
+
+
+# Waitlist Entry Model (a customer waiting for any table at a restaurant within
+# a window of start times; promoted to a reservation when a matching one is cancelled)
+class WaitlistEntry(Base):
+    __tablename__ = "waitlist_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=False)
+    date = Column(Date, nullable=False)
+    start_minute = Column(Integer, nullable=False)  # earliest acceptable start, minutes since midnight
+    end_minute = Column(Integer, nullable=False)  # latest acceptable start
+    party_size = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="waiting")  # "waiting", "promoted" or "left"
+    reservation_id = Column(Integer, ForeignKey("reservations.id"), nullable=True)  # once promoted
+    created_at = Column(DateTime, nullable=False)
+
+    user = relationship("User")
+    restaurant = relationship("Restaurant")
+
+    __table_args__ = (
+        # Waiters for a freed slot: equality on restaurant, date and status, then the window and party size
+        Index("ix_waitlist_match", "restaurant_id", "date", "status", "start_minute", "end_minute", "party_size"),
+        Index("ix_waitlist_user", "user_id", "status"),
+        {"sqlite_autoincrement": True},
+    )
+
 
 # Review Model
 class Review(Base):
@@ -71,6 +148,73 @@ class Review(Base):
     restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=False)
     rating = Column(Integer, nullable=False)  # e.g., 1 to 5
     comment = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=True)
 
     user = relationship("User", back_populates="reviews")
     restaurant = relationship("Restaurant", back_populates="reviews")
+
+    __table_args__ = (
+        # Reviews and rating aggregates of a restaurant, answered from the index
+        Index("ix_reviews_restaurant_rating", "restaurant_id", "rating"),
+        # "Already reviewed" check
+        Index("ix_reviews_user_restaurant", "user_id", "restaurant_id"),
+    )
+
+
+# Notification Outbox Model (messages written with the change that triggers them,
+# delivered by the background worker in app.utils.outbox)
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # e.g. "booking_confirmation", see outbox.SENDERS
+    recipient = Column(String, nullable=False)  # email address or phone number
+    payload = Column(Text, nullable=False)  # JSON arguments for the sender
+    status = Column(String, nullable=False, default="pending")  # "pending", "sending", "sent", "dead"
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)  # due time, or lease expiry while sending
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # The worker's "due messages" scan
+        Index("ix_notification_outbox_status_due", "status", "next_attempt_at"),
+    )
+
+
+# Booking Count Model (bookings made or cancelled on a reservation shard, written in the
+# booking's transaction and folded into the restaurant counters by app.utils.booking_counter)
+class BookingCount(Base):
+    __tablename__ = "booking_counts"
+
+    id = Column(Integer, primary_key=True)
+    restaurant_id = Column(Integer, nullable=False)
+    added = Column(Integer, nullable=False, default=0)
+    removed = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Ids are never reused, so the last folded id marks everything before it as counted
+        {"sqlite_autoincrement": True},
+    )
+
+
+# Booking Count Mark Model (per reservation shard, the last booking count folded into
+# the restaurants; updated in the same transaction as the counters)
+class BookingCountMark(Base):
+    __tablename__ = "booking_count_marks"
+
+    shard = Column(Integer, primary_key=True)  # shard index
+    last_id = Column(Integer, nullable=False)
+
+
+# Idempotency Key Model (stored responses of POSTs sent with an Idempotency-Key header)
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String, primary_key=True)  # endpoint and caller, e.g. "book:19"
+    key = Column(String, primary_key=True)
+    request_hash = Column(String, nullable=False)  # keyed hash of the request body
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(Text, nullable=False)  # JSON
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,104 @@
+from typing import List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Query, Session, joinedload
+from app.db import models, fulltext
+
+# Statements on the hot paths, built here so the endpoints and the query plan
+# check (app.db.query_plans) send the very same SQL
+
+
+# Review count and average rating of the restaurant on each row, as correlated
+# subqueries: one ix_reviews_restaurant_rating lookup per restaurant returned,
+# instead of grouping every review in the catalog
+def review_stats():
+    review_count = select(func.count(models.Review.id)).where(
+        models.Review.restaurant_id == models.Restaurant.id
+    ).scalar_subquery()
+    average_review = select(func.avg(models.Review.rating)).where(
+        models.Review.restaurant_id == models.Restaurant.id
+    ).scalar_subquery()
+    return review_count, average_review
+
+
+# Restrict a restaurant query to a location, all of it matched through the
+# full-text index (the zip code as a whole value): any filter on the restaurants
+# table itself makes SQLite scan it and probe the index once per row instead
+def located(query: Query, city: Optional[str] = None, state: Optional[str] = None,
+            zip_code: Optional[str] = None) -> Query:
+    expression = fulltext.match_expression(city=city, state=state, zip_code=zip_code)
+    if expression:
+        matches = fulltext.matching_restaurants(expression)
+        query = query.join(matches, matches.c.rowid == models.Restaurant.id)
+    return query
+
+
+# Restaurants considered by /availability, with their review count and average
+def available_restaurants(db: Session, city: Optional[str] = None, state: Optional[str] = None,
+                          zip_code: Optional[str] = None) -> Query:
+    review_count, average_review = review_stats()
+    return located(db.query(models.Restaurant, review_count, average_review), city, state, zip_code)
+
+
+# Restaurants shown by /availability/calendar: one of them, or those in a location
+def calendar_restaurants(db: Session, restaurant_id: Optional[int] = None, city: Optional[str] = None,
+                         state: Optional[str] = None, zip_code: Optional[str] = None) -> Query:
+    query = db.query(models.Restaurant.id, models.Restaurant.name)
+    if restaurant_id is not None:
+        query = query.filter(models.Restaurant.id == restaurant_id)
+    return located(query, city, state, zip_code).order_by(models.Restaurant.id)
+
+
+# Confirmed bookings per restaurant dated `first` to `last`, for the given restaurants or all of them
+def booking_counts(rdb: Session, first, last, restaurant_ids: Optional[List[int]] = None) -> Query:
+    query = rdb.query(models.Reservation.restaurant_id, func.count(models.Reservation.id)).filter(
+        models.Reservation.date.between(first, last),
+        models.Reservation.status == "confirmed"
+    )
+    if restaurant_ids is not None:
+        query = query.filter(models.Reservation.restaurant_id.in_(restaurant_ids))
+    return query.group_by(models.Reservation.restaurant_id)
+
+
+# Confirmed bookings of one restaurant on one day
+def bookings_on(rdb: Session, restaurant_id: int, day) -> Query:
+    return rdb.query(models.Reservation).filter(
+        models.Reservation.restaurant_id == restaurant_id,
+        models.Reservation.date == day,
+        models.Reservation.status == "confirmed"
+    )
+
+
+# A customer's confirmed reservations
+def user_reservations(user_id: int):
+    return select(
+        models.Reservation.id, models.Reservation.restaurant_id, models.Reservation.date,
+        models.Reservation.time, models.Reservation.table_id, models.Reservation.number_of_people
+    ).where(models.Reservation.user_id == user_id, models.Reservation.status == "confirmed")
+
+
+# Reviews of a restaurant, with their reviewers loaded up front (async sessions cannot lazy load)
+def restaurant_reviews(restaurant_id: int):
+    return select(models.Review).options(joinedload(models.Review.user)).where(
+        models.Review.restaurant_id == restaurant_id
+    )
+
+
+# A customer's review of a restaurant, if they wrote one
+def user_review(db: Session, user_id: int, restaurant_id: int) -> Query:
+    return db.query(models.Review).filter(
+        models.Review.user_id == user_id,
+        models.Review.restaurant_id == restaurant_id
+    )
+
+
+# The slot of a table starting at `minute`, if the table has one
+def table_slot(db: Session, table_id: int, minute: int) -> Query:
+    return db.query(models.TableSlot.table_id).filter(
+        models.TableSlot.table_id == table_id,
+        models.TableSlot.minute_of_day == minute
+    )
+
+
+# The user signing in with an email address
+def user_by_email(email: str):
+    return select(models.User).where(models.User.email == email)
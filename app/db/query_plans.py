@@ -0,0 +1,82 @@
+from datetime import date, datetime
+from typing import Callable, Dict, List
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.db import queries
+from app.utils import availability_index, holds, outbox, waitlist
+
+DAY = date(2025, 1, 1)
+NOW = datetime(2025, 1, 1, 18, 0)
+
+# The lookups behind the booking, availability, review and background-worker
+# paths, run through the same builders the endpoints and workers use. Each one
+# must be answered through an index: a plan step that SCANs a table means a
+# missing or unusable index. Restaurant searches are checked with a location
+# filter; without one they list the whole catalog.
+HOT_QUERIES: Dict[str, Callable[[Session], object]] = {
+    "booking_conflict": lambda db: availability_index.find_conflict(db, 1, NOW),
+    "bookings_today": lambda db: queries.bookings_on(db, 1, DAY).count(),
+    "availability_restaurants": lambda db: queries.available_restaurants(db, city="San Jose").all(),
+    "availability_restaurants_by_zip": lambda db: queries.available_restaurants(db, zip_code="95113").all(),
+    "availability_booking_counts": lambda db: queries.booking_counts(db, DAY, DAY, [1, 2]).all(),
+    "availability_open_slots": lambda db: availability_index.open_slots_query(db, [1, 2], DAY).all(),
+    "availability_layouts": lambda db: availability_index.table_layouts_query(db, [1, 2]).all(),
+    "calendar_restaurants": lambda db: queries.calendar_restaurants(db, city="San Jose").all(),
+    "calendar_restaurant": lambda db: queries.calendar_restaurants(db, restaurant_id=1).all(),
+    "calendar_reservations": lambda db: availability_index.reservations_in_range(db, [1, 2], DAY, DAY).all(),
+    "booking_analytics": lambda db: queries.booking_counts(db, DAY, DAY).all(),
+    "my_reservations": lambda db: db.execute(queries.user_reservations(1)).all(),
+    "restaurant_reviews": lambda db: db.execute(queries.restaurant_reviews(1)).unique().all(),
+    "already_reviewed": lambda db: queries.user_review(db, 1, 1).first(),
+    "table_slot": lambda db: queries.table_slot(db, 1, 1080).first(),
+    "waitlist_match": lambda db: waitlist.waiting_for(db, 1, DAY, 1080, 4).first(),
+    "live_holds": lambda db: holds.live_holds(db).all(),
+    "outbox_claim": lambda db: outbox.due_messages(db, NOW).all(),
+    "user_by_email": lambda db: db.execute(queries.user_by_email("someone@example.com")).scalars().first(),
+}
+
+
+def _statements(engine, run: Callable[[Session], object]) -> List[tuple]:
+    """The SELECT statements (with their parameters) `run` sends, captured as they execute."""
+    sent = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            sent.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    db = Session(bind=engine)
+    try:
+        run(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+        db.close()
+    return sent
+
+
+def query_plans(engine) -> Dict[str, List[str]]:
+    """EXPLAIN QUERY PLAN detail lines of every hot query."""
+    plans = {}
+    for name, run in HOT_QUERIES.items():
+        steps = []
+        with engine.connect() as conn:
+            for statement, parameters in _statements(engine, run):
+                rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+                steps.extend(row[-1] for row in rows)
+        plans[name] = steps
+    return plans
+
+
+def full_scans(steps: List[str]) -> List[str]:
+    """Plan steps that read a whole table; a full-text MATCH is an index lookup."""
+    return [step for step in steps if step.startswith("SCAN") and "VIRTUAL TABLE INDEX" not in step]
+
+
+def check_query_plans(engine) -> bool:
+    """Print each hot query's plan; False if any of them scans a table."""
+    ok = True
+    for name, steps in query_plans(engine).items():
+        scans = full_scans(steps)
+        print(f"{'FAIL' if scans else 'ok  '} {name}: {'; '.join(steps)}")
+        ok = ok and not scans
+    return ok
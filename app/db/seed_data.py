@@ -3,6 +3,9 @@ from app.db import models
 models.Base.metadata.create_all(bind=engine)
 from app.db import models, database
 from app.auth.auth_handler import hash_password
+from app.utils.time_slots import build_table_slots
+from app.utils.geo import zip_centroid
+from app.utils.ranking import recompute_rank_scores
 from sqlalchemy.orm import Session
 
 def seed_restaurants_tables_reviews():
@@ -95,6 +98,7 @@ def seed_restaurants_tables_reviews():
 
     for entry in sample_restaurants:
         restaurant = entry["restaurant"]
+        restaurant.latitude, restaurant.longitude = zip_centroid(restaurant.zip_code) or (None, None)
         db.add(restaurant)
         db.flush()
 
@@ -102,7 +106,8 @@ def seed_restaurants_tables_reviews():
             db.add(models.Table(
                 restaurant_id=restaurant.id,
                 size=t["size"],
-                available_times=t["available_times"]
+                available_times=t["available_times"],
+                slots=build_table_slots(t["available_times"].split(","))
             ))
 
         for r in entry["reviews"]:
@@ -113,6 +118,8 @@ def seed_restaurants_tables_reviews():
                 comment=r["comment"]
             ))
 
+    db.flush()
+    recompute_rank_scores(db)
     db.commit()
     print("✅ Restaurants, tables, and reviews seeded.")
     db.close()
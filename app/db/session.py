@@ -1,11 +1,247 @@
-from databases import Database
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.ext.declarative import declarative_base
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from app.db import database
 
-DATABASE_URL = "sqlite:///./booktable.db"
+logger = logging.getLogger(__name__)
 
-database = Database(DATABASE_URL)
-engine = create_engine(DATABASE_URL)
-metadata = MetaData()
+# Read replicas: external replica URLs, and/or local SQLite copies of the primary
+# refreshed through the backup API (for running with replicas on one machine)
+READ_REPLICA_URLS = [u.strip() for u in os.getenv("READ_REPLICA_URLS", "").split(",") if u.strip()]
+SQLITE_LOCAL_REPLICAS = int(os.getenv("SQLITE_LOCAL_REPLICAS", "0"))
+REPLICA_REFRESH_SECONDS = float(os.getenv("REPLICA_REFRESH_SECONDS", "2"))
 
-Base = declarative_base(metadata=metadata)
+# External replicas are assumed to trail the primary by at most this much
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "1"))
+
+# Write responses carry this token (header and cookie); reads sent with it go to
+# the primary until a replica has caught up with the write
+READ_AFTER_HEADER = "X-Read-After"
+READ_AFTER_COOKIE = "read_after"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA query_only=1")
+    finally:
+        cursor.close()
+
+
+class Replica:
+    """A read-only engine pair (sync and async) over one replica database."""
+
+    def __init__(self, url: str, local_copy: bool = False):
+        self.url = url
+        self.local_copy = local_copy
+        self.engine = database.make_engine(url)
+        self.async_engine = database.make_engine(url, use_async=True)
+        if make_url(url).get_backend_name() == "sqlite":
+            event.listen(self.engine, "connect", _query_only)
+            event.listen(self.async_engine.sync_engine, "connect", _query_only)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.AsyncSessionLocal = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+        # Wall-clock time up to which this replica has every committed write
+        self._synced_at = 0.0
+
+    @property
+    def synced_at(self) -> float:
+        if self.local_copy:
+            return self._synced_at
+        return time.time() - REPLICA_MAX_LAG_SECONDS
+
+    # Copy the primary into this replica's file; the copy holds every write committed before it started
+    def refresh(self):
+        started = time.time()
+        source = sqlite3.connect(database.engine.url.database, timeout=database.SQLITE_BUSY_TIMEOUT_MS / 1000)
+        target = sqlite3.connect(make_url(self.url).database, timeout=database.SQLITE_BUSY_TIMEOUT_MS / 1000)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        self._synced_at = started
+
+
+def _local_replica_urls(count: int) -> List[str]:
+    primary = database.engine.url
+    if primary.get_backend_name() != "sqlite" or primary.database in (None, "", ":memory:"):
+        return []
+    base, ext = os.path.splitext(primary.database)
+    return [str(primary.set(database=f"{base}.replica{i}{ext}")) for i in range(1, count + 1)]
+
+
+class ReplicaSet:
+    """
+    Routes read sessions across the replicas, round robin, and keeps local
+    SQLite copies fresh from a background thread. A read that must see a
+    write newer than a replica's last sync is sent to the primary instead.
+    """
+
+    def __init__(self, replicas: List[Replica]):
+        self.replicas = replicas
+        self._next = itertools.cycle(range(len(replicas))) if replicas else None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.primary_reads = 0
+        self.replica_reads = 0
+
+    def pick(self, read_after: float = 0.0) -> Optional[Replica]:
+        """A replica that has every write up to `read_after`, or None for the primary."""
+        if not self.replicas:
+            return None
+        with self._lock:
+            start = next(self._next)
+            for i in range(len(self.replicas)):
+                replica = self.replicas[(start + i) % len(self.replicas)]
+                if replica.synced_at >= max(read_after, 1.0):
+                    self.replica_reads += 1
+                    return replica
+            self.primary_reads += 1
+            return None
+
+    def start(self):
+        local = [r for r in self.replicas if r.local_copy]
+        if not local or self._thread is not None:
+            return
+        # First copy before serving, so replicas never answer from an empty file
+        self._refresh(local)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(local,), name="replica-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self, local: List[Replica]):
+        while not self._stop.wait(REPLICA_REFRESH_SECONDS):
+            self._refresh(local)
+
+    def _refresh(self, local: List[Replica]):
+        for replica in local:
+            try:
+                replica.refresh()
+            except Exception:
+                logger.exception("Replica refresh of %s failed", replica.url)
+
+    # Close the async engines' connections on the event loop that opened them
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.async_engine.dispose()
+            replica.engine.dispose()
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "replicas": [
+                {"url": r.url, "local_copy": r.local_copy, "lag_seconds": round(now - r.synced_at, 3) if r.synced_at else None}
+                for r in self.replicas
+            ],
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads
+        }
+
+
+replica_set = ReplicaSet(
+    [Replica(url) for url in READ_REPLICA_URLS]
+    + [Replica(url, local_copy=True) for url in _local_replica_urls(SQLITE_LOCAL_REPLICAS)]
+)
+
+
+# Time of the client's last write, from the read-your-writes header or cookie
+def read_after(request: Request) -> float:
+    token = request.headers.get(READ_AFTER_HEADER) or request.cookies.get(READ_AFTER_COOKIE)
+    try:
+        return float(token) if token else 0.0
+    except ValueError:
+        return 0.0
+
+
+# Stamp a successful write response so the client's next reads see the write
+def mark_write(response):
+    token = f"{time.time():.3f}"
+    response.headers[READ_AFTER_HEADER] = token
+    response.set_cookie(READ_AFTER_COOKIE, token, max_age=60, httponly=True, samesite="lax")
+
+
+def _read_replica(request: Request) -> Optional[Replica]:
+    if request.method not in SAFE_METHODS:
+        return None
+    return replica_set.pick(read_after(request))
+
+
+# Data in a session is current as of this time (None for the primary); caches use it
+# to avoid storing results read from a replica that predates an invalidation
+def read_as_of(db) -> Optional[float]:
+    return db.info.get("as_of")
+
+
+# The client's read-your-writes token, for a session opened by get_db or get_async_db;
+# shared in-memory state loaded before it may miss the client's write
+def client_read_after(db) -> float:
+    return db.info.get("read_after", 0.0)
+
+
+# Session to load shared in-memory state from: `db` when its data is current as of
+# `since` (the state's last known change), else a primary session, so a lagging
+# replica never puts data the state has already moved past back into it
+@contextmanager
+def session_as_of(db, since: float):
+    as_of = read_as_of(db)
+    if as_of is None or as_of >= since:
+        yield db
+        return
+    primary = database.SessionLocal()
+    try:
+        yield primary
+    finally:
+        primary.close()
+
+
+# Shared session dependency: reads (GET/HEAD) go to a replica when one is fresh
+# enough for the client, everything else to the primary
+def get_db(request: Request):
+    replica = _read_replica(request)
+    db = replica.SessionLocal() if replica else database.SessionLocal()
+    if replica:
+        db.info["as_of"] = replica.synced_at
+    db.info["read_after"] = read_after(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Primary session regardless of the request method, for GETs that write
+def get_primary_db():
+    db = database.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Async counterpart of get_db, for async def endpoints
+async def get_async_db(request: Request):
+    replica = _read_replica(request)
+    async with (replica.AsyncSessionLocal() if replica else database.AsyncSessionLocal()) as db:
+        if replica:
+            db.info["as_of"] = replica.synced_at
+        db.info["read_after"] = read_after(request)
+        yield db
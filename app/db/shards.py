@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+from fastapi import Depends
+from sqlalchemy import delete, insert, inspect, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from app.db import database, models
+from app.db.session import get_db
+
+logger = logging.getLogger(__name__)
+
+# Optional sharding of the booking tables by restaurant: explicit shard URLs,
+# or this many local SQLite files next to the main database (0 = no sharding)
+RESERVATION_SHARD_URLS = [u.strip() for u in os.getenv("RESERVATION_SHARD_URLS", "").split(",") if u.strip()]
+RESERVATION_SHARDS = int(os.getenv("RESERVATION_SHARDS", "0"))
+
+# Restaurant ids are split into ranges of this many consecutive ids, dealt out
+# to the shards in turn (1 = restaurant id modulo the shard count)
+RESERVATION_SHARD_BLOCK = int(os.getenv("RESERVATION_SHARD_BLOCK", "1"))
+
+# Everything a booking writes besides the restaurant counters lives on the
+# restaurant's shard, so a booking commits on one database and one write lock
+SHARDED_TABLES = (
+    models.Reservation.__table__,
+    models.WaitlistEntry.__table__,
+    models.NotificationOutbox.__table__,
+    models.IdempotencyKey.__table__,
+    models.BookingCount.__table__,
+)
+
+# Sharded rows that belong to a restaurant and move with it
+RESTAURANT_ROWS = (models.Reservation.__table__, models.WaitlistEntry.__table__)
+
+# Ids created on shard i start above (i + 1) * SHARD_ID_SPAN, so reservation and
+# waitlist ids stay unique across shards (and above the pre-sharding ids)
+SHARD_ID_SPAN = 10 ** 12
+
+
+# Sync session class of every shard, so session event listeners can be attached to it
+class ShardSession(Session):
+    pass
+
+
+class Shard:
+    """Sync and async engines over one shard database."""
+
+    def __init__(self, index: int, url: str):
+        self.index = index
+        self.url = url
+        self.engine = database.make_engine(url)
+        self.async_engine = database.make_engine(url, use_async=True)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine, class_=ShardSession)
+        self.AsyncSessionLocal = async_sessionmaker(
+            self.async_engine, autoflush=False, expire_on_commit=False, sync_session_class=ShardSession
+        )
+
+    def create_tables(self):
+        database.Base.metadata.create_all(self.engine, tables=list(SHARDED_TABLES))
+        if self.engine.dialect.name != "sqlite":
+            return
+        with self.engine.begin() as conn:
+            for table in RESTAURANT_ROWS:
+                conn.execute(text(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+                ), {"name": table.name, "seq": (self.index + 1) * SHARD_ID_SPAN})
+
+
+def _local_shard_urls(count: int) -> List[str]:
+    primary = database.engine.url
+    if primary.get_backend_name() != "sqlite" or primary.database in (None, "", ":memory:"):
+        return []
+    base, ext = os.path.splitext(primary.database)
+    return [str(primary.set(database=f"{base}.shard{i}{ext}")) for i in range(count)]
+
+
+class ShardRouter:
+    """
+    Maps restaurants to reservation shards and runs work on them.
+
+    Without shards every method falls back to the session it is given (the
+    main database), so callers use the same code either way: `session` for
+    one restaurant's rows, `session_holding` for a row known by id, and
+    `gather` / `gather_restaurants` / `gather_async` to scatter a query over
+    the shards in parallel and collect one result per shard.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.shards = [Shard(i, url) for i, url in enumerate(urls)]
+        self._pool = ThreadPoolExecutor(max_workers=len(urls), thread_name_prefix="shard") if urls else None
+
+    def index_for(self, restaurant_id: int) -> int:
+        return (restaurant_id - 1) // RESERVATION_SHARD_BLOCK % len(self.shards)
+
+    def shard_for(self, restaurant_id: int) -> Shard:
+        return self.shards[self.index_for(restaurant_id)]
+
+    # Session on the shard holding a restaurant's reservations
+    @contextmanager
+    def session(self, db: Session, restaurant_id: int):
+        if not self.shards:
+            yield db
+            return
+        shard_db = self.shard_for(restaurant_id).SessionLocal()
+        try:
+            yield shard_db
+        finally:
+            shard_db.close()
+
+    # Session on the shard holding the row with this id; when no shard has it, the
+    # first one, where the caller's own lookup then finds nothing
+    @contextmanager
+    def session_holding(self, db: Session, model, row_id: int):
+        if not self.shards:
+            yield db
+            return
+
+        def holds(shard_db: Session) -> bool:
+            return shard_db.query(model.id).filter(model.id == row_id).first() is not None
+
+        # A row keeps the id range of the shard that created it, so that shard is
+        # asked first; rows from before sharding or moved by a rebalance are found
+        # by asking every shard
+        home = row_id // SHARD_ID_SPAN - 1
+        if not (0 <= home < len(self.shards) and self._run(self.shards[home], holds)):
+            found = self.gather(db, holds)
+            home = found.index(True) if True in found else 0
+        shard_db = self.shards[home].SessionLocal()
+        try:
+            yield shard_db
+        finally:
+            shard_db.close()
+
+    def _run(self, shard: Shard, work: Callable, *args):
+        shard_db = shard.SessionLocal()
+        try:
+            return work(shard_db, *args)
+        finally:
+            shard_db.close()
+
+    def gather(self, db: Session, work: Callable[[Session], object]) -> list:
+        """work(session) on every shard in parallel (on `db` alone without shards)."""
+        if not self.shards:
+            return [work(db)]
+        return list(self._pool.map(lambda shard: self._run(shard, work), self.shards))
+
+    def gather_restaurants(self, db: Session, restaurant_ids: List[int], work: Callable[[Session, List[int]], object]) -> list:
+        """work(session, ids) on each shard owning some of the restaurants, with that shard's ids."""
+        if not self.shards:
+            return [work(db, list(restaurant_ids))]
+        by_shard: Dict[int, List[int]] = {}
+        for restaurant_id in restaurant_ids:
+            by_shard.setdefault(self.index_for(restaurant_id), []).append(restaurant_id)
+        return list(self._pool.map(lambda item: self._run(self.shards[item[0]], work, item[1]), by_shard.items()))
+
+    async def gather_async(self, db, work) -> list:
+        """Async counterpart of gather: `await work(session)` on every shard concurrently."""
+        if not self.shards:
+            return [await work(db)]
+
+        async def run(shard: Shard):
+            async with shard.AsyncSessionLocal() as shard_db:
+                return await work(shard_db)
+        return list(await asyncio.gather(*(run(shard) for shard in self.shards)))
+
+    def install(self):
+        """Create the shard tables and move rows that are not on their restaurant's shard."""
+        if not self.shards:
+            return
+        for shard in self.shards:
+            shard.create_tables()
+        moved = self.rebalance()
+        if not moved:
+            return
+        logger.info("Moved %d rows to their reservation shards", moved)
+        # Refresh the planner statistics, as the main database's migrations do
+        for shard in self.shards:
+            if shard.engine.dialect.name == "sqlite":
+                with shard.engine.begin() as conn:
+                    conn.exec_driver_sql("ANALYZE")
+
+    def rebalance(self) -> int:
+        """
+        Move reservations and waitlist entries, a restaurant at a time, from the
+        main database or another shard to the restaurant's shard (after sharding
+        is turned on or the shard count changes). Rows keep their ids; copies are
+        made with INSERT OR IGNORE first, so a move interrupted half way is
+        finished by the next run. Runs before the main database's migrations, so
+        only the columns the source table already has are copied.
+        """
+        sources = [(None, database.engine)] + [(shard.index, shard.engine) for shard in self.shards]
+        moved = 0
+        for table in RESTAURANT_ROWS:
+            for source_index, source in sources:
+                source_schema = inspect(source)
+                if not source_schema.has_table(table.name):
+                    continue
+                existing = {column["name"] for column in source_schema.get_columns(table.name)}
+                columns = [column for column in table.c if column.name in existing]
+                with source.connect() as conn:
+                    restaurant_ids = conn.execute(
+                        select(table.c.restaurant_id).where(table.c.restaurant_id.isnot(None)).distinct()
+                    ).scalars().all()
+                for restaurant_id in restaurant_ids:
+                    home = self.index_for(restaurant_id)
+                    if home == source_index:
+                        continue
+                    with source.connect() as conn:
+                        rows = [dict(row) for row in conn.execute(
+                            select(*columns).where(table.c.restaurant_id == restaurant_id)
+                        ).mappings()]
+                    with self.shards[home].engine.begin() as conn:
+                        conn.execute(insert(table).prefix_with("OR IGNORE"), rows)
+                    with source.begin() as conn:
+                        conn.execute(delete(table).where(table.c.restaurant_id == restaurant_id))
+                    moved += len(rows)
+        return moved
+
+    # Close the async engines' connections on the event loop that opened them
+    async def dispose(self):
+        for shard in self.shards:
+            await shard.async_engine.dispose()
+            shard.engine.dispose()
+
+    def stats(self) -> dict:
+        def count(db: Session):
+            return db.query(models.Reservation).count()
+        counts = self.gather(None, count) if self.shards else []
+        return {
+            "shards": [
+                {"url": shard.url, "reservations": reservations, "pool": database.pool_stats(shard.engine)}
+                for shard, reservations in zip(self.shards, counts)
+            ],
+            "block": RESERVATION_SHARD_BLOCK
+        }
+
+
+shard_router = ShardRouter(RESERVATION_SHARD_URLS or _local_shard_urls(RESERVATION_SHARDS))
+
+
+# Session dependency for endpoints under /{restaurant_id}: the restaurant's
+# reservation shard, or the request's own session when there are no shards
+def get_reservations_db(restaurant_id: int, db: Session = Depends(get_db)):
+    with shard_router.session(db, restaurant_id) as reservations_db:
+        yield reservations_db
@@ -0,0 +1,76 @@
+from sqlalchemy import Integer, column, inspect, select, table, text
+from sqlalchemy.orm import Session
+from app.db import models
+from app.utils.geo import zip_centroid
+
+# R*Tree over restaurant coordinates; points are stored as zero-area boxes.
+# Triggers keep it in sync with restaurants.latitude/longitude.
+SPATIAL_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS restaurants_rtree USING rtree(
+        id, min_lat, max_lat, min_lng, max_lng
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS restaurants_rtree_ai AFTER INSERT ON restaurants
+    WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+        INSERT INTO restaurants_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS restaurants_rtree_ad AFTER DELETE ON restaurants BEGIN
+        DELETE FROM restaurants_rtree WHERE id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS restaurants_rtree_au AFTER UPDATE OF latitude, longitude ON restaurants BEGIN
+        DELETE FROM restaurants_rtree WHERE id = old.id;
+        INSERT INTO restaurants_rtree
+        SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    END""",
+]
+
+restaurants_rtree = table(
+    "restaurants_rtree",
+    column("id", Integer), column("min_lat"), column("max_lat"), column("min_lng"), column("max_lng")
+)
+
+
+# Add the coordinate columns to databases created before they existed
+def add_coordinate_columns(conn):
+    existing = {c["name"] for c in inspect(conn).get_columns("restaurants")}
+    for name in ("latitude", "longitude"):
+        if name not in existing:
+            conn.exec_driver_sql(f"ALTER TABLE restaurants ADD COLUMN {name} FLOAT")
+
+
+# Fill missing coordinates from the bundled zip centroid table
+def backfill_coordinates(conn):
+    db = Session(bind=conn)
+    try:
+        for restaurant in db.query(models.Restaurant).filter(models.Restaurant.latitude.is_(None)).all():
+            centroid = zip_centroid(restaurant.zip_code)
+            if centroid:
+                restaurant.latitude, restaurant.longitude = centroid
+        db.commit()
+    finally:
+        db.close()
+
+
+# Create the R*Tree and its triggers, and index existing rows the first time
+def create_spatial_index(conn):
+    existed = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'restaurants_rtree'")
+    ).first()
+    for statement in SPATIAL_DDL:
+        conn.exec_driver_sql(statement)
+    if not existed:
+        conn.exec_driver_sql(
+            """INSERT INTO restaurants_rtree
+            SELECT id, latitude, latitude, longitude, longitude FROM restaurants
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL"""
+        )
+
+
+# Subquery of restaurant ids whose coordinates fall inside a bounding box
+def restaurants_in_box(south: float, north: float, west: float, east: float):
+    return select(restaurants_rtree.c.id).where(
+        restaurants_rtree.c.min_lat >= south,
+        restaurants_rtree.c.max_lat <= north,
+        restaurants_rtree.c.min_lng >= west,
+        restaurants_rtree.c.max_lng <= east
+    ).subquery()
@@ -1,6 +1,13 @@
-from fastapi import FastAPI
-from app.db import models
-from app.db.database import Base, engine
+from fastapi import FastAPI, Request
+from app.db.database import engine, SessionLocal, AsyncBackedSession, async_engine
+from app.db import events
+from app.db.migrations import run_migrations
+from app.db.session import SAFE_METHODS, mark_write, replica_set
+from app.db.shards import ShardSession, shard_router
+from app.utils.booking_counter import booking_counter
+from app.utils.outbox import outbox_worker
+from app.utils.holds import hold_sweeper
+from app.utils.ranking import rank_refresher
 from app.routers import users, restaurants, restaurant_manager, admin, debug  # ✅ include debug
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -10,8 +17,17 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Create the reservation shards, if configured, and move rows onto them; first,
+# so migrations that read reservations find them on their shards
+shard_router.install()
+
+# Create the tables and apply pending schema migrations (also: python -m app.db.migrations)
+run_migrations(engine)
+
+# Publish committed restaurant changes to the in-process caches
+events.install(SessionLocal)
+events.install(AsyncBackedSession)
+events.install(ShardSession)
 
 # Register routers
 app.include_router(users.router)
@@ -25,6 +41,40 @@ app.include_router(debug.router)  # ✅ test route enabled
 def startup_event():
     from app.db.seed_data import seed_restaurants_tables_reviews
     seed_restaurants_tables_reviews()
+    # Deliver queued notifications in the background
+    outbox_worker.start()
+    # Release slot holds as they expire
+    hold_sweeper.start()
+    # Copy the primary into local read replicas, if any are configured
+    replica_set.start()
+    # Fold bookings made on reservation shards into the restaurant counters
+    booking_counter.start()
+    # Re-decay rank scores as bookings age (hourly)
+    rank_refresher.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    outbox_worker.stop()
+    hold_sweeper.stop()
+    replica_set.stop()
+    booking_counter.stop()
+    rank_refresher.stop()
+
+# Close the async engines' pooled connections on the event loop that opened them
+@app.on_event("shutdown")
+async def close_async_engine():
+    await async_engine.dispose()
+    await replica_set.dispose()
+    await shard_router.dispose()
+
+# Read-your-writes: successful writes hand the client a token that keeps its
+# next reads on the primary until the replicas have caught up
+@app.middleware("http")
+async def read_after_write(request: Request, call_next):
+    response = await call_next(request)
+    if replica_set.replicas and request.method not in SAFE_METHODS and response.status_code < 400:
+        mark_write(response)
+    return response
 
 # Root endpoint
 @app.get("/")
@@ -38,4 +88,5 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Corrected-Query", "X-Read-After"],
 )
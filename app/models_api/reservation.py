@@ -1,8 +1,32 @@
 from pydantic import BaseModel
 from datetime import date, time
+from typing import List, Optional
 
 class ReservationCreate(BaseModel):
     table_id: int
     date: date
     time: str
-    number_of_people: int
\ No newline at end of file
+    number_of_people: int
+    hold_id: Optional[int] = None  # confirm a hold taken on this slot
+
+class HoldCreate(BaseModel):
+    table_id: int
+    date: date
+    time: str  # "HH:MM"
+    number_of_people: int
+    minutes: Optional[int] = None  # defaults to holds.HOLD_MINUTES
+
+class WaitlistCreate(BaseModel):
+    date: date
+    time: str  # "HH:MM"
+    number_of_people: int
+    window_minutes: Optional[int] = None  # defaults to waitlist.WAITLIST_WINDOW_MINUTES
+
+class BatchBookingItem(BaseModel):
+    table_id: int
+    date: date
+    time: str  # "HH:MM"
+    number_of_people: int
+
+class BatchBookingCreate(BaseModel):
+    bookings: List[BatchBookingItem]
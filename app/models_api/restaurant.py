@@ -9,6 +9,8 @@ class RestaurantCreate(BaseModel):
     state: str
     zip_code: str
     rating: float = 0.0
+    latitude: Optional[float] = None  # looked up from zip_code when omitted
+    longitude: Optional[float] = None
 
 class RestaurantUpdate(BaseModel):
     name: Optional[str] = None
@@ -17,6 +19,8 @@ class RestaurantUpdate(BaseModel):
     city: Optional[str] = None
     state: Optional[str] = None
     zip_code: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class TableCreate(BaseModel):
     size: int
@@ -24,4 +28,28 @@ class TableCreate(BaseModel):
 
 class TableUpdate(BaseModel):
     size: Optional[int] = None
-    available_times: Optional[List[str]] = None
\ No newline at end of file
+    available_times: Optional[List[str]] = None
+
+class ReviewSummary(BaseModel):
+    id: int
+    user_id: int
+    rating: int
+    comment: Optional[str] = None
+
+class RestaurantSearchResult(BaseModel):
+    # Every field is optional so responses can carry just the requested fieldset
+    id: Optional[int] = None
+    name: Optional[str] = None
+    cuisine: Optional[str] = None
+    cost_rating: Optional[int] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    zip_code: Optional[str] = None
+    rating: Optional[float] = None
+    total_bookings: Optional[int] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    distance_km: Optional[float] = None
+    maps_url: Optional[str] = None
+    rank_score: Optional[float] = None
+    reviews: Optional[List[ReviewSummary]] = None
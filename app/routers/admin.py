@@ -2,23 +2,18 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 from datetime import datetime, timedelta
-from app.db import models, database
-from app.db.model_extensions import RestaurantApproval
+from app.db import models, queries
+from app.db.model_extensions import RestaurantApproval, RestaurantPhoto
 from app.auth.auth_dependency import get_current_user
+from app.db.session import get_db
+from app.db.shards import shard_router
+from app.utils.availability_index import availability_index
 
 router = APIRouter(
     prefix="/admin",
     tags=["Admin"]
 )
 
-# DB session dependency
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Get pending restaurant approvals
 @router.get("/restaurants/pending")
 def get_pending_approvals(
@@ -83,9 +78,17 @@ def remove_restaurant(
     if not restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found.")
     
+    # The restaurant's reservations and waitlist entries
+    def remove_bookings(rdb: Session):
+        rdb.query(models.Reservation).filter(models.Reservation.restaurant_id == restaurant_id).delete()
+        rdb.query(models.WaitlistEntry).filter(models.WaitlistEntry.restaurant_id == restaurant_id).delete()
+
     # Delete associated data first
+    if not shard_router.shards:
+        remove_bookings(db)
     db.query(models.Review).filter(models.Review.restaurant_id == restaurant_id).delete()
-    db.query(models.Reservation).filter(models.Reservation.restaurant_id == restaurant_id).delete()
+    table_ids = db.query(models.Table.id).filter(models.Table.restaurant_id == restaurant_id)
+    db.query(models.TableSlot).filter(models.TableSlot.table_id.in_(table_ids.scalar_subquery())).delete(synchronize_session=False)
     db.query(models.Table).filter(models.Table.restaurant_id == restaurant_id).delete()
     db.query(RestaurantPhoto).filter(RestaurantPhoto.restaurant_id == restaurant_id).delete()
     db.query(RestaurantApproval).filter(RestaurantApproval.restaurant_id == restaurant_id).delete()
@@ -93,6 +96,16 @@ def remove_restaurant(
     # Then delete the restaurant
     db.delete(restaurant)
     db.commit()
+
+    # On a shard, bookings go after the restaurant is committed as removed, so none
+    # can be made for it once they are deleted; a failure here leaves only rows of
+    # a restaurant that no longer exists, never a restaurant without its bookings
+    if shard_router.shards:
+        with shard_router.session(db, restaurant_id) as rdb:
+            remove_bookings(rdb)
+            rdb.commit()
+
+    availability_index.invalidate_restaurant(restaurant_id)
     
     return {"message": "Restaurant and all associated data removed successfully"}
 
@@ -115,23 +128,20 @@ def get_reservation_analytics(
     else:
         raise HTTPException(status_code=400, detail="Timeframe must be 'week' or 'month'.")
     
-    # Get reservations within the date range
-    reservations = db.query(models.Reservation).filter(
-        models.Reservation.date >= start_date,
-        models.Reservation.date <= today
-    ).all()
-    
-    # Group by restaurant
-    restaurant_counts = {}
-    for reservation in reservations:
-        restaurant_id = reservation.restaurant_id
-        if restaurant_id not in restaurant_counts:
-            restaurant_counts[restaurant_id] = {
-                "restaurant_id": restaurant_id,
-                "restaurant_name": reservation.restaurant.name,
-                "count": 0
-            }
-        restaurant_counts[restaurant_id]["count"] += 1
+    # Reservations within the date range, counted per restaurant on each reservation shard
+    counts = {}
+    for rows in shard_router.gather(db, lambda rdb: queries.booking_counts(rdb, start_date, today).all()):
+        for restaurant_id, count in rows:
+            counts[restaurant_id] = counts.get(restaurant_id, 0) + count
+
+    # Name the restaurants with one lookup
+    names = dict(db.query(models.Restaurant.id, models.Restaurant.name).filter(
+        models.Restaurant.id.in_(list(counts))
+    ).all()) if counts else {}
+    restaurant_counts = {
+        restaurant_id: {"restaurant_id": restaurant_id, "restaurant_name": names.get(restaurant_id), "count": count}
+        for restaurant_id, count in counts.items()
+    }
     
     # Convert to list and sort by count
     analytics = list(restaurant_counts.values())
@@ -139,6 +149,6 @@ def get_reservation_analytics(
     
     return {
         "timeframe": timeframe,
-        "total_reservations": len(reservations),
+        "total_reservations": sum(counts.values()),
         "by_restaurant": analytics
     }
\ No newline at end of file
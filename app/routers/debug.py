@@ -1,7 +1,12 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from sendgrid import SendGridAPIClient
 from app.utils.email_utils import send_booking_confirmation, BookingConfirmationDetails
+from app.utils.outbox import outbox_stats
+from app.db import database
+from app.db.session import get_db, replica_set
+from app.db.shards import shard_router
 
 import os
 
@@ -43,4 +48,31 @@ def test_sendgrid_email():
         result = send_booking_confirmation(test_email, test_booking)
         return {"env": env_log, "sendgrid_result": result}
     except Exception as e:
-        return {"env": env_log, "error": str(e), "success": False}
\ No newline at end of file
+        return {"env": env_log, "error": str(e), "success": False}
+
+
+# Outbox message counts per status (pending, sending, sent, dead)
+@router.get("/debug/outbox")
+def get_outbox_stats(db: Session = Depends(get_db)):
+    # Summed over the main database and the reservation shards
+    totals = outbox_stats(db)
+    if shard_router.shards:
+        for stats in shard_router.gather(db, outbox_stats):
+            for status, count in stats.items():
+                totals[status] = totals.get(status, 0) + count
+    return totals
+
+# Database connection pool usage (size, checked in/out, overflow) of the sync and async engines
+@router.get("/debug/pool")
+def get_pool_stats():
+    return {"sync": database.pool_stats(), "async": database.pool_stats(database.async_engine)}
+
+# Read replicas, how far each trails the primary, and how reads were routed
+@router.get("/debug/replicas")
+def get_replica_stats():
+    return replica_set.stats()
+
+# Reservation shards, their row counts and connection pools
+@router.get("/debug/shards")
+def get_shard_stats():
+    return shard_router.stats()
@@ -1,24 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
 from typing import Optional, List
-from app.db import models, database
+from app.db import models
 from app.db.model_extensions import RestaurantPhoto
 from app.auth.auth_dependency import get_current_user
+from app.db.session import get_db
 from app.models_api.restaurant import RestaurantUpdate, TableCreate, TableUpdate
+from app.utils.availability_index import availability_index
+from app.utils.time_slots import build_table_slots
+from app.utils.geo import zip_centroid
 
 router = APIRouter(
     prefix="/manager",
     tags=["RestaurantManager"]
 )
 
-# DB session dependency
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Update restaurant details
 @router.put("/restaurants/{restaurant_id}")
 def update_restaurant(
@@ -35,8 +31,16 @@ def update_restaurant(
         raise HTTPException(status_code=404, detail="Restaurant not found.")
     
     # Update fields
-    for field, value in restaurant_data.dict(exclude_unset=True).items():
+    updates = restaurant_data.dict(exclude_unset=True)
+    for field, value in updates.items():
         setattr(restaurant, field, value)
+
+    # Moving to a new zip code without explicit coordinates re-geocodes the restaurant
+    if "zip_code" in updates and "latitude" not in updates and "longitude" not in updates:
+        centroid = zip_centroid(restaurant.zip_code)
+        if not centroid:
+            raise HTTPException(status_code=422, detail="Unknown zip code; give the restaurant's latitude and longitude.")
+        restaurant.latitude, restaurant.longitude = centroid
     
     db.commit()
     db.refresh(restaurant)
@@ -61,12 +65,16 @@ def add_table(
     new_table = models.Table(
         restaurant_id=restaurant_id,
         size=table_data.size,
-        available_times=",".join(table_data.available_times)
+        available_times=",".join(table_data.available_times),
+        slots=build_table_slots(table_data.available_times)
     )
     
     db.add(new_table)
     db.commit()
     db.refresh(new_table)
+
+    # Table layout changed, reload it on the next availability lookup
+    availability_index.invalidate_restaurant(restaurant_id)
     
     return {"message": "Table added successfully", "table_id": new_table.id}
 
@@ -95,9 +103,12 @@ def update_table(
         table.size = table_data.size
     if table_data.available_times:
         table.available_times = ",".join(table_data.available_times)
+        table.slots = build_table_slots(table_data.available_times)
     
     db.commit()
     db.refresh(table)
+
+    availability_index.invalidate_restaurant(table.restaurant_id)
     
     return {"message": "Table updated successfully"}
 
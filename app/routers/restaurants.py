@@ -1,14 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional, List
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, time as dt_time
+import heapq
+import json
 import logging
-from app.db import models, database
-from app.auth.auth_dependency import get_current_user
+from app.db import models, database, fulltext, queries, spatial
+from app.db.database import begin_immediate, retry_on_lock
+from app.auth.auth_dependency import get_current_user, get_current_user_async
+from app.db.session import get_db, get_async_db, get_primary_db, read_as_of
+from app.db.shards import get_reservations_db, shard_router
 from app.db.models import User
-from app.models_api.restaurant import RestaurantCreate
-from app.models_api.reservation import ReservationCreate
-from app.utils.email_utils import send_booking_confirmation, BookingConfirmationDetails 
+from app.models_api.restaurant import RestaurantCreate, RestaurantSearchResult
+from app.models_api.reservation import ReservationCreate, HoldCreate, WaitlistCreate, BatchBookingCreate
+from app.utils.email_utils import BatchBookingDetails, BookingConfirmationDetails, reservation_details
+from app.utils import outbox
+from app.utils.outbox import outbox_worker
+from app.utils.availability_index import availability_index, find_conflict, occupies_slot
+from app.utils.time_slots import to_minute_of_day, format_slot, parse_slot
+from app.utils.geo import bounding_box, haversine_km, zip_centroid
+from app.utils import holds, idempotency, pagination, ranking, waitlist
+from app.utils.booking_counter import booking_counter
+from app.utils.holds import hold_sweeper
+from app.utils.search_cache import restaurant_cache, cache_key
+from app.utils.facets import facet_index
+from app.utils.suggest import suggest_index, DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS
+from app.utils.fuzzy import fuzzy_index, DEFAULT_MATCHES, MAX_MATCHES
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -19,17 +40,58 @@ router = APIRouter(
     tags=["Restaurants"]
 )
 
-# DB session dependency
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Largest radius accepted by the "near me" search
+MAX_SEARCH_RADIUS_KM = 100.0
+
+# Longest date range the availability calendar covers
+MAX_CALENDAR_DAYS = 90
+
+# Bookings that find the database write lock taken are retried this many times,
+# backing off exponentially from this delay (seconds)
+BOOKING_MAX_ATTEMPTS = 5
+BOOKING_RETRY_DELAY = 0.05
+
+# Largest number of tables one batch booking may reserve
+MAX_BATCH_BOOKINGS = 20
+
+SLOT_TAKEN_MESSAGE = "This table is already reserved within the selected time window. Please choose another time."
+
+# Search result fields and the restaurant columns each one needs
+SEARCH_FIELD_COLUMNS = {
+    "id": ("id",),
+    "name": ("name",),
+    "cuisine": ("cuisine",),
+    "cost_rating": ("cost_rating",),
+    "city": ("city",),
+    "state": ("state",),
+    "zip_code": ("zip_code",),
+    "rating": ("rating",),
+    "total_bookings": ("total_bookings",),
+    "latitude": ("latitude",),
+    "longitude": ("longitude",),
+    "distance_km": (),
+    "maps_url": ("name", "zip_code", "city", "state"),
+    "rank_score": ("rank_score",),
+    "reviews": (),
+}
+
+# Fields returned when `fields` is not given; reviews are only sent on request
+DEFAULT_SEARCH_FIELDS = [f for f in SEARCH_FIELD_COLUMNS if f != "reviews"]
+
+# Run `work` with a primary session in the threadpool, from an async endpoint whose
+# own session may be on a read replica
+def _on_primary(work):
+    def run():
+        db = database.SessionLocal()
+        try:
+            return work(db)
+        finally:
+            db.close()
+    return run_in_threadpool(run)
 
 # Debug endpoint to test database
 @router.get("/debug/test-db")
-def test_database(db: Session = Depends(get_db)):
+def test_database(db: Session = Depends(get_primary_db)):
     """Test database connection and show recent reservations"""
     try:
         # Test reading from the reservations table
@@ -72,9 +134,28 @@ def test_database(db: Session = Depends(get_db)):
             "traceback": traceback.format_exc()
         }
 
+# Response cache hit/miss counters
+@router.get("/debug/cache-stats")
+def get_cache_stats():
+    return restaurant_cache.stats()
+
+def maps_url(r) -> str:
+    return f"https://www.google.com/maps/search/?api=1&query={'+'.join(r.name.split())}+{r.zip_code}+{'+'.join(r.city.split())}+{r.state}"
+
+# Parse a comma separated `fields` parameter into known search result fields
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields or not fields.strip():
+        return DEFAULT_SEARCH_FIELDS
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in SEARCH_FIELD_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return [f for f in SEARCH_FIELD_COLUMNS if f in requested]
+
 #  Search restaurants - UPDATED to fix issues
-@router.get("/search", response_model=List[dict])
-def search_restaurants(
+@router.get("/search", response_model=List[RestaurantSearchResult], response_model_exclude_unset=True)
+async def search_restaurants(
+    response: Response,
     date: Optional[str] = None,
     time: Optional[str] = None,
     people: Optional[int] = None,
@@ -82,48 +163,212 @@ def search_restaurants(
     state: Optional[str] = None,
     zip_code: Optional[str] = None,
     cuisine: Optional[str] = None,
-    db: Session = Depends(get_db)
+    q: Optional[str] = None,
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    radius_km: float = 10.0,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    sort: Optional[str] = None,
+    fuzzy: bool = False,
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Debug logging
-    print(f"Search params: date={date}, time={time}, people={people}, city={city}, state={state}, zip_code={zip_code}")
+    logger.debug(f"Search params: q={q}, date={date}, time={time}, people={people}, city={city}, state={state}, zip_code={zip_code}, lat={lat}, lng={lng}, radius_km={radius_km}")
+
+    near_me = lat is not None or lng is not None
+    if near_me and (lat is None or lng is None):
+        raise HTTPException(status_code=400, detail="lat and lng must be provided together.")
+    if near_me and not 0 < radius_km <= MAX_SEARCH_RADIUS_KM:
+        raise HTTPException(status_code=400, detail=f"radius_km must be between 0 and {MAX_SEARCH_RADIUS_KM}.")
     
-    query = db.query(models.Restaurant)
+    if sort not in (None, "rank"):
+        raise HTTPException(status_code=400, detail="sort must be 'rank' when given.")
+    by_score = sort == "rank"
+
+    fields = parse_fields(fields)
 
-    # Apply filters only if they are provided and not empty
-    if city and city.strip():
-        query = query.filter(models.Restaurant.city.ilike(f"%{city}%"))
-    if state and state.strip():
-        query = query.filter(models.Restaurant.state.ilike(f"%{state}%"))
+    # Typo tolerance: when the text filters match nothing, swap them for their closest known terms
+    if fuzzy:
+        expression = fulltext.match_expression(q, city=city, state=state, cuisine=cuisine)
+        if expression and not (await db.execute(select(fulltext.matching_restaurants(expression)))).first():
+            original = {"q": q, "city": city, "cuisine": cuisine}
+            # The fuzzy index takes a sync primary session when it needs rebuilding
+            corrected = await _on_primary(lambda session: {
+                "q": fuzzy_index.correct(session, q),
+                "city": fuzzy_index.correct(session, city, "city"),
+                "cuisine": fuzzy_index.correct(session, cuisine, "cuisine")
+            })
+            changed = [f"{name}={corrected[name]}" for name in original if corrected[name] != original[name]]
+            if changed:
+                response.headers["X-Corrected-Query"] = "&".join(changed)
+                q, city, cuisine = corrected["q"], corrected["city"], corrected["cuisine"]
+
+    # Serve repeated searches from the response cache; date/time/people do not affect results
+    key = cache_key(
+        "search", q=q, city=city, state=state, zip_code=zip_code, cuisine=cuisine,
+        lat=lat, lng=lng, radius_km=radius_km if near_me else None, limit=limit, cursor=cursor,
+        fields=",".join(fields), sort=sort
+    )
+    cached = restaurant_cache.get(key)
+    if cached is not None:
+        results, next_cursor = cached
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return results
+    generation = restaurant_cache.generation()
+
+    # Select only the columns the requested fields need (id and coordinates drive paging)
+    columns = {"id"} | {c for f in fields for c in SEARCH_FIELD_COLUMNS[f]}
+    if near_me:
+        columns |= {"latitude", "longitude"}
+    if by_score:
+        columns.add("rank_score")
+    query = select(*[getattr(models.Restaurant, c) for c in sorted(columns)])
+
+    # Free text and city/state/cuisine filters are matched through the FTS5 index,
+    # best matches first; empty filters are ignored
+    expression = fulltext.match_expression(q, city=city, state=state, cuisine=cuisine)
+    if expression:
+        matches = fulltext.matching_restaurants(expression)
+        query = query.join(matches, matches.c.rowid == models.Restaurant.id).add_columns(matches.c.rank)
     if zip_code and zip_code.strip():
         query = query.filter(models.Restaurant.zip_code == zip_code)
-    if cuisine and cuisine.strip():
-        query = query.filter(models.Restaurant.cuisine.ilike(f"%{cuisine}%"))
 
-    restaurants = query.all()
-    
+    # "Near me" mode: R*Tree bounding-box prefilter in SQL, then exact distances
+    if near_me:
+        box = spatial.restaurants_in_box(*bounding_box(lat, lng, radius_km))
+        query = query.join(box, box.c.id == models.Restaurant.id)
+
+    # Keyset pagination over a stable (sort value, id) key
+    if by_score:
+        mode = "score_near" if near_me else "score"
+    else:
+        mode = "distance" if near_me else "rank" if expression else "id"
+    try:
+        after = pagination.decode_cursor(cursor, mode) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {str(e)}")
+
+    if mode == "distance":
+        # The radius bounds the candidate set, so sort and page it in memory
+        rows = []
+        for r in (await db.execute(query)).all():
+            distance = haversine_km(lat, lng, r.latitude, r.longitude)
+            if distance <= radius_km and (after is None or [distance, r.id] > after):
+                rows.append(([distance, r.id], r))
+        rows.sort(key=lambda row: row[0])
+        rows = rows[:limit + 1]
+    elif mode == "score_near":
+        # Best scores within the radius: heap top-K over the candidates, no full sort
+        candidates = []
+        for r in (await db.execute(query)).all():
+            distance = haversine_km(lat, lng, r.latitude, r.longitude)
+            if distance <= radius_km and (after is None or [-r.rank_score, r.id] > after):
+                candidates.append(([-r.rank_score, r.id], r, distance))
+        rows = [
+            ([distance, r.id], r, key)
+            for key, r, distance in heapq.nsmallest(limit + 1, candidates, key=lambda row: row[0])
+        ]
+    elif mode == "score":
+        # Best scores first straight off the (rank_score, id) index, walked backwards
+        if after:
+            query = query.filter(or_(
+                models.Restaurant.rank_score < after[0],
+                and_(models.Restaurant.rank_score == after[0], models.Restaurant.id < after[1])
+            ))
+        query = query.order_by(models.Restaurant.rank_score.desc(), models.Restaurant.id.desc()).limit(limit + 1)
+        rows = [([r.rank_score, r.id], r) for r in await db.execute(query)]
+    elif mode == "rank":
+        if after:
+            query = query.filter(or_(
+                matches.c.rank > after[0],
+                and_(matches.c.rank == after[0], models.Restaurant.id > after[1])
+            ))
+        query = query.order_by(matches.c.rank, models.Restaurant.id).limit(limit + 1)
+        rows = [([r.rank, r.id], r) for r in await db.execute(query)]
+    else:
+        if after:
+            query = query.filter(models.Restaurant.id > after[0])
+        query = query.order_by(models.Restaurant.id).limit(limit + 1)
+        rows = [([r.id], r) for r in await db.execute(query)]
+
+    page = rows[:limit]
+    if mode == "score_near":
+        # Rows carry the distance for display and the score key for paging
+        next_cursor = pagination.encode_cursor(mode, page[-1][2]) if len(rows) > limit else None
+        page = [(sort_key, r) for sort_key, r, _ in page]
+    else:
+        next_cursor = pagination.encode_cursor(mode, page[-1][0]) if len(rows) > limit else None
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
     # Debug logging
-    print(f"Found {len(restaurants)} restaurants")
-    
-    # Return empty list instead of raising 404 error
-    if not restaurants:
-        return []
+    logger.debug(f"Returning {len(page)} restaurants")
 
-    return [
-        {
-            "id": r.id,  # Include the restaurant ID
-            "name": r.name,
-            "cuisine": r.cuisine,
-            "cost_rating": r.cost_rating,
-            "city": r.city,
-            "state": r.state,
-            "zip_code": r.zip_code,  # Include zip_code
-            "rating": r.rating,
-            "total_bookings": r.total_bookings,
-            "reviews": r.reviews,
-            "maps_url": f"https://www.google.com/maps/search/?api=1&query={'+'.join(r.name.split())}+{r.zip_code}+{'+'.join(r.city.split())}+{r.state}"
-        }
-        for r in restaurants
-    ]
+    # Reviews only when asked for, loaded for the whole page in one query
+    reviews_by_restaurant = {}
+    if "reviews" in fields and page:
+        reviews = (await db.execute(select(
+            models.Review.id, models.Review.restaurant_id, models.Review.user_id,
+            models.Review.rating, models.Review.comment
+        ).where(models.Review.restaurant_id.in_([r.id for _, r in page])))).all()
+        for review in reviews:
+            reviews_by_restaurant.setdefault(review.restaurant_id, []).append({
+                "id": review.id,
+                "user_id": review.user_id,
+                "rating": review.rating,
+                "comment": review.comment
+            })
+
+    results = []
+    for sort_key, r in page:
+        result = {}
+        for field in fields:
+            if field == "distance_km":
+                result[field] = round(sort_key[0], 2) if near_me else None
+            elif field == "maps_url":
+                result[field] = maps_url(r)
+            elif field == "reviews":
+                result[field] = reviews_by_restaurant.get(r.id, [])
+            else:
+                result[field] = getattr(r, field)
+        results.append(result)
+
+    restaurant_cache.put(key, (results, next_cursor), [r.id for _, r in page], True, generation, read_as_of(db))
+    return results
+
+# Facet counts for the search filters, conditioned on the filters already applied
+@router.get("/facets")
+def get_facets(
+    cuisine: Optional[str] = None,
+    city: Optional[str] = None,
+    cost_rating: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    return facet_index.counts(db, {"cuisine": cuisine, "city": city, "cost_rating": cost_rating})
+
+# Typeahead completions for the search box, answered from memory
+@router.get("/suggest")
+def suggest(
+    prefix: str,
+    limit: int = DEFAULT_SUGGESTIONS,
+    db: Session = Depends(get_db)
+):
+    return suggest_index.suggest(db, prefix, max(1, min(limit, MAX_SUGGESTIONS)))
+
+# Typo-tolerant near matches over restaurant names, cities and cuisines
+@router.get("/fuzzy")
+def fuzzy_match(
+    q: str,
+    type: Optional[str] = None,
+    limit: int = DEFAULT_MATCHES,
+    db: Session = Depends(get_db)
+):
+    if type not in (None, "city", "cuisine", "name"):
+        raise HTTPException(status_code=400, detail="type must be one of city, cuisine or name.")
+    return fuzzy_index.match(db, q, type, max(1, min(limit, MAX_MATCHES)))
 
 # ➕ Add new restaurant
 @router.post("/add")
@@ -145,6 +390,17 @@ def add_restaurant(
         rating=restaurant.rating,
         total_bookings=0
     )
+    ranking.update_rank(new_restaurant)
+
+    # Fall back to the zip code centroid when no coordinates are given; a restaurant
+    # without coordinates would never show up in "near me" searches
+    if restaurant.latitude is not None and restaurant.longitude is not None:
+        new_restaurant.latitude, new_restaurant.longitude = restaurant.latitude, restaurant.longitude
+    else:
+        centroid = zip_centroid(restaurant.zip_code)
+        if not centroid:
+            raise HTTPException(status_code=422, detail="Unknown zip code; give the restaurant's latitude and longitude.")
+        new_restaurant.latitude, new_restaurant.longitude = centroid
 
     db.add(new_restaurant)
     db.commit()
@@ -169,65 +425,114 @@ def search_availability(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date/time format")
 
-    start_time = (datetime.combine(date_obj, target_time) - timedelta(minutes=30)).time()
-    end_time = (datetime.combine(date_obj, target_time) + timedelta(minutes=30)).time()
+    # Search window of +/- 30 minutes around the requested time, clamped to the same day
+    target_minute = to_minute_of_day(target_time)
+    start_minute = max(target_minute - 30, 0)
+    end_minute = min(target_minute + 30, 24 * 60 - 1)
 
-    restaurant_query = db.query(models.Restaurant)
-    if city:
-        restaurant_query = restaurant_query.filter(models.Restaurant.city.ilike(f"%{city}%"))
-    if state:
-        restaurant_query = restaurant_query.filter(models.Restaurant.state.ilike(f"%{state}%"))
-    if zip_code:
-        restaurant_query = restaurant_query.filter(models.Restaurant.zip_code == zip_code)
+    # Review aggregates come from correlated per-restaurant lookups
+    rows = queries.available_restaurants(db, city=city, state=state, zip_code=zip_code).all()
+    restaurant_ids = [row[0].id for row in rows]
+
+    # Booking counts for the date, of the matching restaurants only, per reservation shard
+    booking_counts = {}
+    for counts in shard_router.gather_restaurants(db, restaurant_ids, lambda rdb, ids: queries.booking_counts(
+        rdb, date_obj, date_obj, ids
+    ).all()):
+        booking_counts.update(counts)
+
+    # Open, unreserved slots come from the in-memory availability index
+    open_slots = availability_index.find_open_slots(
+        db, restaurant_ids, date_obj, start_minute, end_minute, people
+    )
 
     matching_restaurants = []
 
-    for restaurant in restaurant_query.all():
-        bookings_count = db.query(models.Reservation).filter(
-        models.Reservation.restaurant_id == restaurant.id,
-        models.Reservation.date == date
-        ).count()
-        reviews = db.query(models.Review).filter(models.Review.restaurant_id == restaurant.id).all()
-
-        for table in restaurant.tables:
-            if table.size >= people:
-                available_times = [t.strip() for t in table.available_times.split(",")]
-                for t in available_times:
-                    try:
-                        t_obj = datetime.strptime(t, "%H:%M").time()
-                        if start_time <= t_obj <= end_time:
-                            matching_restaurants.append({
-                                "restaurant_id": restaurant.id,
-                                "reviews": reviews,
-                                "restaurant_name": restaurant.name,
-                                "table_id": table.id,
-                                "available_time": t,
-                                "city": restaurant.city,
-                                "cuisine": restaurant.cuisine,
-                                "cost_rating": restaurant.cost_rating,
-                                "rating": restaurant.rating,
-                                "total_bookings": bookings_count
-                            })
-                            break
-                    except ValueError:
-                        continue
+    for restaurant, review_count, average_review in rows:
+        for table_id, minute in open_slots.get(restaurant.id, []):
+            matching_restaurants.append({
+                "restaurant_id": restaurant.id,
+                "restaurant_name": restaurant.name,
+                "table_id": table_id,
+                "available_time": format_slot(minute),
+                "city": restaurant.city,
+                "cuisine": restaurant.cuisine,
+                "cost_rating": restaurant.cost_rating,
+                "rating": restaurant.rating,
+                "review_count": review_count,
+                "average_review": round(average_review, 1) if average_review is not None else None,
+                "total_bookings": booking_counts.get(restaurant.id, 0)
+            })
 
     if not matching_restaurants:
         raise HTTPException(status_code=404, detail="No available restaurants found.")
 
     return matching_restaurants
 
+# Availability calendar: which days in a range have a table for the party, in one pass
+@router.get("/availability/calendar")
+def availability_calendar(
+    people: int,
+    start_date: str,
+    days: int = 30,
+    restaurant_id: Optional[int] = None,
+    city: Optional[str] = None,
+    state: Optional[str] = None,
+    zip_code: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    if not 1 <= days <= MAX_CALENDAR_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {MAX_CALENDAR_DAYS}.")
+    if people < 1:
+        raise HTTPException(status_code=400, detail="people must be at least 1.")
+
+    # One restaurant, or the set matching the same filters as /availability
+    restaurants = queries.calendar_restaurants(
+        db, restaurant_id=restaurant_id, city=city, state=state, zip_code=zip_code
+    ).all()
+    if restaurant_id is not None and not restaurants:
+        raise HTTPException(status_code=404, detail="Restaurant not found.")
+
+    dates = [start + timedelta(days=i) for i in range(days)]
+    calendar = availability_index.calendar(db, [r.id for r in restaurants], dates, people)
+
+    results = []
+    for r in restaurants:
+        open_days, earliest = calendar[r.id]
+        results.append({
+            "restaurant_id": r.id,
+            "restaurant_name": r.name,
+            "start_date": str(start),
+            "days": days,
+            # One character per day starting at start_date: "1" = a table is free
+            "bitmap": "".join("1" if is_open else "0" for is_open in open_days),
+            "next_available": {
+                "date": str(earliest[0]),
+                "time": format_slot(earliest[2]),
+                "table_id": earliest[1]
+            } if earliest else None
+        })
+
+    return results
+
 # View reviews
 @router.get("/{restaurant_id}/reviews")
-def get_reviews(
+async def get_reviews(
     restaurant_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    restaurant = db.query(models.Restaurant).filter(models.Restaurant.id == restaurant_id).first()
+    restaurant = (await db.execute(
+        select(models.Restaurant.id).where(models.Restaurant.id == restaurant_id)
+    )).first()
     if not restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found.")
 
-    reviews = db.query(models.Review).filter(models.Review.restaurant_id == restaurant_id).all()
+    # Reviewers are loaded up front; async sessions cannot lazy load
+    reviews = (await db.execute(queries.restaurant_reviews(restaurant_id))).scalars().all()
 
     return [
         {
@@ -235,22 +540,31 @@ def get_reviews(
             "user_name": r.user.full_name,
             "rating": r.rating,
             "comment": r.comment,
-            "date": r.created_at.strftime("%Y-%m-%d") if hasattr(r, 'created_at') else None
+            "date": r.created_at.strftime("%Y-%m-%d") if r.created_at else None
         }
         for r in reviews
     ]
 
 #  View current user's reservations
 @router.get("/my-reservations")
-def get_my_reservations(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_my_reservations(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
-    reservations = db.query(models.Reservation).filter(models.Reservation.user_id == current_user.id).all()
+    # Gathered from every reservation shard, then named with one restaurant lookup
+    async def mine(rdb):
+        return (await rdb.execute(queries.user_reservations(current_user.id))).all()
+    reservations = sorted(
+        (r for rows in await shard_router.gather_async(db, mine) for r in rows), key=lambda r: r.id
+    )
+    names = dict((await db.execute(
+        select(models.Restaurant.id, models.Restaurant.name)
+        .where(models.Restaurant.id.in_({r.restaurant_id for r in reservations}))
+    )).all()) if reservations else {}
     return [
         {
             "reservation_id": r.id,
-            "restaurant": r.restaurant.name,
+            "restaurant": names.get(r.restaurant_id),
             "date": r.date,
             "time": r.time.strftime("%H:%M"),
             "table_id": r.table_id,
@@ -258,46 +572,60 @@ def get_my_reservations(
         } for r in reservations
     ]
 
+#  View current user's waitlist entries
+@router.get("/my-waitlist")
+def get_my_waitlist(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    entries = sorted((e for rows in shard_router.gather(db, lambda rdb: rdb.query(models.WaitlistEntry).filter(
+        models.WaitlistEntry.user_id == current_user.id,
+        models.WaitlistEntry.status.in_(("waiting", "promoted"))
+    ).all()) for e in rows), key=lambda e: (e.date, e.start_minute))
+    names = dict(db.query(models.Restaurant.id, models.Restaurant.name).filter(
+        models.Restaurant.id.in_({e.restaurant_id for e in entries})
+    ).all()) if entries else {}
+    return [
+        {
+            "waitlist_id": e.id,
+            "restaurant": names.get(e.restaurant_id),
+            "date": e.date,
+            "earliest": format_slot(e.start_minute),
+            "latest": format_slot(e.end_minute),
+            "number_of_people": e.party_size,
+            "status": e.status,
+            "reservation_id": e.reservation_id
+        } for e in entries
+    ]
+
 # Send confirmation email endpoint
 @router.post("/api/send-confirmation-email")
-async def email_confirmation(
-    background_tasks: BackgroundTasks,
+def email_confirmation(
     reservation_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Send booking confirmation email to user."""
     
-    # Verify the reservation exists and belongs to the user
-    reservation = db.query(models.Reservation).filter(
-        models.Reservation.id == reservation_id,
-        models.Reservation.user_id == current_user.id
-    ).join(models.Restaurant).first()
-    
-    if not reservation:
-        raise HTTPException(status_code=404, detail="Reservation not found or doesn't belong to you")
-    
-    # Get restaurant details
-    restaurant = reservation.restaurant
-    
-    # Create booking details object
-    booking_details = BookingConfirmationDetails(
-        id=str(reservation.id),
-        restaurant_name=restaurant.name,
-        date=reservation.date.strftime("%A, %B %d, %Y"),
-        time=reservation.time.strftime("%H:%M"),
-        people=reservation.number_of_people,
-        table_type=f"Table #{reservation.table_id}" if reservation.table_id else "Standard",
-        address=f"{restaurant.city}, {restaurant.state} {restaurant.zip_code}",
-        contact=restaurant.contact if hasattr(restaurant, 'contact') else None
-    )
-    
-    # Send email in the background
-    background_tasks.add_task(
-        send_booking_confirmation, 
-        current_user.email, 
-        booking_details
-    )
+    with shard_router.session_holding(db, models.Reservation, reservation_id) as rdb:
+        # Verify the reservation exists and belongs to the user
+        reservation = rdb.query(models.Reservation).filter(
+            models.Reservation.id == reservation_id,
+            models.Reservation.user_id == current_user.id,
+            models.Reservation.status == "confirmed"
+        ).first()
+        restaurant = db.get(models.Restaurant, reservation.restaurant_id) if reservation else None
+
+        if not restaurant:
+            raise HTTPException(status_code=404, detail="Reservation not found or doesn't belong to you")
+
+        # Create booking details object
+        booking_details = reservation_details(reservation, restaurant)
+
+        # Queue the email for the outbox worker, on the reservation's database
+        outbox.enqueue(rdb, "booking_confirmation", current_user.email, booking_details.dict())
+        rdb.commit()
+    outbox_worker.wake()
     
     return {"message": "Confirmation email will be sent shortly"}
 
@@ -305,44 +633,168 @@ async def email_confirmation(
 @router.get("/{restaurant_id}/bookings/today")
 def get_today_bookings_count(
     restaurant_id: int,
-    db: Session = Depends(get_db)
+    rdb: Session = Depends(get_reservations_db)
 ):
     # Get today's date
     today = datetime.now().date()
     
     # Query the database for bookings made today for this restaurant
-    bookings_count = db.query(models.Reservation).filter(
-        models.Reservation.restaurant_id == restaurant_id,
-        models.Reservation.date == today
-    ).count()
+    bookings_count = queries.bookings_on(rdb, restaurant_id, today).count()
     
     return {"count": bookings_count}
 
+#  Hold a table slot for a few minutes while the customer completes checkout
+@router.post("/{restaurant_id}/holds")
+def hold_slot(
+    restaurant_id: int,
+    hold: HoldCreate,
+    db: Session = Depends(get_db),
+    rdb: Session = Depends(get_reservations_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "Customer":
+        raise HTTPException(status_code=403, detail="Only customers can hold tables.")
+
+    minutes = hold.minutes or holds.HOLD_MINUTES
+    if not 1 <= minutes <= holds.MAX_HOLD_MINUTES:
+        raise HTTPException(status_code=400, detail=f"minutes must be between 1 and {holds.MAX_HOLD_MINUTES}.")
+
+    table = db.query(models.Table).filter(
+        models.Table.id == hold.table_id,
+        models.Table.restaurant_id == restaurant_id
+    ).first()
+    if not table:
+        raise HTTPException(status_code=404, detail="Table not found for this restaurant.")
+
+    minute = parse_slot(hold.time)
+    if minute is None:
+        raise HTTPException(status_code=400, detail=f"Invalid time format: {hold.time}")
+    slot = queries.table_slot(db, table.id, minute).first()
+    if not slot:
+        raise HTTPException(status_code=400, detail="Selected time not available for this table.")
+
+    start_time = datetime.combine(hold.date, dt_time(minute // 60, minute % 60))
+
+    # Limit check, conflict check and insert run under the write lock, like a booking
+    # (with sharded reservations the lock is the restaurant's shard's, so the limit
+    # is only enforced loosely against concurrent holds on other shards)
+    def place_hold():
+        begin_immediate(rdb)
+        now = datetime.now()
+
+        live_holds = sum(shard_router.gather(rdb, lambda shard_db: shard_db.query(func.count(models.Reservation.id)).filter(
+            models.Reservation.user_id == current_user.id,
+            models.Reservation.status == "held",
+            models.Reservation.hold_expires_at > now
+        ).scalar()))
+        if live_holds >= holds.MAX_HOLDS_PER_USER:
+            rdb.rollback()
+            raise HTTPException(status_code=429, detail=f"You can hold at most {holds.MAX_HOLDS_PER_USER} tables at a time.")
+
+        if find_conflict(rdb, table.id, start_time):
+            rdb.rollback()
+            raise HTTPException(status_code=409, detail=SLOT_TAKEN_MESSAGE)
+
+        holds.release_expired_hold(rdb, restaurant_id, table.id, hold.date, start_time.time(), now)
+        new_hold = models.Reservation(
+            user_id=current_user.id,
+            restaurant_id=restaurant_id,
+            table_id=table.id,
+            date=hold.date,
+            time=start_time.time(),
+            number_of_people=hold.number_of_people,
+            status="held",
+            hold_expires_at=now + timedelta(minutes=minutes)
+        )
+        rdb.add(new_hold)
+        rdb.flush()
+        placed = (new_hold.id, new_hold.hold_expires_at)
+        rdb.commit()
+        return placed
+
+    try:
+        hold_id, expires_at = retry_on_lock(rdb, place_hold, BOOKING_MAX_ATTEMPTS, BOOKING_RETRY_DELAY)
+    except IntegrityError:
+        rdb.rollback()
+        raise HTTPException(status_code=409, detail=SLOT_TAKEN_MESSAGE)
+    except OperationalError:
+        raise HTTPException(status_code=503, detail="Booking is busy, please try again.")
+
+    # The slot is taken until the hold is confirmed, released or expires
+    availability_index.record_booking(restaurant_id, table.id, hold.date, minute)
+    hold_sweeper.schedule(expires_at, hold_id, restaurant_id, table.id, hold.date, minute)
+
+    return {"hold_id": hold_id, "expires_at": expires_at.isoformat(timespec="seconds")}
+
+#  Release a hold before it expires
+@router.delete("/holds/{hold_id}")
+def release_hold(
+    hold_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    with shard_router.session_holding(db, models.Reservation, hold_id) as rdb:
+        hold = rdb.query(models.Reservation).filter(
+            models.Reservation.id == hold_id,
+            models.Reservation.status == "held"
+        ).first()
+        if not hold:
+            raise HTTPException(status_code=404, detail="Hold not found.")
+        if hold.user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="You can only release your own holds.")
+
+        slot = (hold.restaurant_id, hold.table_id, hold.date, to_minute_of_day(hold.time))
+        rdb.delete(hold)
+        rdb.commit()
+
+    availability_index.release_booking(*slot)
+
+    return {"message": "Hold released."}
+
 #  Book table + prevent overlaps + send email - COMPLETELY REWRITTEN FOR DEBUGGING
 @router.post("/{restaurant_id}/book")
 def book_table(
     restaurant_id: int,
     reservation: ReservationCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    rdb: Session = Depends(get_reservations_db),
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
 ):
-    print("\n==== BOOKING REQUEST ====")
-    print(f"User: {current_user.id} - {current_user.email}")
-    print(f"Restaurant: {restaurant_id}")
-    print(f"Table: {reservation.table_id}")
-    print(f"Date: {reservation.date} (type: {type(reservation.date).__name__})")
-    print(f"Time: {reservation.time} (type: {type(reservation.time).__name__})")
-    print(f"People: {reservation.number_of_people}")
+    logger.debug("==== BOOKING REQUEST ====")
+    logger.debug(f"User: {current_user.id} - {current_user.email}")
+    logger.debug(f"Restaurant: {restaurant_id}")
+    logger.debug(f"Table: {reservation.table_id}")
+    logger.debug(f"Date: {reservation.date} (type: {type(reservation.date).__name__})")
+    logger.debug(f"Time: {reservation.time} (type: {type(reservation.time).__name__})")
+    logger.debug(f"People: {reservation.number_of_people}")
     
+    claimed = False
     try:
         if current_user.role != "Customer":
-            print(f"User role is {current_user.role}, not Customer")
+            logger.debug(f"User role is {current_user.role}, not Customer")
             raise HTTPException(status_code=403, detail="Only customers can book tables.")
 
+        # A retried booking gets the stored response back. Keys are per user on the main
+        # database: with shards the key is claimed there first, so it cannot be reused
+        # against a restaurant on another shard, and the response is also stored with
+        # the reservation on its shard
+        idempotency_scope = f"book:{current_user.id}"
+        if idempotency_key:
+            idempotency.check_key(idempotency_key)
+            req_hash = idempotency.request_hash({"restaurant_id": restaurant_id, **reservation.dict()})
+            if shard_router.shards:
+                replay = idempotency.claim(db, idempotency_scope, idempotency_key, req_hash)
+                claimed = replay is None
+            else:
+                replay = idempotency.lookup(rdb, idempotency_scope, idempotency_key, req_hash)
+            if replay:
+                return replay
+
         # Check if restaurant exists
         restaurant = db.query(models.Restaurant).filter(models.Restaurant.id == restaurant_id).first()
         if not restaurant:
-            print(f"Restaurant with ID {restaurant_id} not found")
+            logger.debug(f"Restaurant with ID {restaurant_id} not found")
             raise HTTPException(status_code=404, detail="Restaurant not found.")
 
         # Check if table exists and belongs to the restaurant
@@ -351,7 +803,7 @@ def book_table(
             models.Table.restaurant_id == restaurant_id
         ).first()
         if not table:
-            print(f"Table with ID {reservation.table_id} not found for restaurant {restaurant_id}")
+            logger.debug(f"Table with ID {reservation.table_id} not found for restaurant {restaurant_id}")
             raise HTTPException(status_code=404, detail="Table not found for this restaurant.")
 
         # Convert time to proper format if it's a string
@@ -360,14 +812,14 @@ def book_table(
             try:
                 # Try parsing in HH:MM format
                 hour, minute = map(int, reservation.time.split(':'))
-                reservation_time = datetime.time(hour, minute)
-                print(f"Successfully parsed time string to time object: {reservation_time}")
+                reservation_time = dt_time(hour, minute)
+                logger.debug(f"Successfully parsed time string to time object: {reservation_time}")
             except ValueError as e:
-                print(f"Error parsing time: {str(e)}")
+                logger.debug(f"Error parsing time: {str(e)}")
                 # Try other common formats
                 try:
                     reservation_time = datetime.strptime(reservation.time, "%H:%M:%S").time()
-                    print(f"Successfully parsed time using H:M:S format: {reservation_time}")
+                    logger.debug(f"Successfully parsed time using H:M:S format: {reservation_time}")
                 except ValueError:
                     try:
                         # Try AM/PM format - FIX: Use the imported datetime module
@@ -379,32 +831,32 @@ def book_table(
                                 hour += 12
                             elif period.upper() == 'AM' and hour == 12:
                                 hour = 0
-                            reservation_time = datetime.time(hour, minute)
-                            print(f"Successfully parsed AM/PM time: {reservation_time}")
+                            reservation_time = dt_time(hour, minute)
+                            logger.debug(f"Successfully parsed AM/PM time: {reservation_time}")
                         else:
                             raise ValueError("Could not parse time format")
                     except Exception:
-                        print(f"Could not parse time in any format: {reservation.time}")
+                        logger.debug(f"Could not parse time in any format: {reservation.time}")
                         raise HTTPException(status_code=400, detail=f"Invalid time format: {reservation.time}")
         else:
             reservation_time = reservation.time
 
-        # Check if selected time is in table's available_times
-        available_times = [t.strip() for t in table.available_times.split(",")]
-        reservation_time_str = reservation_time.strftime("%H:%M") if hasattr(reservation_time, "strftime") else reservation_time
-        print(f"Checking availability for time {reservation_time_str} in available times: {available_times}")
-        
-        if reservation_time_str not in available_times:
-            print(f"Time {reservation_time_str} not available for table {table.id}")
+        # Check if selected time is one of the table's slots
+        reservation_time_str = reservation_time.strftime("%H:%M")
+        logger.debug(f"Checking slot {reservation_time_str} for table {table.id}")
+        slot = queries.table_slot(db, table.id, to_minute_of_day(reservation_time)).first()
+
+        if not slot:
+            logger.debug(f"Time {reservation_time_str} not available for table {table.id}")
             raise HTTPException(status_code=400, detail="Selected time not available for this table.")
 
         #  Prevent overlapping reservations (1 hour block)
         if isinstance(reservation.date, str):
             try:
                 reservation_date = datetime.strptime(reservation.date, "%Y-%m-%d").date()
-                print(f"Parsed date string to date object: {reservation_date}")
+                logger.debug(f"Parsed date string to date object: {reservation_date}")
             except ValueError:
-                print(f"Invalid date format: {reservation.date}")
+                logger.debug(f"Invalid date format: {reservation.date}")
                 raise HTTPException(status_code=400, detail=f"Invalid date format: {reservation.date}")
         else:
             reservation_date = reservation.date
@@ -412,102 +864,288 @@ def book_table(
         start_time = datetime.combine(reservation_date, reservation_time)
         end_time = start_time + timedelta(hours=1)
 
-        print(f"Checking for conflicts between {start_time.time()} and {end_time.time()}")
-        conflict = db.query(models.Reservation).filter(
-            models.Reservation.table_id == reservation.table_id,
-            models.Reservation.date == reservation_date,
-            models.Reservation.time.between(
-                start_time.time(),
-                (end_time - timedelta(minutes=1)).time()
-            )
-        ).first()
+        # Details for the confirmation, captured now since committing expires loaded objects
+        restaurant_info = {
+            "name": restaurant.name,
+            "address": f"{restaurant.city}, {restaurant.state} {restaurant.zip_code}",
+            "contact": restaurant.contact if hasattr(restaurant, 'contact') else None
+        }
 
-        if conflict:
-            print(f"Reservation conflict detected for table {table.id} at {reservation_time_str}")
-            raise HTTPException(
-                status_code=400,
-                detail="This table is already reserved within the selected time window. Please choose another time."
-            )
+        # Conflict check and insert run in one write transaction (BEGIN IMMEDIATE), so two
+        # requests for overlapping slots cannot both pass the check; attempts that find
+        # the write lock taken are retried with backoff. Returns (response, booked).
+        def place_booking():
+            begin_immediate(rdb)
 
-        # All good – proceed with booking
-        try:
-            new_reservation = models.Reservation(
-                user_id=current_user.id,
-                restaurant_id=restaurant_id,
-                table_id=reservation.table_id,
-                date=reservation_date,
-                time=start_time.time(),  # Use the properly formatted time
-                number_of_people=reservation.number_of_people
-            )
-            
-            print(f"Creating new reservation: {vars(new_reservation)}")
-            
-            # Add the reservation to the session
-            db.add(new_reservation)
-            print("Added to session")
-            
-            # Explicitly flush to detect any database errors before commit
-            db.flush()
-            print("Flush successful")
-            
-            # Commit the transaction to persist the reservation
-            db.commit()
-            print("Commit successful")
-            
-            # Refresh to get the ID
-            db.refresh(new_reservation)
-            print(f"New reservation created with ID: {new_reservation.id}")
-            
-            # Verify the reservation is now in the database
-            check_reservation = db.query(models.Reservation).get(new_reservation.id)
-            print(f"Verified reservation in DB: {check_reservation is not None}")
-            
-            # Increment the total_bookings count for the restaurant
-            restaurant.total_bookings += 1
-            db.commit()
-            print("Restaurant total_bookings incremented")
+            # Re-check under the write lock: a concurrent retry may have just booked
+            if idempotency_key:
+                replay = idempotency.lookup(rdb, idempotency_scope, idempotency_key, req_hash)
+                if replay:
+                    rdb.rollback()
+                    return replay, False
 
-            # Send confirmation email with new structure
-            try:
-                booking_details = BookingConfirmationDetails(
-                    id=str(new_reservation.id),
-                    restaurant_name=restaurant.name,
-                    date=reservation_date.strftime("%A, %B %d, %Y"),
-                    time=reservation_time_str,
-                    people=reservation.number_of_people,
-                    table_type=f"Table #{reservation.table_id}",
-                    address=f"{restaurant.city}, {restaurant.state} {restaurant.zip_code}",
-                    contact=restaurant.contact if hasattr(restaurant, 'contact') else None
-                )
-                
-                # Send confirmation email
-                send_booking_confirmation(
-                    to_email=current_user.email,
-                    booking_details=booking_details
+            # The customer's own live hold on this exact slot is confirmed in place
+            now = datetime.now()
+            held = None
+            if reservation.hold_id is not None:
+                held = rdb.query(models.Reservation).filter(
+                    models.Reservation.id == reservation.hold_id,
+                    models.Reservation.user_id == current_user.id,
+                    models.Reservation.status == "held",
+                    models.Reservation.table_id == reservation.table_id,
+                    models.Reservation.date == reservation_date,
+                    models.Reservation.time == start_time.time()
+                ).first()
+                if not held:
+                    rdb.rollback()
+                    raise HTTPException(status_code=404, detail="Hold not found for this table and time.")
+                if held.hold_expires_at <= now:
+                    logger.debug(f"Hold {held.id} expired at {held.hold_expires_at}, booking without it")
+                    held = None
+
+            logger.debug(f"Checking for conflicts between {start_time.time()} and {end_time.time()}")
+            conflict = find_conflict(rdb, reservation.table_id, start_time, exclude_id=held.id if held else None)
+
+            if conflict:
+                logger.debug(f"Reservation conflict detected for table {table.id} at {reservation_time_str}")
+                rdb.rollback()
+                raise HTTPException(status_code=409, detail=SLOT_TAKEN_MESSAGE)
+
+            if held:
+                held.status = "confirmed"
+                held.hold_expires_at = None
+                held.number_of_people = reservation.number_of_people
+                logger.debug(f"Confirming hold {held.id}")
+                rdb.flush()
+                reservation_id = held.id
+            else:
+                holds.release_expired_hold(rdb, restaurant_id, reservation.table_id, reservation_date, start_time.time(), now)
+                new_reservation = models.Reservation(
+                    user_id=current_user.id,
+                    restaurant_id=restaurant_id,
+                    table_id=reservation.table_id,
+                    date=reservation_date,
+                    time=start_time.time(),  # Use the properly formatted time
+                    number_of_people=reservation.number_of_people,
+                    status="confirmed"
                 )
-                print(f"Confirmation email sent to {current_user.email}")
-            except Exception as email_error:
-                # Log the error but don't fail the reservation if email sending fails
-                print(f"Failed to send confirmation email: {str(email_error)}")
+                logger.debug(f"Creating new reservation: {vars(new_reservation)}")
 
-            print("==== BOOKING COMPLETED SUCCESSFULLY ====")
-            return {"message": "Table booked successfully!", "reservation_id": new_reservation.id}
-        
-        except Exception as db_error:
-            print(f"DATABASE ERROR during reservation creation: {str(db_error)}")
-            import traceback
-            traceback.print_exc()
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
-    
+                rdb.add(new_reservation)
+                rdb.flush()
+                reservation_id = new_reservation.id
+
+            # Count the booking (in the same transaction, unless reservations are sharded)
+            booking_counter.record(rdb, restaurant_id, added=1)
+
+            # Confirmation email goes through the outbox, committed with the reservation
+            outbox.enqueue(rdb, "booking_confirmation", current_user.email, BookingConfirmationDetails(
+                id=str(reservation_id),
+                restaurant_name=restaurant_info["name"],
+                date=reservation_date.strftime("%A, %B %d, %Y"),
+                time=reservation_time_str,
+                people=reservation.number_of_people,
+                table_type=f"Table #{reservation.table_id}",
+                address=restaurant_info["address"],
+                contact=restaurant_info["contact"]
+            ).dict())
+
+            booking_response = {"message": "Table booked successfully!", "reservation_id": reservation_id}
+            if idempotency_key:
+                idempotency.store(rdb, idempotency_scope, idempotency_key, req_hash, 200, booking_response)
+
+            rdb.commit()
+            logger.debug(f"Commit successful, reservation {reservation_id}")
+            return booking_response, True
+
+        try:
+            booking_response, booked = retry_on_lock(rdb, place_booking, BOOKING_MAX_ATTEMPTS, BOOKING_RETRY_DELAY)
+        except IntegrityError:
+            # The unique (table_id, date, time) index caught a booking of the same slot
+            rdb.rollback()
+            raise HTTPException(status_code=409, detail=SLOT_TAKEN_MESSAGE)
+        except OperationalError as e:
+            logger.warning(f"Booking gave up: {str(e)}")
+            raise HTTPException(status_code=503, detail="Booking is busy, please try again.")
+        if claimed:
+            # Settle the key with the response stored on the shard
+            body = booking_response if booked else json.loads(booking_response.body)
+            idempotency.complete(db, idempotency_scope, idempotency_key, 200, body)
+            claimed = False
+        if not booked:
+            return booking_response
+
+        # Mark the slot as taken in the availability index
+        availability_index.record_booking(
+            restaurant_id, reservation.table_id, reservation_date, to_minute_of_day(start_time)
+        )
+
+        # The confirmation email was queued with the reservation; let the outbox worker send it now
+        outbox_worker.wake()
+
+        logger.debug("==== BOOKING COMPLETED SUCCESSFULLY ====")
+        return booking_response
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"OVERALL ERROR in book_table: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        db.rollback()
+        logger.exception("Booking failed")
+        rdb.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to create reservation: {str(e)}")
+    finally:
+        # A failed booking frees its claimed key for another attempt
+        if claimed:
+            idempotency.release(db, idempotency_scope, idempotency_key)
 
-# Cancel a booking (only by the user who made it)
+#  Book several tables at once (group and event reservations), all or nothing
+@router.post("/{restaurant_id}/book/batch")
+def book_tables_batch(
+    restaurant_id: int,
+    batch: BatchBookingCreate,
+    db: Session = Depends(get_db),
+    rdb: Session = Depends(get_reservations_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "Customer":
+        raise HTTPException(status_code=403, detail="Only customers can book tables.")
+    if not 1 <= len(batch.bookings) <= MAX_BATCH_BOOKINGS:
+        raise HTTPException(status_code=400, detail=f"A batch must contain between 1 and {MAX_BATCH_BOOKINGS} bookings.")
+
+    restaurant = db.query(models.Restaurant).filter(models.Restaurant.id == restaurant_id).first()
+    if not restaurant:
+        raise HTTPException(status_code=404, detail="Restaurant not found.")
+
+    # Validate every item up front with one query for the tables and one for their slots
+    items = []
+    for item in batch.bookings:
+        minute = parse_slot(item.time)
+        if minute is None:
+            raise HTTPException(status_code=400, detail=f"Invalid time format: {item.time}")
+        items.append((item.table_id, item.date, minute, item.number_of_people))
+
+    table_ids = {table_id for table_id, _, _, _ in items}
+    tables = {t.id: t for t in db.query(models.Table).filter(
+        models.Table.id.in_(table_ids),
+        models.Table.restaurant_id == restaurant_id
+    )}
+    missing = sorted(table_ids - set(tables))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Tables not found for this restaurant: {missing}")
+    slots = set(db.query(models.TableSlot.table_id, models.TableSlot.minute_of_day).filter(
+        models.TableSlot.table_id.in_(table_ids)
+    ).all())
+
+    by_table_day = {}
+    for table_id, day, minute, people in items:
+        if (table_id, minute) not in slots:
+            raise HTTPException(status_code=400, detail=f"{format_slot(minute)} is not available for table {table_id}.")
+        if people > tables[table_id].size:
+            raise HTTPException(status_code=400, detail=f"Table {table_id} seats at most {tables[table_id].size}.")
+        # Bookings in the same batch may not overlap each other either
+        if any(abs(minute - other) < 60 for other in by_table_day.get((table_id, day), ())):
+            raise HTTPException(status_code=400, detail=f"Bookings for table {table_id} on {day} overlap.")
+        by_table_day.setdefault((table_id, day), []).append(minute)
+
+    starts = [(table_id, datetime.combine(day, dt_time(minute // 60, minute % 60)), people)
+              for table_id, day, minute, people in items]
+
+    def book_all():
+        begin_immediate(rdb)
+        now = datetime.now()
+
+        # One conflict query for the whole batch: any booking or live hold in any item's window
+        conflicts = rdb.query(
+            models.Reservation.table_id, models.Reservation.date, models.Reservation.time
+        ).filter(
+            or_(*[
+                and_(
+                    models.Reservation.table_id == table_id,
+                    models.Reservation.date == start.date(),
+                    models.Reservation.time.between(start.time(), (start + timedelta(minutes=59)).time())
+                )
+                for table_id, start, _ in starts
+            ]),
+            occupies_slot(now)
+        ).all()
+        if conflicts:
+            rdb.rollback()
+            taken = [f"table {t} on {d} at {tm.strftime('%H:%M')}" for t, d, tm in conflicts]
+            raise HTTPException(status_code=409, detail=f"Already reserved: {', '.join(taken)}")
+
+        # Expired holds on the exact slots would still collide with the unique slot index
+        rdb.query(models.Reservation).filter(
+            or_(*[
+                and_(
+                    models.Reservation.table_id == table_id,
+                    models.Reservation.date == start.date(),
+                    models.Reservation.time == start.time()
+                )
+                for table_id, start, _ in starts
+            ]),
+            models.Reservation.status == "held",
+            models.Reservation.hold_expires_at <= now
+        ).execution_options(restaurant_ids=[restaurant_id]).delete(synchronize_session=False)
+
+        # Bulk INSERT ... RETURNING, ids in the order of the batch
+        reservation_ids = rdb.scalars(
+            insert(models.Reservation).returning(models.Reservation.id, sort_by_parameter_order=True),
+            [
+                {
+                    "user_id": current_user.id,
+                    "restaurant_id": restaurant_id,
+                    "table_id": table_id,
+                    "date": start.date(),
+                    "time": start.time(),
+                    "number_of_people": people,
+                    "status": "confirmed"
+                }
+                for table_id, start, people in starts
+            ]
+        ).all()
+
+        # One counter and heat update for the whole batch
+        booking_counter.record(rdb, restaurant_id, added=len(starts), now=now)
+
+        # One summary confirmation for the whole batch, with a line per booking
+        address = f"{restaurant.city}, {restaurant.state} {restaurant.zip_code}"
+        contact = restaurant.contact if hasattr(restaurant, 'contact') else None
+        outbox.enqueue(rdb, "batch_booking_confirmation", current_user.email, BatchBookingDetails(
+            restaurant_name=restaurant.name,
+            address=address,
+            contact=contact,
+            bookings=[
+                BookingConfirmationDetails(
+                    id=str(reservation_id),
+                    restaurant_name=restaurant.name,
+                    date=start.strftime("%A, %B %d, %Y"),
+                    time=start.strftime("%H:%M"),
+                    people=people,
+                    table_type=f"Table #{table_id}",
+                    address=address,
+                    contact=contact
+                )
+                for reservation_id, (table_id, start, people) in zip(reservation_ids, starts)
+            ]
+        ).dict())
+
+        rdb.commit()
+        return reservation_ids
+
+    try:
+        reservation_ids = retry_on_lock(rdb, book_all, BOOKING_MAX_ATTEMPTS, BOOKING_RETRY_DELAY)
+    except IntegrityError:
+        rdb.rollback()
+        raise HTTPException(status_code=409, detail=SLOT_TAKEN_MESSAGE)
+    except OperationalError:
+        raise HTTPException(status_code=503, detail="Booking is busy, please try again.")
+
+    for table_id, start, _ in starts:
+        availability_index.record_booking(restaurant_id, table_id, start.date(), to_minute_of_day(start))
+    outbox_worker.wake()
+
+    return {"message": f"{len(reservation_ids)} tables booked successfully!", "reservation_ids": reservation_ids}
+
+# Cancel a booking (only by the user who made it); the slot goes to the first matching waiter
 @router.delete("/cancel/{reservation_id}")
 def cancel_booking(
     reservation_id: int,
@@ -517,31 +1155,139 @@ def cancel_booking(
     if current_user.role != "Customer":
         raise HTTPException(status_code=403, detail="Only customers can cancel bookings.")
 
-    reservation = db.query(models.Reservation).filter(models.Reservation.id == reservation_id).first()
+    # Delete, count and promote in one write transaction, so the freed slot
+    # cannot be booked by someone else between the cancellation and the promotion
+    def cancel(rdb):
+        begin_immediate(rdb)
+        reservation = rdb.query(models.Reservation).filter(models.Reservation.id == reservation_id).first()
 
-    if not reservation:
-        raise HTTPException(status_code=404, detail="Reservation not found.")
+        if not reservation:
+            rdb.rollback()
+            raise HTTPException(status_code=404, detail="Reservation not found.")
 
-    if reservation.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="You can only cancel your own reservations.")
+        if reservation.user_id != current_user.id:
+            rdb.rollback()
+            raise HTTPException(status_code=403, detail="You can only cancel your own reservations.")
 
-    # Decrement the restaurant's total_bookings count if the reservation is for today or in the future
-    today = datetime.now().date()
-    if reservation.date >= today:
-        restaurant = db.query(models.Restaurant).filter(models.Restaurant.id == reservation.restaurant_id).first()
-        if restaurant and restaurant.total_bookings > 0:
-            restaurant.total_bookings -= 1
+        # The restaurant and table come from the main database (reservations may be on a shard)
+        restaurant = db.get(models.Restaurant, reservation.restaurant_id)
+        table = db.get(models.Table, reservation.table_id) if reservation.table_id else None
 
-    db.delete(reservation)
-    db.commit()
+        # Decrement the restaurant's total_bookings count if the reservation is for today or in the future
+        # (holds were never counted)
+        today = datetime.now().date()
+        upcoming = reservation.date >= today
+        if reservation.status == "confirmed" and upcoming:
+            booking_counter.record(rdb, reservation.restaurant_id, removed=1)
+        if reservation.status == "confirmed" and restaurant:
+            outbox.enqueue(rdb, "booking_cancellation", current_user.email,
+                           reservation_details(reservation, restaurant).dict())
 
-    return {"message": "Reservation cancelled successfully."}
+        # Capture the slot before the row is gone so the availability index can release it
+        slot = (reservation.restaurant_id, reservation.table_id, reservation.date, to_minute_of_day(reservation.time))
+        day, slot_time = reservation.date, reservation.time
+
+        rdb.delete(reservation)
+        rdb.flush()
+
+        promoted = waitlist.promote_next(db, rdb, table, day, slot_time) if upcoming and table else None
+        rdb.commit()
+        return slot, promoted is not None
+
+    try:
+        with shard_router.session_holding(db, models.Reservation, reservation_id) as rdb:
+            slot, promoted = retry_on_lock(rdb, lambda: cancel(rdb), BOOKING_MAX_ATTEMPTS, BOOKING_RETRY_DELAY)
+    except OperationalError:
+        raise HTTPException(status_code=503, detail="Cancellation is busy, please try again.")
+
+    # Reloads the day, which also picks up a promoted waiter's reservation
+    availability_index.release_booking(*slot)
+    outbox_worker.wake()
+
+    return {"message": "Reservation cancelled successfully.", "waitlist_promoted": promoted}
+
+#  Join the waitlist for a restaurant, date and window of start times
+@router.post("/{restaurant_id}/waitlist")
+def join_waitlist(
+    restaurant_id: int,
+    entry: WaitlistCreate,
+    db: Session = Depends(get_db),
+    rdb: Session = Depends(get_reservations_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "Customer":
+        raise HTTPException(status_code=403, detail="Only customers can join a waitlist.")
+
+    window = waitlist.WAITLIST_WINDOW_MINUTES if entry.window_minutes is None else entry.window_minutes
+    if not 0 <= window <= waitlist.MAX_WAITLIST_WINDOW_MINUTES:
+        raise HTTPException(status_code=400, detail=f"window_minutes must be between 0 and {waitlist.MAX_WAITLIST_WINDOW_MINUTES}.")
+    if entry.number_of_people < 1:
+        raise HTTPException(status_code=400, detail="number_of_people must be at least 1.")
+    if entry.date < datetime.now().date():
+        raise HTTPException(status_code=400, detail="Cannot join a waitlist for a past date.")
+    minute = parse_slot(entry.time)
+    if minute is None:
+        raise HTTPException(status_code=400, detail=f"Invalid time format: {entry.time}")
+
+    if not db.query(models.Restaurant.id).filter(models.Restaurant.id == restaurant_id).first():
+        raise HTTPException(status_code=404, detail="Restaurant not found.")
+
+    waiting = [row for rows in shard_router.gather(rdb, lambda shard_db: shard_db.query(
+        models.WaitlistEntry.restaurant_id, models.WaitlistEntry.date
+    ).filter(
+        models.WaitlistEntry.user_id == current_user.id,
+        models.WaitlistEntry.status == "waiting"
+    ).all()) for row in rows]
+    if (restaurant_id, entry.date) in waiting:
+        raise HTTPException(status_code=400, detail="You are already on the waitlist for this restaurant and date.")
+    if len(waiting) >= waitlist.MAX_WAITLIST_ENTRIES_PER_USER:
+        raise HTTPException(status_code=429, detail=f"You can be on at most {waitlist.MAX_WAITLIST_ENTRIES_PER_USER} waitlists at a time.")
+
+    new_entry = models.WaitlistEntry(
+        user_id=current_user.id,
+        restaurant_id=restaurant_id,
+        date=entry.date,
+        start_minute=max(minute - window, 0),
+        end_minute=min(minute + window, 24 * 60 - 1),
+        party_size=entry.number_of_people,
+        status="waiting",
+        created_at=datetime.now()
+    )
+    rdb.add(new_entry)
+    rdb.commit()
+
+    return {
+        "waitlist_id": new_entry.id,
+        "earliest": format_slot(new_entry.start_minute),
+        "latest": format_slot(new_entry.end_minute)
+    }
+
+#  Leave a waitlist
+@router.delete("/waitlist/{entry_id}")
+def leave_waitlist(
+    entry_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    with shard_router.session_holding(db, models.WaitlistEntry, entry_id) as rdb:
+        entry = rdb.query(models.WaitlistEntry).filter(
+            models.WaitlistEntry.id == entry_id,
+            models.WaitlistEntry.user_id == current_user.id,
+            models.WaitlistEntry.status == "waiting"
+        ).first()
+        if not entry:
+            raise HTTPException(status_code=404, detail="Waitlist entry not found.")
+
+        entry.status = "left"
+        rdb.commit()
+
+    return {"message": "Left the waitlist."}
 
 # Add review endpoint
 @router.post("/{restaurant_id}/reviews")
 def add_review(
     restaurant_id: int,
-    rating: int,
+    rating: int = Query(..., ge=1, le=5),
     comment: str = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -549,55 +1295,58 @@ def add_review(
     if current_user.role != "Customer":
         raise HTTPException(status_code=403, detail="Only customers can add reviews.")
     
-    restaurant = db.query(models.Restaurant).filter(models.Restaurant.id == restaurant_id).first()
-    if not restaurant:
-        raise HTTPException(status_code=404, detail="Restaurant not found.")
-    
-    # Check if user has already reviewed this restaurant
-    existing_review = db.query(models.Review).filter(
-        models.Review.user_id == current_user.id,
-        models.Review.restaurant_id == restaurant_id
-    ).first()
-    
-    if existing_review:
-        raise HTTPException(status_code=400, detail="You have already reviewed this restaurant.")
-    
-    # Create new review
-    new_review = models.Review(
-        user_id=current_user.id,
-        restaurant_id=restaurant_id,
-        rating=rating,
-        comment=comment,
-        created_at=datetime.now()
-    )
-    
-    db.add(new_review)
-    db.commit()
-    db.refresh(new_review)
-    
-    # Update restaurant rating
-    all_reviews = db.query(models.Review).filter(
-        models.Review.restaurant_id == restaurant_id
-    ).all()
-    
-    total_rating = sum(review.rating for review in all_reviews)
-    avg_rating = total_rating / len(all_reviews)
-    
-    restaurant.rating = round(avg_rating, 1)
-    db.commit()
-    
+    # Checks, insert and aggregate update run under the write lock, so concurrent
+    # reviews neither lose an increment nor both pass the duplicate check
+    def review():
+        begin_immediate(db)
+        restaurant = db.query(models.Restaurant.id).filter(models.Restaurant.id == restaurant_id).first()
+        if not restaurant:
+            db.rollback()
+            raise HTTPException(status_code=404, detail="Restaurant not found.")
+
+        # Check if user has already reviewed this restaurant
+        existing_review = queries.user_review(db, current_user.id, restaurant_id).first()
+
+        if existing_review:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="You have already reviewed this restaurant.")
+
+        # Create new review
+        db.add(models.Review(
+            user_id=current_user.id,
+            restaurant_id=restaurant_id,
+            rating=rating,
+            comment=comment,
+            created_at=datetime.now()
+        ))
+
+        # Update restaurant rating and rank from the running aggregates
+        ranking.apply_review(db, restaurant_id, rating)
+        db.commit()
+
+    try:
+        retry_on_lock(db, review, BOOKING_MAX_ATTEMPTS, BOOKING_RETRY_DELAY)
+    except OperationalError:
+        raise HTTPException(status_code=503, detail="Reviews are busy, please try again.")
+
     return {"message": "Review added successfully"}
 
 @router.get("/{restaurant_id}")
-def get_restaurant_details(
+async def get_restaurant_details(
     restaurant_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    restaurant = db.query(models.Restaurant).filter(models.Restaurant.id == restaurant_id).first()
+    key = cache_key("details", restaurant_id=restaurant_id)
+    cached = restaurant_cache.get(key)
+    if cached is not None:
+        return cached
+    generation = restaurant_cache.generation()
+
+    restaurant = await db.get(models.Restaurant, restaurant_id)
     if not restaurant:
         raise HTTPException(status_code=404, detail="Restaurant not found.")
 
-    return {
+    details = {
         "id": restaurant.id,
         "name": restaurant.name,
         "cuisine": restaurant.cuisine,
@@ -608,4 +1357,7 @@ def get_restaurant_details(
         "rating": restaurant.rating,
         "contact": restaurant.contact if hasattr(restaurant, 'contact') else None,
         "address": f"{restaurant.city}, {restaurant.state} {restaurant.zip_code}"
-    }
\ No newline at end of file
+    }
+
+    restaurant_cache.put(key, details, [restaurant_id], False, generation, read_as_of(db))
+    return details
\ No newline at end of file
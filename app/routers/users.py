@@ -1,24 +1,50 @@
 # Import necessary modules and components
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.db import models, database
+from typing import Optional
+from app.db import models
 from app.auth import auth_model, auth_handler
 from app.auth.auth_dependency import get_current_user
+from app.db.session import get_db
+from app.utils import idempotency
 
 # Create a router for user-related endpoints
 router = APIRouter(prefix="/users", tags=["Users"])
 
-# Dependency to get a database session
-def get_db():
-    db = database.SessionLocal()  # Create a new database session
-    try:
-        yield db  # Provide the session to the endpoint
-    finally:
-        db.close()  # Always close the session after use
+# Response to a repeated registration: a fresh token for the user it created
+def replay_registration(db: Session, idempotency_key: str, req_hash: str) -> Optional[JSONResponse]:
+    stored = idempotency.find(db, "register", idempotency_key, req_hash)
+    if stored is None:
+        return None
+    registered = db.get(models.User, json.loads(stored.response_body)["user_id"])
+    if registered is None:
+        return None
+    access_token = auth_handler.create_access_token(data={"sub": registered.email, "role": registered.role})
+    return JSONResponse(
+        content={"access_token": access_token, "token_type": "bearer"},
+        headers={"Idempotent-Replayed": "true"}
+    )
+
 
 # User Registration Endpoint
 @router.post("/register")
-def register_user(user: auth_model.UserCreate, db: Session = Depends(get_db)):
+def register_user(
+    user: auth_model.UserCreate,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None)
+):
+    # A retried registration is answered from the stored user id, with a new token,
+    # without hashing the password again
+    if idempotency_key:
+        idempotency.check_key(idempotency_key)
+        req_hash = idempotency.request_hash(user.dict())
+        replay = replay_registration(db, idempotency_key, req_hash)
+        if replay:
+            return replay
+
     # Check if a user with the given email already exists
     db_user = db.query(models.User).filter(models.User.email == user.email).first()
     if db_user:
@@ -36,19 +62,30 @@ def register_user(user: auth_model.UserCreate, db: Session = Depends(get_db)):
             role=user.role
         )
         
-        # Add the user to the database and save changes
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-        
         # Generate access token immediately after registration
         access_token = auth_handler.create_access_token(
             data={"sub": new_user.email, "role": new_user.role}
         )
+        response = {"access_token": access_token, "token_type": "bearer"}
+
+        # Add the user to the database and save changes; replays keep only the user id,
+        # never the token
+        db.add(new_user)
+        if idempotency_key:
+            db.flush()
+            idempotency.store(db, "register", idempotency_key, req_hash, 200, {"user_id": new_user.id})
+        db.commit()
         
         # Return the token to automatically log in the user
-        return {"access_token": access_token, "token_type": "bearer"}
+        return response
         
+    except IntegrityError:
+        # A concurrent retry with the same key registered first; replay its response
+        db.rollback()
+        replay = replay_registration(db, idempotency_key, req_hash) if idempotency_key else None
+        if replay:
+            return replay
+        raise HTTPException(status_code=400, detail="Email already registered")
     except ValueError as e:
         # Handle password validation errors
         raise HTTPException(status_code=400, detail=str(e))
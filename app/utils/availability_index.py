@@ -0,0 +1,364 @@
+import threading
+import time as clock
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, exists, func, or_
+from sqlalchemy.orm import Session
+from app.db import models
+from app.db.session import client_read_after, read_as_of, session_as_of
+from app.db.shards import shard_router
+from app.utils.time_slots import to_minute_of_day
+
+# A reservation holds its table for this long (matches the conflict window in book_table)
+BOOKING_BLOCK_MINUTES = 60
+
+# Entries are reloaded after this long so bookings made by other workers show up
+INDEX_TTL_SECONDS = 60
+
+# Upper bound on cached (restaurant, date) entries
+MAX_DAY_ENTRIES = 50000
+
+
+class TableLayout:
+    """Static slot layout of one table: sorted slot minutes packed in an array."""
+    __slots__ = ("table_id", "size", "slots", "positions")
+
+    def __init__(self, table_id: int, size: int, slots: List[int]):
+        self.table_id = table_id
+        self.size = size
+        self.slots = array("H", sorted(set(slots)))
+        self.positions = {minute: i for i, minute in enumerate(self.slots)}
+
+    # Bit positions of the slots a reservation starting at `minute` blocks
+    def blocked_by(self, minute: int) -> range:
+        return range(
+            bisect_right(self.slots, minute - BOOKING_BLOCK_MINUTES),
+            bisect_right(self.slots, minute)
+        )
+
+
+class DayAvailability:
+    """Free-slot bitmaps of one restaurant on one date (bit i = layout slot i is open)."""
+    __slots__ = ("free", "loaded_at", "as_of")
+
+    def __init__(self):
+        self.free: Dict[int, int] = {}
+        self.loaded_at = clock.monotonic()
+        # Wall-clock time the loaded data was current as of
+        self.as_of = 0.0
+
+    # Earliest open slot minute of a table, or None when it is fully booked
+    def first_open(self, layout: TableLayout) -> Optional[int]:
+        bits = self.free.get(layout.table_id, 0)
+        return layout.slots[(bits & -bits).bit_length() - 1] if bits else None
+
+    def take(self, layout: TableLayout, minute: int):
+        bits = self.free.get(layout.table_id, 0)
+        for i in layout.blocked_by(minute):
+            bits &= ~(1 << i)
+        self.free[layout.table_id] = bits
+
+
+# Reservations that occupy their slot: bookings, and holds that have not expired yet
+def occupies_slot(now: Optional[datetime] = None):
+    return or_(
+        models.Reservation.status != "held",
+        models.Reservation.hold_expires_at > (now or datetime.now())
+    )
+
+
+# First booking or live hold on the table within the one-hour window starting at `start`
+def find_conflict(db: Session, table_id: int, start: datetime, exclude_id: Optional[int] = None):
+    query = db.query(models.Reservation.id).filter(
+        models.Reservation.table_id == table_id,
+        models.Reservation.date == start.date(),
+        models.Reservation.time.between(start.time(), (start + timedelta(minutes=59)).time()),
+        occupies_slot()
+    )
+    if exclude_id is not None:
+        query = query.filter(models.Reservation.id != exclude_id)
+    return query.first()
+
+
+# Reservation-aware open slots in one statement: every slot of the given
+# restaurants' tables that no reservation on `day` blocks (anti-join on
+# table_id, date and the one-hour window starting at the slot)
+def open_slots_query(db: Session, restaurant_ids: List[int], day):
+    slot_start = func.printf("%02d:%02d", models.TableSlot.minute_of_day // 60, models.TableSlot.minute_of_day % 60)
+    slot_end = func.printf(
+        "%02d:%02d",
+        (models.TableSlot.minute_of_day + BOOKING_BLOCK_MINUTES) // 60,
+        (models.TableSlot.minute_of_day + BOOKING_BLOCK_MINUTES) % 60
+    )
+    conflict = exists().where(and_(
+        models.Reservation.table_id == models.TableSlot.table_id,
+        models.Reservation.date == day,
+        models.Reservation.time >= slot_start,
+        models.Reservation.time < slot_end,
+        occupies_slot()
+    ))
+    return db.query(
+        models.Table.restaurant_id,
+        models.TableSlot.table_id,
+        models.TableSlot.minute_of_day
+    ).join(
+        models.TableSlot, models.TableSlot.table_id == models.Table.id
+    ).filter(
+        models.Table.restaurant_id.in_(restaurant_ids),
+        ~conflict
+    )
+
+
+# Tables of the given restaurants with their slot minutes (one row per slot, or one with no minute)
+def table_layouts_query(db: Session, restaurant_ids: List[int]):
+    return db.query(
+        models.Table.restaurant_id,
+        models.Table.id,
+        models.Table.size,
+        models.TableSlot.minute_of_day
+    ).outerjoin(
+        models.TableSlot, models.TableSlot.table_id == models.Table.id
+    ).filter(
+        models.Table.restaurant_id.in_(restaurant_ids)
+    )
+
+
+# Reservations of the given restaurants dated `first` to `last` that occupy their slot
+def reservations_in_range(rdb: Session, restaurant_ids: List[int], first, last):
+    return rdb.query(
+        models.Reservation.restaurant_id,
+        models.Reservation.table_id,
+        models.Reservation.date,
+        models.Reservation.time
+    ).filter(
+        models.Reservation.restaurant_id.in_(restaurant_ids),
+        models.Reservation.date.between(first, last),
+        occupies_slot()
+    )
+
+
+class AvailabilityIndex:
+    """
+    In-memory per-restaurant, per-date availability index.
+
+    Table slot layouts are loaded once per restaurant and free-slot bitmaps once
+    per (restaurant, date); both are then kept current by the booking and table
+    management endpoints, so availability lookups are answered from memory.
+
+    Entries are loaded from the lookup's session, which may be a read replica,
+    unless the replica predates the restaurant's last change in this process;
+    an entry older than the client's read-your-writes token is reloaded, so a
+    booking made through another worker shows up for the client who made it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._layouts: Dict[int, Tuple[float, Dict[int, TableLayout], float]] = {}
+        self._days: "OrderedDict[Tuple[int, object], DayAvailability]" = OrderedDict()
+        self._versions: Dict[int, int] = {}
+        self._changed_at: Dict[int, float] = {}
+
+    def _fresh(self, loaded_at: float, as_of: float, read_after: float) -> bool:
+        return clock.monotonic() - loaded_at < INDEX_TTL_SECONDS and as_of >= read_after
+
+    def _bump(self, restaurant_id: int):
+        self._versions[restaurant_id] = self._versions.get(restaurant_id, 0) + 1
+        self._changed_at[restaurant_id] = clock.time()
+
+    def _drop_days(self, restaurant_id: int):
+        for key in [k for k in self._days if k[0] == restaurant_id]:
+            del self._days[key]
+
+    def _load_layouts(self, db: Session, restaurant_ids: List[int]):
+        # One join over tables and table_slots for every requested restaurant
+        rows = table_layouts_query(db, restaurant_ids).all()
+
+        tables = {}
+        for restaurant_id, table_id, size, minute in rows:
+            entry = tables.setdefault(table_id, (restaurant_id, size, []))
+            if minute is not None:
+                entry[2].append(minute)
+
+        layouts = {rid: {} for rid in restaurant_ids}
+        for table_id, (restaurant_id, size, minutes) in sorted(tables.items()):
+            layouts[restaurant_id][table_id] = TableLayout(table_id, size, minutes)
+        return layouts
+
+    def _load_days(self, db: Session, restaurant_ids: List[int], day, layouts):
+        # The anti-join needs the slots and reservations in one database
+        if shard_router.shards:
+            return self._load_day_range(db, restaurant_ids, [day], layouts)
+        days = {(rid, day): DayAvailability() for rid in restaurant_ids}
+        for restaurant_id, table_id, minute in open_slots_query(db, restaurant_ids, day).all():
+            layout = layouts[restaurant_id].get(table_id)
+            if layout is not None and minute in layout.positions:
+                free = days[(restaurant_id, day)].free
+                free[table_id] = free.get(table_id, 0) | (1 << layout.positions[minute])
+        return days
+
+    def _load_day_range(self, db: Session, restaurant_ids: List[int], days: List, layouts):
+        # Start every day fully open, then clear what the range's reservations block;
+        # one reservation scan covers all the days instead of one anti-join per day
+        entries = {}
+        for rid in restaurant_ids:
+            for day in days:
+                entry = entries[(rid, day)] = DayAvailability()
+                for layout in layouts[rid].values():
+                    entry.free[layout.table_id] = (1 << len(layout.slots)) - 1
+
+        # One scan per reservation shard holding any of the restaurants
+        reservations = shard_router.gather_restaurants(db, restaurant_ids, lambda rdb, shard_restaurant_ids: (
+            reservations_in_range(rdb, shard_restaurant_ids, min(days), max(days)).all()
+        ))
+        for restaurant_id, table_id, day, reserved_at in (r for rows in reservations for r in rows):
+            entry = entries.get((restaurant_id, day))
+            layout = layouts[restaurant_id].get(table_id)
+            if entry is not None and layout is not None:
+                entry.take(layout, to_minute_of_day(reserved_at))
+        return entries
+
+    def _ensure_loaded(self, db: Session, restaurant_ids: List[int], days: List):
+        read_after = client_read_after(db)
+        with self._lock:
+            missing_layouts = [
+                rid for rid in restaurant_ids
+                if rid not in self._layouts or not self._fresh(self._layouts[rid][0], self._layouts[rid][2], read_after)
+            ]
+            missing_days = [
+                (rid, day) for rid in restaurant_ids for day in days
+                if rid in missing_layouts
+                or (rid, day) not in self._days
+                or not self._fresh(self._days[(rid, day)].loaded_at, self._days[(rid, day)].as_of, read_after)
+            ]
+            versions = {rid: self._versions.get(rid, 0) for rid in restaurant_ids}
+            layouts = {rid: self._layouts[rid][1] for rid in restaurant_ids if rid not in missing_layouts}
+            changed_at = max((self._changed_at.get(rid, 0.0) for rid in restaurant_ids), default=0.0)
+
+        loaded = {}
+        as_of = 0.0
+        if missing_layouts or missing_days:
+            with session_as_of(db, changed_at) as source:
+                as_of = read_as_of(source) or clock.time()
+                if missing_layouts:
+                    layouts.update(self._load_layouts(source, missing_layouts))
+                if missing_days:
+                    stale = sorted({rid for rid, _ in missing_days})
+                    if len(days) == 1:
+                        loaded = self._load_days(source, stale, days[0], layouts)
+                    else:
+                        loaded = self._load_day_range(source, stale, days, layouts)
+            for entry in loaded.values():
+                entry.as_of = as_of
+
+        with self._lock:
+            now = clock.monotonic()
+            for rid in missing_layouts:
+                if self._versions.get(rid, 0) == versions[rid]:
+                    self._layouts[rid] = (now, layouts[rid], as_of)
+                    self._drop_days(rid)
+            for key, entry in loaded.items():
+                # Skip the store if a booking for this restaurant landed while we were loading
+                if self._versions.get(key[0], 0) == versions[key[0]]:
+                    self._days[key] = entry
+                    self._days.move_to_end(key)
+            while len(self._days) > MAX_DAY_ENTRIES:
+                self._days.popitem(last=False)
+
+        return layouts, loaded
+
+    def find_open_slots(
+        self,
+        db: Session,
+        restaurant_ids: List[int],
+        day,
+        start_minute: int,
+        end_minute: int,
+        people: int
+    ) -> Dict[int, List[Tuple[int, int]]]:
+        """
+        Return {restaurant_id: [(table_id, minute), ...]} with the earliest open
+        slot in [start_minute, end_minute] for every table seating `people`.
+        Restaurants without an open slot are left out.
+        """
+        if not restaurant_ids:
+            return {}
+        layouts, loaded_days = self._ensure_loaded(db, restaurant_ids, [day])
+
+        results = {}
+        with self._lock:
+            for rid in restaurant_ids:
+                availability = loaded_days.get((rid, day)) or self._days.get((rid, day)) or DayAvailability()
+                open_slots = []
+                for table in layouts[rid].values():
+                    if table.size < people:
+                        continue
+                    bits = availability.free.get(table.table_id, 0)
+                    i = bisect_left(table.slots, start_minute)
+                    while i < len(table.slots) and table.slots[i] <= end_minute:
+                        if bits >> i & 1:
+                            open_slots.append((table.table_id, table.slots[i]))
+                            break
+                        i += 1
+                if open_slots:
+                    results[rid] = open_slots
+        return results
+
+    def calendar(
+        self,
+        db: Session,
+        restaurant_ids: List[int],
+        days: List,
+        people: int
+    ) -> Dict[int, Tuple[List[bool], Optional[Tuple[object, int, int]]]]:
+        """
+        Return {restaurant_id: (open_days, earliest)} where open_days[i] tells
+        whether days[i] has any open slot for `people` and earliest is the first
+        open (date, table_id, minute) in the range, or None.
+        """
+        if not restaurant_ids or not days:
+            return {}
+        layouts, loaded_days = self._ensure_loaded(db, restaurant_ids, days)
+
+        results = {}
+        with self._lock:
+            for rid in restaurant_ids:
+                tables = [t for t in layouts[rid].values() if t.size >= people]
+                open_days = []
+                earliest = None
+                for day in days:
+                    availability = loaded_days.get((rid, day)) or self._days.get((rid, day)) or DayAvailability()
+                    openings = [(availability.first_open(t), t.table_id) for t in tables]
+                    first = min((o for o in openings if o[0] is not None), default=None)
+                    open_days.append(first is not None)
+                    if first is not None and earliest is None:
+                        earliest = (day, first[1], first[0])
+                results[rid] = (open_days, earliest)
+        return results
+
+    def record_booking(self, restaurant_id: int, table_id: int, day, minute: int):
+        with self._lock:
+            self._bump(restaurant_id)
+            entry = self._days.get((restaurant_id, day))
+            layout = self._layouts.get(restaurant_id, (0, {}, 0.0))[1].get(table_id)
+            if entry and layout:
+                entry.take(layout, minute)
+
+    def release_booking(self, restaurant_id: int, table_id: int, day, minute: int):
+        # Other reservations may still block neighbouring slots, so reload the day
+        with self._lock:
+            self._bump(restaurant_id)
+            self._days.pop((restaurant_id, day), None)
+
+    def invalidate_restaurant(self, restaurant_id: int):
+        """Drop everything cached for a restaurant (tables edited or restaurant removed)."""
+        with self._lock:
+            self._bump(restaurant_id)
+            self._layouts.pop(restaurant_id, None)
+            self._drop_days(restaurant_id)
+
+
+# Shared process-wide index
+availability_index = AvailabilityIndex()
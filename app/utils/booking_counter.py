@@ -0,0 +1,157 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import case, delete, update
+from sqlalchemy.orm import Session
+from app.db import models, database
+from app.db.database import begin_immediate, retry_on_lock
+from app.db.shards import shard_router
+from app.utils import ranking
+
+logger = logging.getLogger(__name__)
+
+# Counts of bookings made on the reservation shards are folded into the restaurants this often (seconds)
+BOOKING_FLUSH_SECONDS = 1.0
+
+# Most booking counts read from one shard per flush transaction
+BOOKING_FLUSH_BATCH = 5000
+
+
+# Add bookings to (and take cancellations off) a restaurant's total, folding the
+# new bookings into its decayed heat and score; atomic within the caller's transaction.
+# Counts for a restaurant that has been removed are dropped.
+def apply_counts(db: Session, restaurant_id: int, added: int = 0, removed: int = 0, now: Optional[datetime] = None):
+    total = models.Restaurant.total_bookings + added - removed
+    values = {"total_bookings": case((total < 0, 0), else_=total)}
+    if added:
+        # The heat columns are read under the caller's write lock, so concurrent bookings cannot lose updates
+        stats = db.query(
+            models.Restaurant.review_sum, models.Restaurant.review_count,
+            models.Restaurant.booking_heat, models.Restaurant.heat_updated_at
+        ).filter(models.Restaurant.id == restaurant_id).first()
+        if stats is None:
+            return
+        values.update(ranking.booking_values(*stats, now=now, bookings=added))
+    db.execute(
+        update(models.Restaurant)
+        .where(models.Restaurant.id == restaurant_id)
+        .values(**values)
+        .execution_options(synchronize_session=False, restaurant_ids=[restaurant_id])
+    )
+
+
+class BookingCounter:
+    """
+    Keeps the restaurants' booking counters (total_bookings and heat) in step
+    with the reservations.
+
+    Without shards, `record` updates the counters in the booking's own
+    transaction. With sharded reservations that would take the main database's
+    write lock on every booking again, so each booking writes a booking_counts
+    row on its shard, in its own transaction, and a background thread folds
+    them into the restaurants every BOOKING_FLUSH_SECONDS. The last folded id
+    of each shard is stored with the counters it produced, so counts survive a
+    crash and are applied once, whichever process flushes them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, db: Session, restaurant_id: int, added: int = 0, removed: int = 0, now: Optional[datetime] = None):
+        """Count bookings made (or cancelled) in `db`'s transaction, the session holding the reservations."""
+        if not shard_router.shards:
+            apply_counts(db, restaurant_id, added, removed, now)
+            return
+        db.add(models.BookingCount(restaurant_id=restaurant_id, added=added, removed=removed))
+
+    def start(self):
+        if not shard_router.shards or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="booking-counter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(BOOKING_FLUSH_SECONDS):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Booking counter flush failed")
+
+    def flush(self) -> int:
+        """Fold every shard's booking counts into the restaurants; returns the number of counts applied."""
+        applied = 0
+        with self._lock:
+            for shard in shard_router.shards:
+                while True:
+                    count = self._flush_shard(shard)
+                    applied += count
+                    if count < BOOKING_FLUSH_BATCH:
+                        break
+        return applied
+
+    def _flush_shard(self, shard) -> int:
+        db = database.SessionLocal()
+        shard_db = shard.SessionLocal()
+        try:
+            mark = db.query(models.BookingCountMark.last_id).filter(
+                models.BookingCountMark.shard == shard.index
+            ).scalar() or 0
+            # SQLite assigns ids under the shard's write lock, so they follow commit
+            # order and no count can commit later below an id already folded in
+            rows = shard_db.query(
+                models.BookingCount.id, models.BookingCount.restaurant_id,
+                models.BookingCount.added, models.BookingCount.removed
+            ).filter(models.BookingCount.id > mark).order_by(models.BookingCount.id).limit(BOOKING_FLUSH_BATCH).all()
+            shard_db.rollback()
+            if not rows:
+                return 0
+
+            def apply_all():
+                begin_immediate(db)
+                # Another process may have folded some of the rows since the mark was read
+                current = db.query(models.BookingCountMark).filter(
+                    models.BookingCountMark.shard == shard.index
+                ).first()
+                done = current.last_id if current else 0
+                if done >= rows[-1].id:
+                    db.rollback()
+                    return False
+                pending: Dict[int, List[int]] = {}
+                for _, restaurant_id, added, removed in (r for r in rows if r.id > done):
+                    counts = pending.setdefault(restaurant_id, [0, 0])
+                    counts[0] += added
+                    counts[1] += removed
+                now = datetime.now()
+                for restaurant_id, (added, removed) in pending.items():
+                    apply_counts(db, restaurant_id, added, removed, now)
+                if current is None:
+                    db.add(models.BookingCountMark(shard=shard.index, last_id=max(done, rows[-1].id)))
+                else:
+                    current.last_id = max(done, rows[-1].id)
+                db.commit()
+                return True
+            if not retry_on_lock(db, apply_all):
+                return 0
+
+            # Counted rows are only deleted once the mark covering them is committed
+            shard_db.execute(delete(models.BookingCount).where(models.BookingCount.id <= rows[-1].id))
+            shard_db.commit()
+            return len(rows)
+        finally:
+            shard_db.close()
+            db.close()
+
+
+# Shared counter, started with the application
+booking_counter = BookingCounter()
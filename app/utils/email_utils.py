@@ -2,7 +2,7 @@ import os
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, HtmlContent
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -10,6 +10,15 @@ load_dotenv()
 SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
 FROM_EMAIL = os.getenv("BOOKTABLE_EMAIL_FROM")
 
+_sendgrid_client = None
+
+# One SendGrid client shared by every send, instead of a new client per email
+def get_sendgrid_client() -> SendGridAPIClient:
+    global _sendgrid_client
+    if _sendgrid_client is None:
+        _sendgrid_client = SendGridAPIClient(SENDGRID_API_KEY)
+    return _sendgrid_client
+
 # Pydantic model representing booking details to include in emails
 class BookingConfirmationDetails(BaseModel):
     id: str
@@ -21,6 +30,26 @@ class BookingConfirmationDetails(BaseModel):
     address: Optional[str] = None
     contact: Optional[str] = None
 
+# Details for the summary email of a batch booking: one entry per booked table
+class BatchBookingDetails(BaseModel):
+    restaurant_name: str
+    address: Optional[str] = None
+    contact: Optional[str] = None
+    bookings: List[BookingConfirmationDetails]
+
+# Email details of a stored reservation and its restaurant
+def reservation_details(reservation, restaurant) -> BookingConfirmationDetails:
+    return BookingConfirmationDetails(
+        id=str(reservation.id),
+        restaurant_name=restaurant.name,
+        date=reservation.date.strftime("%A, %B %d, %Y"),
+        time=reservation.time.strftime("%H:%M"),
+        people=reservation.number_of_people,
+        table_type=f"Table #{reservation.table_id}" if reservation.table_id else "Standard",
+        address=f"{restaurant.city}, {restaurant.state} {restaurant.zip_code}",
+        contact=restaurant.contact if hasattr(restaurant, 'contact') else None
+    )
+
 # Send confirmation email using SendGrid
 def send_booking_confirmation(to_email: str, booking_details: BookingConfirmationDetails):
     """
@@ -103,14 +132,116 @@ Thanks for using BookTable!
         print("SENDGRID_API_KEY (first 10 chars):", SENDGRID_API_KEY[:10])
         print("FROM_EMAIL:", FROM_EMAIL)
         print("TO_EMAIL:", to_email)
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
+        response = get_sendgrid_client().send(message)
         print(f"Email sent successfully. Status code: {response.status_code}")
         return {"success": True, "message": "Email sent successfully"}
     except Exception as e:
         print(f"Failed to send email: {e}")
         return {"success": False, "error": str(e)}
 
+# Send one summary email for a batch booking using SendGrid
+def send_batch_booking_confirmation(to_email: str, batch_details: BatchBookingDetails):
+    """
+    Send a formatted HTML summary of a batch booking using SendGrid, with one
+    line per booked table.
+
+    Args:
+        to_email (str): The recipient's email address.
+        batch_details (BatchBookingDetails): The restaurant and the bookings made.
+    """
+
+    # One table row (and one plain text line) per booking
+    rows = "".join(
+        f"""
+                <tr>
+                    <td>#{booking.id}</td>
+                    <td>{booking.table_type}</td>
+                    <td>{booking.date}</td>
+                    <td>{booking.time}</td>
+                    <td>{booking.people}</td>
+                </tr>"""
+        for booking in batch_details.bookings
+    )
+    lines = "\n".join(
+        f"- Reservation #{booking.id}: {booking.table_type}, {booking.date} at {booking.time}, "
+        f"{booking.people} {'person' if booking.people == 1 else 'people'}"
+        for booking in batch_details.bookings
+    )
+    count = len(batch_details.bookings)
+
+    # Create styled HTML content for the summary
+    html_content = f"""
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; }}
+            .container {{ background-color: #f8f9fa; padding: 20px; border-radius: 5px; border-top: 4px solid #0056b3; }}
+            .booking-details {{ background-color: white; padding: 15px; border-radius: 5px; margin: 15px 0; }}
+            .booking-details table {{ width: 100%; border-collapse: collapse; }}
+            .booking-details th, .booking-details td {{ text-align: left; padding: 6px; border-bottom: 1px solid #eee; }}
+            h1, h2 {{ color: #0056b3; }}
+            .footer {{ font-size: 0.9em; color: #666; margin-top: 20px; border-top: 1px solid #eee; padding-top: 15px; }}
+            .button {{ background-color: #0056b3; color: white; padding: 10px 15px; text-decoration: none; border-radius: 4px; display: inline-block; margin-top: 15px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>Booking Confirmation</h1>
+            <p>Thank you for your reservations at <strong>{batch_details.restaurant_name}</strong>! {count} {'table is' if count == 1 else 'tables are'} booked:</p>
+
+            <div class="booking-details">
+                <table>
+                    <tr><th>Reservation</th><th>Table</th><th>Date</th><th>Time</th><th>Party Size</th></tr>{rows}
+                </table>
+                {f'<p><strong>Location:</strong> {batch_details.address}</p>' if batch_details.address else ''}
+                {f'<p><strong>Contact:</strong> {batch_details.contact}</p>' if batch_details.contact else ''}
+            </div>
+
+            <p>You can manage your reservations in your account dashboard.</p>
+            <a href="http://localhost:3000/my-reservations" class="button">View My Reservations</a>
+
+            <div class="footer">
+                <p>If you need to cancel or modify a reservation, please do so at least 2 hours in advance.</p>
+                <p>Thank you for using BookTable!</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+    # Plain text fallback content for email clients that don't support HTML
+    plain_text_content = f"""
+Hi,
+
+Your reservations at {batch_details.restaurant_name} are confirmed:
+
+{lines}
+
+You can manage your reservations by visiting: http://localhost:3000/my-reservations
+
+If you need to cancel or modify a reservation, please do so at least 2 hours in advance.
+
+Thanks for using BookTable!
+•⁠  ⁠Team BookTable
+    """
+
+    # Create and send the email via SendGrid
+    message = Mail(
+        from_email=FROM_EMAIL,
+        to_emails=to_email,
+        subject=f'BookTable Reservation Confirmation: {count} tables at {batch_details.restaurant_name}',
+        plain_text_content=plain_text_content,
+        html_content=HtmlContent(html_content)
+    )
+
+    try:
+        response = get_sendgrid_client().send(message)
+        print(f"Batch confirmation email sent successfully. Status code: {response.status_code}")
+        return {"success": True, "message": "Email sent successfully"}
+    except Exception as e:
+        print(f"Failed to send batch confirmation email: {e}")
+        return {"success": False, "error": str(e)}
+
 # Send cancellation email using SendGrid
 def send_booking_cancellation(to_email: str, booking_details: BookingConfirmationDetails):
     """
@@ -165,8 +296,7 @@ def send_booking_cancellation(to_email: str, booking_details: BookingConfirmatio
     )
 
     try:
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
+        response = get_sendgrid_client().send(message)
         print(f"Cancellation email sent successfully. Status code: {response.status_code}")
         return {"success": True, "message": "Cancellation email sent successfully"}
     except Exception as e:
@@ -0,0 +1,135 @@
+import threading
+import time as clock
+from collections import Counter
+from typing import Dict, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app.db import models
+from app.db.events import RestaurantChanges, on_restaurants_changed
+from app.db.session import session_as_of
+from app.utils.suggest import normalize
+
+# Facets in the order they are stored in each combination tuple
+FACETS = ("cuisine", "city", "cost_rating")
+
+
+# Values are counted and matched in the same case- and whitespace-insensitive form as suggestions
+def _normalize(value):
+    return normalize(value) if isinstance(value, str) else value
+
+
+class FacetIndex:
+    """
+    Facet counts maintained incrementally.
+
+    Restaurants are counted per normalized (cuisine, city, cost_rating)
+    combination, so any facet, with or without filters on the other facets,
+    is computed from the distinct combinations rather than the whole catalog.
+    Spelling variants of a value ("mexican", "Mexican ") count as one value,
+    shown in its most common spelling. Committed changes only mark restaurants
+    dirty; they are re-read in one query on the next lookup and applied as deltas,
+    from the primary when the lookup's replica session predates the change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._by_id: Dict[int, Tuple] = {}
+        self._combos: Counter = Counter()
+        # Spellings seen for each (facet position, normalized value)
+        self._spellings: Dict[Tuple, Counter] = {}
+        self._dirty: Set[int] = set()
+        self._changed_at = 0.0
+
+    def _count_spellings(self, raw: Tuple, delta: int):
+        for i, value in enumerate(raw):
+            if not isinstance(value, str):
+                continue
+            key = (i, _normalize(value))
+            spellings = self._spellings.setdefault(key, Counter())
+            spellings[value.strip()] += delta
+            if spellings[value.strip()] <= 0:
+                del spellings[value.strip()]
+                if not spellings:
+                    del self._spellings[key]
+
+    def _apply(self, restaurant_id: int, raw: Optional[Tuple]):
+        old = self._by_id.pop(restaurant_id, None)
+        if old is not None:
+            combo = tuple(_normalize(v) for v in old)
+            self._combos[combo] -= 1
+            if not self._combos[combo]:
+                del self._combos[combo]
+            self._count_spellings(old, -1)
+        if raw is not None:
+            self._by_id[restaurant_id] = raw
+            self._combos[tuple(_normalize(v) for v in raw)] += 1
+            self._count_spellings(raw, 1)
+
+    def _display(self, i: int, value):
+        spellings = self._spellings.get((i, value))
+        return spellings.most_common(1)[0][0] if spellings else value
+
+    def _refresh(self, db: Session):
+        with self._lock:
+            loaded, dirty, changed_at = self._loaded, self._dirty, self._changed_at
+            self._dirty = set()
+        if loaded and not dirty:
+            return
+
+        with session_as_of(db, changed_at) as source:
+            query = source.query(models.Restaurant.id, models.Restaurant.cuisine, models.Restaurant.city,
+                                 models.Restaurant.cost_rating)
+            if loaded:
+                query = query.filter(models.Restaurant.id.in_(dirty))
+            rows = {row[0]: tuple(row[1:]) for row in query.all()}
+
+        with self._lock:
+            if not loaded:
+                self._by_id, self._combos, self._spellings = {}, Counter(), {}
+                self._loaded = True
+            for restaurant_id in (dirty if loaded else rows):
+                self._apply(restaurant_id, rows.get(restaurant_id))
+
+    def on_changes(self, changes: RestaurantChanges):
+        if not changes.catalog:
+            return
+        with self._lock:
+            self._changed_at = clock.time()
+            if changes.ids is None:
+                self._loaded = False
+                self._dirty = set()
+            else:
+                self._dirty |= changes.ids
+
+    def counts(self, db: Session, filters: Dict[str, object]) -> dict:
+        """
+        Count restaurants per value of every facet. Filters on the other facets
+        apply, the facet's own filter does not, so the client can switch values.
+        """
+        self._refresh(db)
+        wanted = {i: _normalize(filters[f]) for i, f in enumerate(FACETS) if filters.get(f) is not None}
+
+        with self._lock:
+            combos = list(self._combos.items())
+
+            result = {}
+            total = 0
+            for i, facet in enumerate(FACETS):
+                values = Counter()
+                for combo, count in combos:
+                    if all(combo[j] == v for j, v in wanted.items() if j != i):
+                        values[self._display(i, combo[i])] += count
+                result[facet] = [
+                    {"value": value, "count": count}
+                    for value, count in sorted(values.items(), key=lambda item: (-item[1], str(item[0])))
+                ]
+        for combo, count in combos:
+            if all(combo[j] == v for j, v in wanted.items()):
+                total += count
+        result["total"] = total
+        return result
+
+
+# Shared facet index, refreshed by committed restaurant changes
+facet_index = FacetIndex()
+on_restaurants_changed(facet_index.on_changes)
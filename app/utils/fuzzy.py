@@ -0,0 +1,180 @@
+import threading
+import time as clock
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app.db.events import RestaurantChanges, on_restaurants_changed
+from app.db.session import session_as_of
+from app.utils.suggest import load_search_terms, normalize
+
+# Near matches below this trigram similarity are dropped
+MIN_SIMILARITY = 0.3
+
+DEFAULT_MATCHES = 5
+MAX_MATCHES = 20
+
+
+# Trigrams of a normalized string, padded so word starts and ends count
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# One substitution, insertion, deletion or swap of adjacent letters apart (or equal)
+def within_one_edit(a: str, b: str) -> bool:
+    if abs(len(a) - len(b)) > 1:
+        return False
+    start = 0
+    while start < min(len(a), len(b)) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    rest_a, rest_b = a[start:end_a], b[start:end_b]
+    if len(rest_a) <= 1 and len(rest_b) <= 1:
+        return True
+    return len(rest_a) == len(rest_b) == 2 and rest_a == rest_b[::-1]
+
+
+def _prefix_range(keys: List[str], prefix: str) -> range:
+    return range(bisect_left(keys, prefix), bisect_left(keys, prefix + "\uffff"))
+
+
+class FuzzyIndex:
+    """
+    Typo-tolerant lookup over city, cuisine and restaurant name terms.
+
+    Terms are indexed by trigram in posting lists; a lookup only visits the
+    terms sharing a trigram with the query and ranks them by Dice similarity.
+
+    Corrections of a single typo do not need the posting lists: an edit that
+    touches query[:split] leaves query[split + 1:] intact, so the terms one
+    edit away all start with the one or end with the other. Both are ranges
+    of the terms (and their reversals) sorted, found by bisection; the split
+    with the smallest ranges is used, which keeps the cost of a correction
+    nearly flat as the catalog grows.
+
+    Rebuilt on the first lookup after a committed catalog change, from the
+    lookup's session unless it is a replica that predates the change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._built_version = -1
+        self._changed_at = 0.0
+        self._terms: List[Tuple[str, str, int]] = []
+        self._sizes: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._normalized: List[str] = []
+        self._forward: List[str] = []
+        self._forward_ids: List[int] = []
+        self._backward: List[str] = []
+        self._backward_ids: List[int] = []
+
+    def _rebuild(self, db: Session):
+        version = self._version
+        with session_as_of(db, self._changed_at) as source:
+            terms = load_search_terms(source)
+        postings, sizes, exact = {}, [], {}
+        for i, (kind, text, _) in enumerate(terms):
+            grams = trigrams(normalize(text))
+            sizes.append(len(grams))
+            exact[(kind, normalize(text))] = i
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        normalized = [normalize(text) for _, text, _ in terms]
+        forward = sorted((text, i) for i, text in enumerate(normalized))
+        backward = sorted((text[::-1], i) for i, text in enumerate(normalized))
+        with self._lock:
+            self._terms, self._sizes, self._postings, self._exact = terms, sizes, postings, exact
+            self._normalized = normalized
+            self._forward, self._forward_ids = [k for k, _ in forward], [i for _, i in forward]
+            self._backward, self._backward_ids = [k for k, _ in backward], [i for _, i in backward]
+            self._built_version = version
+
+    def on_changes(self, changes: RestaurantChanges):
+        if changes.catalog:
+            with self._lock:
+                self._version += 1
+                self._changed_at = clock.time()
+
+    def match(self, db: Session, query: str, kind: Optional[str] = None, limit: int = DEFAULT_MATCHES) -> List[dict]:
+        """Ranked near matches of `query`, optionally limited to one term kind."""
+        if self._built_version != self._version:
+            self._rebuild(db)
+        query = normalize(query)
+        if not query:
+            return []
+        grams = trigrams(query)
+
+        with self._lock:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            scored = []
+            for i, count in shared.items():
+                term_kind, text, weight = self._terms[i]
+                if kind and term_kind != kind:
+                    continue
+                similarity = 2 * count / (len(grams) + self._sizes[i])
+                if similarity >= MIN_SIMILARITY:
+                    scored.append((similarity, weight, term_kind, text))
+
+        scored.sort(key=lambda m: (-m[0], -m[1], m[3].casefold()))
+        return [
+            {"text": text, "type": term_kind, "weight": weight, "similarity": round(similarity, 3)}
+            for similarity, weight, term_kind, text in scored[:limit]
+        ]
+
+    def _one_edit_away(self, query: str, kind: Optional[str]) -> List[int]:
+        """Terms one typo away from the normalized query."""
+        reversed_query = query[::-1]
+        with self._lock:
+            best = None
+            for split in range(1, len(query)):
+                starts = _prefix_range(self._forward, query[:split])
+                ends = _prefix_range(self._backward, reversed_query[:len(query) - split - 1])
+                if best is None or len(starts) + len(ends) < len(best[0]) + len(best[1]):
+                    best = (starts, ends)
+            if best is None:
+                return []
+            candidates = {self._forward_ids[j] for j in best[0]} | {self._backward_ids[j] for j in best[1]}
+            return [
+                i for i in candidates
+                if abs(len(self._normalized[i]) - len(query)) <= 1
+                and (not kind or self._terms[i][0] == kind)
+                and within_one_edit(query, self._normalized[i])
+            ]
+
+    def correct(self, db: Session, value: Optional[str], kind: Optional[str] = None) -> Optional[str]:
+        """
+        `value` if it is a known term, else the most similar term one typo away,
+        else its closest near match, else `value` unchanged.
+        """
+        if not value or not value.strip():
+            return value
+        if self._built_version != self._version:
+            self._rebuild(db)
+        kinds = [kind] if kind else ["city", "cuisine", "name"]
+        query = normalize(value)
+        if any((k, query) in self._exact for k in kinds):
+            return value
+        near = self._one_edit_away(query, kind)
+        if near:
+            grams = trigrams(query)
+            best = min(near, key=lambda i: (
+                -2 * len(grams & trigrams(self._normalized[i])) / (len(grams) + self._sizes[i]),
+                -self._terms[i][2], self._terms[i][1].casefold()
+            ))
+            return self._terms[best][1]
+        matches = self.match(db, value, kind, limit=1)
+        return matches[0]["text"] if matches else value
+
+
+# Shared fuzzy index, marked stale by committed catalog changes
+fuzzy_index = FuzzyIndex()
+on_restaurants_changed(fuzzy_index.on_changes)
@@ -0,0 +1,39 @@
+import csv
+import math
+import os
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Bundled offline centroids of every US zip code (zip_code,latitude,longitude),
+# exported from the `zipcodes` package; coordinates from GeoNames, CC BY 4.0
+ZIP_CENTROIDS_PATH = os.path.join(os.path.dirname(__file__), "..", "db", "data", "zip_centroids.csv")
+
+
+@lru_cache(maxsize=1)
+def _zip_centroids() -> Dict[str, Tuple[float, float]]:
+    with open(ZIP_CENTROIDS_PATH, newline="") as f:
+        return {row["zip_code"]: (float(row["latitude"]), float(row["longitude"])) for row in csv.DictReader(f)}
+
+# Look up the centroid of a zip code, None when it is not in the bundled table
+def zip_centroid(zip_code: Optional[str]) -> Optional[Tuple[float, float]]:
+    if not zip_code:
+        return None
+    return _zip_centroids().get(zip_code.strip()[:5])
+
+# Great-circle distance between two points in kilometres
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+# Bounding box (south, north, west, east) that contains every point within radius_km
+def bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    # Widen longitude by the latitude closest to a pole inside the box
+    max_abs_lat = min(abs(lat) + d_lat, 89.9)
+    d_lng = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(max_abs_lat))))
+    return (max(lat - d_lat, -90.0), min(lat + d_lat, 90.0), max(lng - d_lng, -180.0), min(lng + d_lng, 180.0))
@@ -0,0 +1,143 @@
+import heapq
+import logging
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+from app.db import models, database
+from app.db.shards import shard_router
+from app.utils.availability_index import availability_index
+from app.utils.time_slots import to_minute_of_day
+
+logger = logging.getLogger(__name__)
+
+# Default and longest hold on a slot during checkout (minutes)
+HOLD_MINUTES = 10
+MAX_HOLD_MINUTES = 30
+
+# Live holds one customer may have at a time
+MAX_HOLDS_PER_USER = 3
+
+
+# Delete an expired hold on exactly this slot, so a new hold or booking can take
+# the slot before the sweeper gets to it (the slot index is unique)
+def release_expired_hold(db, restaurant_id: int, table_id: int, day, slot_time, now: datetime):
+    db.query(models.Reservation).filter(
+        models.Reservation.table_id == table_id,
+        models.Reservation.date == day,
+        models.Reservation.time == slot_time,
+        models.Reservation.status == "held",
+        models.Reservation.hold_expires_at <= now
+    ).execution_options(restaurant_ids=[restaurant_id]).delete(synchronize_session=False)
+
+
+# Holds not yet released, expired or not, in expiry order; the ordering makes
+# SQLite read them from the (status, hold_expires_at) index instead of scanning
+def live_holds(rdb):
+    return rdb.query(
+        models.Reservation.hold_expires_at, models.Reservation.id, models.Reservation.restaurant_id,
+        models.Reservation.table_id, models.Reservation.date, models.Reservation.time
+    ).filter(models.Reservation.status == "held").order_by(models.Reservation.hold_expires_at)
+
+
+class HoldSweeper:
+    """
+    Deletes slot holds when they expire.
+
+    Holds are kept in a min-heap ordered by expiry; the sweeper thread sleeps
+    until the earliest one is due and deletes only the due holds, so expiry
+    never scans the reservations table. Holds that were confirmed or released
+    in the meantime are skipped by the delete's status/expiry filter.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, int, int, object, int]] = []
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, expires_at: datetime, hold_id: int, restaurant_id: int, table_id: int, day, minute: int):
+        with self._cond:
+            heapq.heappush(self._heap, (expires_at, hold_id, restaurant_id, table_id, day, minute))
+            # Wake the thread if this hold is now the first to expire
+            if self._heap[0][1] == hold_id:
+                self._cond.notify()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # Pick up holds left by a previous run, from every shard
+        db = database.SessionLocal()
+        try:
+            live = shard_router.gather(db, lambda rdb: live_holds(rdb).all())
+        finally:
+            db.close()
+        for expires_at, hold_id, restaurant_id, table_id, day, reserved_at in (h for rows in live for h in rows):
+            self.schedule(expires_at or datetime.now(), hold_id, restaurant_id, table_id, day, to_minute_of_day(reserved_at))
+
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="hold-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stop:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = (self._heap[0][0] - datetime.now()).total_seconds()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stop:
+                    return
+                due = []
+                now = datetime.now()
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap))
+            try:
+                self._sweep(due)
+            except Exception:
+                logger.exception("Hold sweeper error")
+
+    def _sweep(self, due: list):
+        by_id = {entry[1]: entry for entry in due}
+
+        # On each reservation shard, delete the due holds of its restaurants
+        def delete_expired(rdb, restaurant_ids: List[int]) -> List[int]:
+            expired = models.Reservation.id.in_([i for i, e in by_id.items() if e[2] in restaurant_ids]), \
+                models.Reservation.status == "held", models.Reservation.hold_expires_at <= datetime.now()
+            expired_ids = [hold_id for (hold_id,) in rdb.query(models.Reservation.id).filter(*expired)]
+            if expired_ids:
+                rdb.query(models.Reservation).filter(models.Reservation.id.in_(expired_ids)).execution_options(
+                    restaurant_ids=sorted({by_id[hold_id][2] for hold_id in expired_ids})
+                ).delete(synchronize_session=False)
+                rdb.commit()
+            return expired_ids
+
+        db = database.SessionLocal()
+        try:
+            expired_ids = [hold_id for ids in shard_router.gather_restaurants(
+                db, sorted({entry[2] for entry in due}), delete_expired
+            ) for hold_id in ids]
+        finally:
+            db.close()
+        if not expired_ids:
+            return
+
+        for hold_id in expired_ids:
+            _, _, restaurant_id, table_id, day, minute = by_id[hold_id]
+            availability_index.release_booking(restaurant_id, table_id, day, minute)
+        logger.info("Released %d expired holds", len(expired_ids))
+
+
+# Shared sweeper, started with the application
+hold_sweeper = HoldSweeper()
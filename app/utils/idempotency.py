@@ -0,0 +1,140 @@
+import hashlib
+import hmac
+import json
+import threading
+import time as clock
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from app.db import models
+from app.db.database import begin_immediate
+from app.auth.auth_handler import SECRET_KEY
+
+# Stored responses are replayed for this long
+IDEMPOTENCY_TTL = timedelta(hours=24)
+
+# Longest accepted Idempotency-Key header
+MAX_KEY_LENGTH = 255
+
+# Expired keys are deleted at most this often (seconds)
+PURGE_INTERVAL_SECONDS = 600
+
+# Status of a key claimed by a request that has not finished; the claim lapses after
+# CLAIM_SECONDS, so a request that died mid-way does not block its retries for long
+IN_PROGRESS = 102
+CLAIM_SECONDS = 60
+
+_purge_lock = threading.Lock()
+_last_purge: Dict[str, float] = {}  # per database (keys may be on reservation shards)
+
+
+def check_key(key: str):
+    if not key.strip() or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters.")
+
+
+# Keyed hash of the request, so stored hashes reveal nothing about bodies (passwords included)
+def request_hash(payload: dict) -> str:
+    body = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hmac.new(SECRET_KEY.encode(), body, hashlib.sha256).hexdigest()
+
+
+def find(db: Session, scope: str, key: str, req_hash: str) -> Optional[models.IdempotencyKey]:
+    """
+    The live stored entry for (scope, key), if any. A key reused with a
+    different request body is rejected with 422.
+    """
+    stored = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.scope == scope,
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.expires_at > datetime.now()
+    ).first()
+    if stored is not None and not hmac.compare_digest(stored.request_hash, req_hash):
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request.")
+    return stored
+
+
+def replay(stored: models.IdempotencyKey) -> JSONResponse:
+    return JSONResponse(
+        status_code=stored.status_code,
+        content=json.loads(stored.response_body),
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+
+def lookup(db: Session, scope: str, key: str, req_hash: str) -> Optional[JSONResponse]:
+    """Return the stored response for (scope, key) if there is a live one."""
+    stored = find(db, scope, key, req_hash)
+    return replay(stored) if stored is not None else None
+
+
+def claim(db: Session, scope: str, key: str, req_hash: str) -> Optional[JSONResponse]:
+    """
+    Bind (scope, key) to this request in a transaction of its own, for work
+    committed elsewhere (on a reservation shard). Returns the stored response
+    if the key has already completed; 409 while its first request is running.
+    Settle the claim with complete() or release().
+    """
+    begin_immediate(db)
+    try:
+        stored = find(db, scope, key, req_hash)
+        if stored is not None and stored.status_code == IN_PROGRESS:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress.")
+        if stored is not None:
+            return replay(stored)
+        store(db, scope, key, req_hash, IN_PROGRESS, None, ttl=timedelta(seconds=CLAIM_SECONDS))
+        db.commit()
+        return None
+    finally:
+        db.rollback()
+
+
+def complete(db: Session, scope: str, key: str, status_code: int, body: dict, ttl: timedelta = IDEMPOTENCY_TTL):
+    """Record the response of a claimed key."""
+    db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.scope == scope,
+        models.IdempotencyKey.key == key
+    ).update({
+        "status_code": status_code,
+        "response_body": json.dumps(body, default=str),
+        "expires_at": datetime.now() + ttl
+    }, synchronize_session=False)
+    db.commit()
+
+
+def release(db: Session, scope: str, key: str):
+    """Drop a claim whose request failed, so the key can be used again."""
+    db.rollback()
+    db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.scope == scope,
+        models.IdempotencyKey.key == key,
+        models.IdempotencyKey.status_code == IN_PROGRESS
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def store(db: Session, scope: str, key: str, req_hash: str, status_code: int, body: dict,
+          ttl: timedelta = IDEMPOTENCY_TTL):
+    """Record a response in the caller's transaction, replacing an expired entry for the key."""
+    _purge_expired(db)
+    db.merge(models.IdempotencyKey(
+        scope=scope,
+        key=key,
+        request_hash=req_hash,
+        status_code=status_code,
+        response_body=json.dumps(body, default=str),
+        expires_at=datetime.now() + ttl
+    ))
+
+
+def _purge_expired(db: Session):
+    bind = str(db.get_bind().url)
+    with _purge_lock:
+        if clock.monotonic() - _last_purge.get(bind, 0.0) < PURGE_INTERVAL_SECONDS:
+            return
+        _last_purge[bind] = clock.monotonic()
+    db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.expires_at <= datetime.now()
+    ).delete(synchronize_session=False)
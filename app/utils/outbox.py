@@ -0,0 +1,193 @@
+import json
+import logging
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+from sqlalchemy import func, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from app.db import models, database
+from app.db.database import begin_immediate
+from app.db.shards import shard_router
+from app.utils.email_utils import (
+    send_booking_confirmation, send_batch_booking_confirmation, send_booking_cancellation,
+    BatchBookingDetails, BookingConfirmationDetails
+)
+from app.utils.sms_utils import send_booking_sms
+
+logger = logging.getLogger(__name__)
+
+# Messages claimed per worker round trip
+OUTBOX_BATCH_SIZE = 20
+
+# Delivery threads draining the outbox
+OUTBOX_WORKERS = 2
+
+# Idle workers look for due messages this often (seconds); new messages wake them sooner
+OUTBOX_POLL_SECONDS = 5.0
+
+# A claimed message is handed to another worker if not settled within this time
+OUTBOX_LEASE_SECONDS = 120
+
+# Failed deliveries are retried after 30s, 60s, 120s... and dead-lettered after the last attempt
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_BASE_SECONDS = 30
+
+
+def _email(sender: Callable, details: type = BookingConfirmationDetails) -> Callable[[str, dict], None]:
+    # The email helpers report failures in their result instead of raising
+    def send(recipient: str, payload: dict):
+        result = sender(recipient, details(**payload))
+        if not result or not result.get("success"):
+            raise RuntimeError((result or {}).get("error", "email not sent"))
+    return send
+
+
+# Delivery function for each message kind: send(recipient, payload)
+SENDERS: Dict[str, Callable[[str, dict], None]] = {
+    "booking_confirmation": _email(send_booking_confirmation),
+    "batch_booking_confirmation": _email(send_batch_booking_confirmation, BatchBookingDetails),
+    "booking_cancellation": _email(send_booking_cancellation),
+    "booking_sms": lambda recipient, payload: send_booking_sms(recipient, **payload),
+}
+
+
+def enqueue(db: Session, kind: str, recipient: str, payload: dict):
+    """Add a message to the outbox in the caller's transaction; it is sent once that commits."""
+    now = datetime.now()
+    db.add(models.NotificationOutbox(
+        kind=kind,
+        recipient=recipient,
+        payload=json.dumps(payload),
+        status="pending",
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now
+    ))
+
+
+# Messages due for delivery, oldest first: new ones, and claimed ones whose lease ran out
+def due_messages(db: Session, now: datetime):
+    return db.query(models.NotificationOutbox).filter(
+        models.NotificationOutbox.status.in_(("pending", "sending")),
+        models.NotificationOutbox.next_attempt_at <= now
+    ).order_by(models.NotificationOutbox.next_attempt_at, models.NotificationOutbox.id).limit(OUTBOX_BATCH_SIZE)
+
+
+class OutboxWorker:
+    """
+    Background delivery of outbox messages.
+
+    Each worker thread claims a batch of due messages under the database write
+    lock (leasing them so a crashed worker's batch is picked up again), sends
+    them outside any transaction, and settles the whole batch in one update.
+    """
+
+    def __init__(self, workers: int = OUTBOX_WORKERS):
+        self.workers = workers
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    # Called after committing new messages so they go out without waiting for the poll
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delivered = self.drain_once()
+            except Exception:
+                logger.exception("Outbox worker error")
+                delivered = 0
+            if not delivered:
+                self._wake.wait(OUTBOX_POLL_SECONDS)
+                self._wake.clear()
+
+    def _claim(self, db: Session) -> List[tuple]:
+        now = datetime.now()
+        begin_immediate(db)
+        rows = due_messages(db, now).all()
+        batch = [(row.id, row.kind, row.recipient, row.payload, row.attempts) for row in rows]
+        for row in rows:
+            row.status = "sending"
+            row.next_attempt_at = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        db.commit()
+        return batch
+
+    def drain_once(self) -> int:
+        """Claim, send and settle one batch per database; returns the number of messages handled."""
+        # Messages are written with the booking, on its reservation shard when sharded;
+        # the main database keeps any queued before sharding was turned on
+        factories = [database.SessionLocal] + [shard.SessionLocal for shard in shard_router.shards]
+        return sum(self._drain(factory) for factory in factories)
+
+    def _drain(self, session_factory) -> int:
+        db = session_factory()
+        try:
+            try:
+                batch = self._claim(db)
+            except OperationalError:
+                # Another worker or a booking holds the write lock; try again next round
+                db.rollback()
+                return 0
+            if not batch:
+                return 0
+
+            settled = []
+            for message_id, kind, recipient, payload, attempts in batch:
+                settled.append(self._deliver(message_id, kind, recipient, payload, attempts))
+
+            db.execute(update(models.NotificationOutbox), settled)
+            db.commit()
+            return len(batch)
+        finally:
+            db.close()
+
+    def _deliver(self, message_id: int, kind: str, recipient: str, payload: str, attempts: int) -> dict:
+        attempts += 1
+        try:
+            sender = SENDERS.get(kind)
+            if sender is None:
+                raise LookupError(f"no sender for {kind}")
+            sender(recipient, json.loads(payload))
+            return {"id": message_id, "status": "sent", "attempts": attempts, "sent_at": datetime.now(), "last_error": None}
+        except Exception as e:
+            logger.exception("Outbox delivery of message %s (%s) failed", message_id, kind)
+            if isinstance(e, LookupError) or attempts >= OUTBOX_MAX_ATTEMPTS:
+                return {"id": message_id, "status": "dead", "attempts": attempts, "last_error": str(e)}
+            delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1) * (1 + random.random() / 2)
+            return {
+                "id": message_id,
+                "status": "pending",
+                "attempts": attempts,
+                "next_attempt_at": datetime.now() + timedelta(seconds=delay),
+                "last_error": str(e)
+            }
+
+
+# Message counts per status, for monitoring
+def outbox_stats(db: Session) -> Dict[str, int]:
+    return dict(db.query(models.NotificationOutbox.status, func.count(models.NotificationOutbox.id))
+                .group_by(models.NotificationOutbox.status).all())
+
+
+# Shared worker pool, started with the application
+outbox_worker = OutboxWorker()
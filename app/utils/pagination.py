@@ -0,0 +1,25 @@
+import base64
+import json
+from typing import Any, List
+
+# Largest page a client may ask for; larger limits are rejected
+MAX_PAGE_SIZE = 100
+DEFAULT_PAGE_SIZE = 20
+
+
+# Encode a keyset position (last sort key of a page) as an opaque URL-safe cursor
+def encode_cursor(mode: str, key: List[Any]) -> str:
+    raw = json.dumps({"m": mode, "k": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+# Decode a cursor produced by encode_cursor for the same sort mode, raising ValueError otherwise
+def decode_cursor(cursor: str, mode: str) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = data["k"]
+    except Exception:
+        raise ValueError("Malformed cursor")
+    if data.get("m") != mode or not isinstance(key, list):
+        raise ValueError("Cursor does not match this search")
+    return key
@@ -0,0 +1,194 @@
+import logging
+import math
+import threading
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from app.db import models, database
+from app.db.database import begin_immediate, retry_on_lock
+from app.db.shards import shard_router
+
+logger = logging.getLogger(__name__)
+
+# Bayesian prior: every restaurant starts with this many virtual reviews at this rating
+PRIOR_REVIEWS = 5
+PRIOR_RATING = 3.5
+
+# Booking heat halves every this many days
+HEAT_HALF_LIFE_DAYS = 14.0
+
+# Weight of log(1 + heat) against the 1-5 star rating
+HEAT_WEIGHT = 0.5
+
+# Stored scores are re-decayed for the whole catalog this often (seconds)
+RANK_REFRESH_SECONDS = 3600
+
+
+# Average rating pulled towards the prior, so a single 5-star review does not top the list
+def bayesian_rating(review_sum: int, review_count: int) -> float:
+    return (PRIOR_REVIEWS * PRIOR_RATING + review_sum) / (PRIOR_REVIEWS + review_count)
+
+
+# Heat decayed from `updated_at` to `now`
+def decayed_heat(heat: float, updated_at: Optional[datetime], now: datetime) -> float:
+    if not heat or updated_at is None:
+        return 0.0
+    age_days = max((now - updated_at).total_seconds(), 0) / 86400
+    return heat * 0.5 ** (age_days / HEAT_HALF_LIFE_DAYS)
+
+
+def rank_score(review_sum: int, review_count: int, heat: float, updated_at: Optional[datetime], now: datetime) -> float:
+    return bayesian_rating(review_sum, review_count) + HEAT_WEIGHT * math.log1p(decayed_heat(heat, updated_at, now))
+
+
+# Recompute the stored score of one restaurant from its stored aggregates
+def update_rank(restaurant: models.Restaurant, now: Optional[datetime] = None):
+    now = now or datetime.now()
+    restaurant.rank_score = rank_score(
+        restaurant.review_sum or 0, restaurant.review_count or 0,
+        restaurant.booking_heat or 0.0, restaurant.heat_updated_at, now
+    )
+
+
+# Fold a new review into the restaurant's aggregates with an atomic increment, then
+# derive rating and score from the values it returns; atomic within the caller's transaction
+def apply_review(db: Session, restaurant_id: int, rating: int, now: Optional[datetime] = None):
+    now = now or datetime.now()
+    restaurant = models.Restaurant
+    review_count, review_sum, heat, updated_at = db.execute(
+        update(restaurant)
+        .where(restaurant.id == restaurant_id)
+        .values(
+            review_count=func.coalesce(restaurant.review_count, 0) + 1,
+            review_sum=func.coalesce(restaurant.review_sum, 0) + rating
+        )
+        .returning(restaurant.review_count, restaurant.review_sum, restaurant.booking_heat, restaurant.heat_updated_at)
+        .execution_options(synchronize_session=False, restaurant_ids=[restaurant_id])
+    ).one()
+    db.execute(
+        update(restaurant)
+        .where(restaurant.id == restaurant_id)
+        .values(
+            rating=round(review_sum / review_count, 1),
+            rank_score=rank_score(review_sum, review_count, heat or 0.0, updated_at, now)
+        )
+        .execution_options(synchronize_session=False, restaurant_ids=[restaurant_id])
+    )
+
+
+# Column values after folding new bookings into a restaurant's decayed heat and score
+def booking_values(review_sum: int, review_count: int, heat: float, updated_at: Optional[datetime],
+                   now: Optional[datetime] = None, bookings: int = 1) -> dict:
+    now = now or datetime.now()
+    heat = decayed_heat(heat or 0.0, updated_at, now) + bookings
+    return {
+        "booking_heat": heat,
+        "heat_updated_at": now,
+        "rank_score": rank_score(review_sum or 0, review_count or 0, heat, now, now)
+    }
+
+
+def recompute_rank_scores(db: Session, restaurant_ids: Optional[Iterable[int]] = None, now: Optional[datetime] = None):
+    """
+    Rebuild review aggregates and booking heat from the reviews and
+    reservations tables (initial backfill). Reservations count from their
+    date, since bookings do not record when they were made.
+    """
+    now = now or datetime.now()
+    reviews = db.query(
+        models.Review.restaurant_id, func.count(models.Review.id), func.coalesce(func.sum(models.Review.rating), 0)
+    ).group_by(models.Review.restaurant_id)
+    restaurants = db.query(models.Restaurant)
+    if restaurant_ids is not None:
+        restaurant_ids = list(restaurant_ids)
+        reviews = reviews.filter(models.Review.restaurant_id.in_(restaurant_ids))
+        restaurants = restaurants.filter(models.Restaurant.id.in_(restaurant_ids))
+
+    # Bookings from every reservation shard
+    def booked(rdb: Session):
+        bookings = rdb.query(models.Reservation.restaurant_id, models.Reservation.date).filter(
+            models.Reservation.status == "confirmed"
+        )
+        if restaurant_ids is not None:
+            bookings = bookings.filter(models.Reservation.restaurant_id.in_(restaurant_ids))
+        return bookings.all()
+
+    review_stats = {rid: (count, total) for rid, count, total in reviews.all()}
+    heat = {}
+    for rid, day in (b for rows in shard_router.gather(db, booked) for b in rows):
+        booked_at = datetime.combine(day, datetime.min.time()) if day else now
+        heat[rid] = heat.get(rid, 0.0) + decayed_heat(1.0, booked_at, now)
+
+    for restaurant in restaurants.all():
+        restaurant.review_count, restaurant.review_sum = review_stats.get(restaurant.id, (0, 0))
+        restaurant.booking_heat = heat.get(restaurant.id, 0.0)
+        restaurant.heat_updated_at = now
+        update_rank(restaurant, now)
+
+
+def refresh_rank_scores(db: Session) -> int:
+    """
+    Re-decay every stored score to the current time. Scores only change on
+    review and booking events otherwise, so restaurants whose bookings are
+    getting old would keep their rank. Reads and rewrites the scores under the
+    write lock, so a booking's heat bump is never overwritten with a stale one;
+    returns the number of restaurants refreshed.
+    """
+    def refresh() -> int:
+        begin_immediate(db)
+        now = datetime.now()
+        rows = db.query(
+            models.Restaurant.id, models.Restaurant.review_sum, models.Restaurant.review_count,
+            models.Restaurant.booking_heat, models.Restaurant.heat_updated_at
+        ).all()
+        if rows:
+            # Bulk UPDATE by primary key; the restaurant ids let the response cache drop what it holds
+            db.execute(
+                update(models.Restaurant).execution_options(restaurant_ids=[r.id for r in rows]),
+                [
+                    {"id": r.id, "rank_score": rank_score(r.review_sum or 0, r.review_count or 0, r.booking_heat or 0.0, r.heat_updated_at, now)}
+                    for r in rows
+                ]
+            )
+        db.commit()
+        return len(rows)
+
+    return retry_on_lock(db, refresh)
+
+
+class RankRefresher:
+    """Background thread re-decaying the stored rank scores every RANK_REFRESH_SECONDS."""
+
+    def __init__(self, interval: float = RANK_REFRESH_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rank-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db = database.SessionLocal()
+            try:
+                refreshed = refresh_rank_scores(db)
+                logger.info("Refreshed rank scores of %d restaurants", refreshed)
+            except Exception:
+                logger.exception("Rank score refresh failed")
+            finally:
+                db.close()
+
+
+# Shared refresher, started with the application
+rank_refresher = RankRefresher()
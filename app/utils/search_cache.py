@@ -0,0 +1,123 @@
+import threading
+import time as clock
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+from app.db.events import RestaurantChanges, on_restaurants_changed
+
+# Default lifetime and size of cached responses
+CACHE_TTL_SECONDS = 300
+CACHE_MAX_ENTRIES = 2048
+
+
+class ResponseCache:
+    """
+    LRU cache with TTL for endpoint responses.
+
+    Each entry is tagged with the restaurant ids it contains. Committed
+    changes drop the entries that show a touched restaurant; catalog changes
+    (restaurants added, removed or re-described) also drop every entry marked
+    as a search, since any result set may now differ. A response computed
+    before a change is not stored if the change would have dropped it, which
+    is tracked per restaurant so a booking at one restaurant does not keep
+    every other search out of the cache.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # Each invalidation gets the next sequence number; the marks record the
+        # (sequence, wall-clock time) of the last change of each kind
+        self._sequence = 0
+        self._everything: Tuple[int, float] = (0, 0.0)
+        self._catalog: Tuple[int, float] = (0, 0.0)
+        self._changed: Dict[int, Tuple[int, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < clock.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    # Token to pass to put(); a put is dropped if a change that touches it was invalidated in between
+    def generation(self) -> int:
+        with self._lock:
+            return self._sequence
+
+    # `as_of` is when the value's data was current (read replicas lag the primary);
+    # values older than the last change that touches them are not stored
+    def put(self, key: Hashable, value: Any, restaurant_ids: Iterable[int], is_search: bool, generation: int,
+            as_of: Optional[float] = None):
+        restaurant_ids = frozenset(restaurant_ids)
+        with self._lock:
+            marks = [self._everything] + ([self._catalog] if is_search else []) + [
+                self._changed[rid] for rid in restaurant_ids if rid in self._changed
+            ]
+            if any(sequence > generation or (as_of is not None and as_of < at) for sequence, at in marks):
+                return
+            self._entries[key] = (clock.monotonic() + self.ttl, value, restaurant_ids, is_search)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, changes: RestaurantChanges):
+        with self._lock:
+            self._sequence += 1
+            mark = (self._sequence, clock.time())
+            if changes.ids is None:
+                self._everything = mark
+            else:
+                for restaurant_id in changes.ids:
+                    self._changed[restaurant_id] = mark
+            if changes.catalog:
+                self._catalog = mark
+            stale = [
+                key for key, (_, _, ids, is_search) in self._entries.items()
+                if (changes.catalog and is_search) or changes.touches(ids)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._sequence += 1
+            self._everything = (self._sequence, clock.time())
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidated_entries": self.invalidations
+            }
+
+
+# Shared cache for /restaurants/search and /restaurants/{id}
+restaurant_cache = ResponseCache()
+on_restaurants_changed(restaurant_cache.invalidate)
+
+
+# Normalize query parameters into a cache key (case and whitespace insensitive)
+def cache_key(endpoint: str, **params) -> tuple:
+    normalized = []
+    for name, value in sorted(params.items()):
+        if isinstance(value, str):
+            value = " ".join(value.lower().split()) or None
+        if value is not None:
+            normalized.append((name, value))
+    return (endpoint, tuple(normalized))
@@ -0,0 +1,109 @@
+import threading
+import time as clock
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from heapq import nsmallest
+from typing import List, Tuple
+from sqlalchemy.orm import Session
+from app.db import models
+from app.db.events import RestaurantChanges, on_restaurants_changed
+from app.db.session import session_as_of
+
+# Restaurant columns offered as completions, with the label returned for each
+TERM_KINDS = (("city", models.Restaurant.city), ("cuisine", models.Restaurant.cuisine), ("name", models.Restaurant.name))
+
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+
+
+# Case- and accent-insensitive form used for matching
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).casefold().split())
+
+
+def load_search_terms(db: Session) -> List[Tuple[str, str, int]]:
+    """
+    Distinct (kind, text, weight) search terms, where weight is the number of
+    restaurants carrying the term. Case variants are merged under their most
+    common spelling.
+    """
+    terms = []
+    for kind, column in TERM_KINDS:
+        spellings = {}
+        for value, count in Counter(v for (v,) in db.query(column).filter(column.isnot(None)) if v.strip()).items():
+            spellings.setdefault(normalize(value), Counter())[value.strip()] += count
+        for variants in spellings.values():
+            terms.append((kind, variants.most_common(1)[0][0], sum(variants.values())))
+    return terms
+
+
+class SuggestIndex:
+    """
+    Typeahead over city, cuisine and restaurant name terms.
+
+    Every word start of every term is a key in one sorted array, so a prefix
+    lookup is a bisect plus a scan over the matching keys. The index is
+    rebuilt on the first lookup after a committed catalog change, from the
+    lookup's session unless it is a replica that predates the change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._built_version = -1
+        self._changed_at = 0.0
+        self._keys: List[str] = []
+        self._owners: List[int] = []
+        self._terms: List[Tuple[str, str, int]] = []
+
+    def _rebuild(self, db: Session):
+        version = self._version
+        with session_as_of(db, self._changed_at) as source:
+            terms = load_search_terms(source)
+        entries = []
+        for i, (_, text, _) in enumerate(terms):
+            words = normalize(text).split(" ")
+            for start in range(len(words)):
+                entries.append((" ".join(words[start:]), i))
+        entries.sort()
+        with self._lock:
+            self._terms = terms
+            self._keys = [key for key, _ in entries]
+            self._owners = [owner for _, owner in entries]
+            # A change committed while loading leaves the index stale for the next lookup
+            self._built_version = version
+
+    def on_changes(self, changes: RestaurantChanges):
+        if changes.catalog:
+            with self._lock:
+                self._version += 1
+                self._changed_at = clock.time()
+
+    def suggest(self, db: Session, prefix: str, limit: int = DEFAULT_SUGGESTIONS) -> List[dict]:
+        if self._built_version != self._version:
+            self._rebuild(db)
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        with self._lock:
+            matched = set()
+            i = bisect_left(self._keys, prefix)
+            while i < len(self._keys) and self._keys[i].startswith(prefix):
+                matched.add(self._owners[i])
+                i += 1
+            terms = [self._terms[owner] for owner in matched]
+
+        # Heaviest first; whole-term prefix matches ahead of inner-word matches
+        best = nsmallest(
+            limit, terms,
+            key=lambda term: (-term[2], not normalize(term[1]).startswith(prefix), term[1].casefold())
+        )
+        return [{"text": text, "type": kind, "weight": weight} for kind, text, weight in best]
+
+
+# Shared typeahead index, marked stale by committed catalog changes
+suggest_index = SuggestIndex()
+on_restaurants_changed(suggest_index.on_changes)
@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import Iterable, List, Optional
+from app.db import models
+
+
+# Convert a time object to minutes since midnight
+def to_minute_of_day(value) -> int:
+    return value.hour * 60 + value.minute
+
+# Parse an "HH:MM" slot string to minutes since midnight, None if malformed
+def parse_slot(value: str) -> Optional[int]:
+    try:
+        return to_minute_of_day(datetime.strptime(value.strip(), "%H:%M"))
+    except ValueError:
+        return None
+
+# Format minutes since midnight back to "HH:MM"
+def format_slot(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+# Build TableSlot rows from "HH:MM" strings, dropping malformed and duplicate entries
+def build_table_slots(times: Iterable[str]) -> List[models.TableSlot]:
+    minutes = {parse_slot(t) for t in times}
+    minutes.discard(None)
+    return [models.TableSlot(minute_of_day=m) for m in sorted(minutes)]
@@ -0,0 +1,70 @@
+import logging
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.db import models
+from app.utils import outbox
+from app.utils.booking_counter import booking_counter
+from app.utils.availability_index import find_conflict
+from app.utils.email_utils import reservation_details
+from app.utils.time_slots import to_minute_of_day
+
+logger = logging.getLogger(__name__)
+
+# Start times within this many minutes either side of the requested time are accepted
+WAITLIST_WINDOW_MINUTES = 30
+MAX_WAITLIST_WINDOW_MINUTES = 120
+
+# Open waitlist entries one customer may have at a time
+MAX_WAITLIST_ENTRIES_PER_USER = 5
+
+
+# Longest-waiting entries whose window covers `minute` and whose party fits a table of `size`;
+# equality on (restaurant, date, status), range on the window, party size from the index entry
+def waiting_for(rdb: Session, restaurant_id: int, day, minute: int, size: int):
+    return rdb.query(models.WaitlistEntry).filter(
+        models.WaitlistEntry.restaurant_id == restaurant_id,
+        models.WaitlistEntry.date == day,
+        models.WaitlistEntry.status == "waiting",
+        models.WaitlistEntry.start_minute <= minute,
+        models.WaitlistEntry.end_minute >= minute,
+        models.WaitlistEntry.party_size <= size
+    ).order_by(models.WaitlistEntry.id)
+
+
+def promote_next(db: Session, rdb: Session, table: models.Table, day, slot_time) -> Optional[models.Reservation]:
+    """
+    Book a freed (table, day, slot_time) for the longest-waiting customer whose
+    window covers the slot and whose party fits the table, and queue their
+    confirmation. Runs inside the caller's write transaction on `rdb` (the
+    session holding the restaurant's reservations; `db` is the main database),
+    so the promotion commits or rolls back with the cancellation that freed the slot.
+    """
+    waiter = waiting_for(rdb, table.restaurant_id, day, to_minute_of_day(slot_time), table.size).first()
+    if not waiter:
+        return None
+
+    # A later booking on the table may still overlap the freed hour
+    if find_conflict(rdb, table.id, datetime.combine(day, slot_time)):
+        return None
+
+    reservation = models.Reservation(
+        user_id=waiter.user_id,
+        restaurant_id=table.restaurant_id,
+        table_id=table.id,
+        date=day,
+        time=slot_time,
+        number_of_people=waiter.party_size,
+        status="confirmed"
+    )
+    rdb.add(reservation)
+    rdb.flush()
+    waiter.status = "promoted"
+    waiter.reservation_id = reservation.id
+
+    booking_counter.record(rdb, table.restaurant_id, added=1)
+
+    outbox.enqueue(rdb, "booking_confirmation", db.get(models.User, waiter.user_id).email,
+                   reservation_details(reservation, table.restaurant).dict())
+    logger.info("Promoted waitlist entry %d to reservation %d", waiter.id, reservation.id)
+    return reservation
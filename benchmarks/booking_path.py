@@ -0,0 +1,242 @@
+"""
+Cost of one successful booking: the original path (commit, refresh, get, then a
+second commit for total_bookings += 1) against the single transaction with an
+atomic counter update, plus the booking endpoint end to end.
+
+    python -m benchmarks.booking_path [--bookings 500] [--threads 8]
+
+Commits are where the two paths differ most; run with SQLITE_SYNCHRONOUS=FULL
+to have every commit wait for its fsync. Runs against a throwaway database in a
+temporary directory; booktable.db is not touched.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+workdir = tempfile.mkdtemp(prefix="bench_booking_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from app.auth.auth_handler import hash_password  # noqa: E402
+from app.db import models  # noqa: E402
+from app.db.database import SessionLocal, begin_immediate, engine  # noqa: E402
+from app.db.migrations import run_migrations  # noqa: E402
+from app.utils import holds, outbox, ranking  # noqa: E402
+from app.utils.availability_index import find_conflict  # noqa: E402
+from app.utils.booking_counter import booking_counter  # noqa: E402
+from app.utils.email_utils import BookingConfirmationDetails  # noqa: E402
+from app.utils.time_slots import build_table_slots  # noqa: E402
+
+TABLES = 40
+SLOT_TIMES = [f"{hour:02d}:00" for hour in range(24)]
+
+
+# Statements and commits sent to the database for the booking being measured: by this
+# thread, or by the request's AnyIO worker threads, not the app's background workers
+COUNTED_THREADS = ("MainThread", "AnyIO worker thread")
+tally = {"statements": 0, "commits": 0}
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if threading.current_thread().name in COUNTED_THREADS:
+        tally["statements"] += 1
+
+
+@event.listens_for(engine, "commit")
+def _count_commit(conn):
+    if threading.current_thread().name in COUNTED_THREADS:
+        tally["commits"] += 1
+
+
+def measure(book, targets) -> tuple:
+    """Mean statements, commits and latency (ms), and p95 latency of book(target) over the targets."""
+    statements, commits, latencies = [], [], []
+    for target in targets:
+        tally.update(statements=0, commits=0)
+        started = time.perf_counter()
+        book(target)
+        latencies.append((time.perf_counter() - started) * 1000)
+        statements.append(tally["statements"])
+        commits.append(tally["commits"])
+    return statistics.mean(statements), statistics.mean(commits), statistics.mean(latencies), \
+        sorted(latencies)[int(len(latencies) * 0.95)]
+
+
+def build_restaurant() -> tuple:
+    db = SessionLocal()
+    try:
+        customer = models.User(email="diner@example.com", hashed_password=hash_password("Passw0rd!"),
+                               full_name="Diner", role="Customer")
+        restaurant = models.Restaurant(name="Bench Bistro", cuisine="Test", cost_rating=2, city="San Jose",
+                                       state="CA", zip_code="95113", rating=4.0, total_bookings=0)
+        db.add_all([customer, restaurant])
+        db.flush()
+        for _ in range(TABLES):
+            db.add(models.Table(restaurant_id=restaurant.id, size=4, available_times=",".join(SLOT_TIMES),
+                                slots=build_table_slots(SLOT_TIMES)))
+        db.commit()
+        table_ids = [t.id for t in db.query(models.Table.id).filter(models.Table.restaurant_id == restaurant.id)]
+        return customer.id, restaurant.id, table_ids
+    finally:
+        db.close()
+
+
+# Distinct (table, date, time) slots, a new day once every table's slots are used
+def slots(table_ids, count, first_day):
+    per_day = len(table_ids) * len(SLOT_TIMES)
+    return [
+        (table_ids[i % len(table_ids)], first_day + timedelta(days=i // per_day),
+         datetime.strptime(SLOT_TIMES[(i // len(table_ids)) % len(SLOT_TIMES)], "%H:%M").time())
+        for i in range(count)
+    ]
+
+
+def confirmation(name, reservation_id, table_id, day, at) -> dict:
+    return BookingConfirmationDetails(
+        id=str(reservation_id), restaurant_name=name, date=day.strftime("%A, %B %d, %Y"),
+        time=at.strftime("%H:%M"), people=2, table_type=f"Table #{table_id}", address="San Jose, CA 95113"
+    ).dict()
+
+
+# The booking in its original shape, doing today's work: the reservation is
+# committed first (then refreshed and fetched again), and the counter and heat
+# are a read-modify-write of the restaurant committed with the outbox row after it
+def legacy_booking(db, user_id, restaurant_id, table_id, day, at):
+    restaurant = db.query(models.Restaurant).filter(models.Restaurant.id == restaurant_id).first()
+    start = datetime.combine(day, at)
+    if find_conflict(db, table_id, start):
+        return
+    holds.release_expired_hold(db, restaurant_id, table_id, day, at, datetime.now())
+    reservation = models.Reservation(user_id=user_id, restaurant_id=restaurant_id, table_id=table_id,
+                                     date=day, time=at, number_of_people=2, status="confirmed")
+    db.add(reservation)
+    db.flush()
+    db.commit()
+    db.refresh(reservation)
+    db.query(models.Reservation).get(reservation.id)
+    restaurant.total_bookings += 1
+    for column, value in ranking.booking_values(restaurant.review_sum, restaurant.review_count,
+                                                restaurant.booking_heat, restaurant.heat_updated_at).items():
+        setattr(restaurant, column, value)
+    outbox.enqueue(db, "booking_confirmation", "diner@example.com", confirmation(restaurant.name, reservation.id,
+                                                                                 table_id, day, at))
+    db.commit()
+
+
+# The booking as book_table does it now: conflict check, insert, atomic counter
+# update and the confirmation's outbox row in one write transaction
+def single_transaction_booking(db, user_id, restaurant_id, table_id, day, at):
+    restaurant = db.query(models.Restaurant).filter(models.Restaurant.id == restaurant_id).first()
+    name = restaurant.name
+    begin_immediate(db)
+    start = datetime.combine(day, at)
+    if find_conflict(db, table_id, start):
+        db.rollback()
+        return
+    holds.release_expired_hold(db, restaurant_id, table_id, day, at, datetime.now())
+    reservation = models.Reservation(user_id=user_id, restaurant_id=restaurant_id, table_id=table_id,
+                                     date=day, time=at, number_of_people=2, status="confirmed")
+    db.add(reservation)
+    db.flush()
+    booking_counter.record(db, restaurant_id, added=1)
+    outbox.enqueue(db, "booking_confirmation", "diner@example.com", confirmation(name, reservation.id, table_id, day, at))
+    db.commit()
+
+
+def counts(restaurant_id) -> tuple:
+    """The restaurant's total_bookings and its actual number of reservations."""
+    db = SessionLocal()
+    try:
+        total = db.query(models.Restaurant.total_bookings).filter(models.Restaurant.id == restaurant_id).scalar()
+        made = db.query(models.Reservation).filter(models.Reservation.restaurant_id == restaurant_id).count()
+        return total, made
+    finally:
+        db.close()
+
+
+def sequential(book, user_id, restaurant_id, targets):
+    db = SessionLocal()
+    try:
+        return measure(lambda target: book(db, user_id, restaurant_id, *target), targets)
+    finally:
+        db.close()
+
+
+# Bookings of distinct slots from several threads at once; returns the counter's
+# shortfall against the reservations made, and the bookings that failed outright
+def concurrent(book, user_id, restaurant_id, targets, threads):
+    total_before, made_before = counts(restaurant_id)
+    errors = 0
+    lock = threading.Lock()
+
+    def attempt(target):
+        nonlocal errors
+        db = SessionLocal()
+        try:
+            book(db, user_id, restaurant_id, *target)
+        except Exception:
+            db.rollback()
+            with lock:
+                errors += 1
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(attempt, targets))
+    total_after, made_after = counts(restaurant_id)
+    return (made_after - made_before) - (total_after - total_before), errors
+
+
+def endpoint(restaurant_id, targets):
+    from app.main import app
+
+    with TestClient(app) as client:
+        token = client.post("/users/login", json={"email": "diner@example.com", "password": "Passw0rd!"}).json()
+        headers = {"Authorization": f"Bearer {token['access_token']}"}
+
+        def book(target):
+            table_id, day, at = target
+            response = client.post(f"/restaurants/{restaurant_id}/book", headers=headers, json={
+                "table_id": table_id, "date": day.isoformat(), "time": at.strftime("%H:%M"), "number_of_people": 2
+            })
+            assert response.status_code == 200, response.text
+
+        return measure(book, targets)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    user_id, restaurant_id, table_ids = build_restaurant()
+    per_run = args.bookings
+    targets = slots(table_ids, per_run * 5, date.today() + timedelta(days=1))
+    runs = [targets[i * per_run:(i + 1) * per_run] for i in range(5)]
+
+    print(f"SQLite synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}, {per_run} bookings per run")
+    print(f"{'path':>20} {'statements':>11} {'commits':>8} {'mean ms':>8} {'p95 ms':>7} {'lost counts':>12} {'errors':>7}")
+    for name, book, sequential_run, concurrent_run in (
+        ("two commits", legacy_booking, runs[0], runs[1]),
+        ("single transaction", single_transaction_booking, runs[2], runs[3]),
+    ):
+        statements, commits, mean, p95 = sequential(book, user_id, restaurant_id, sequential_run)
+        lost, errors = concurrent(book, user_id, restaurant_id, concurrent_run, args.threads)
+        print(f"{name:>20} {statements:>11.1f} {commits:>8.1f} {mean:>8.2f} {p95:>7.2f} {lost:>12} {errors:>7}")
+
+    # The whole request: auth, validation reads and the booking transaction
+    statements, commits, mean, p95 = endpoint(restaurant_id, runs[4][:min(per_run, 200)])
+    print(f"{'POST /book':>20} {statements:>11.1f} {commits:>8.1f} {mean:>8.2f} {p95:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Reads and writes at the same time against the original engine (rollback journal,
+synchronous=FULL, default pool) and the engine make_engine builds from the
+environment (WAL, NORMAL sync, busy timeout, sized pool).
+
+    python -m benchmarks.db_concurrency [--readers 8] [--writers 4] [--seconds 5]
+
+Set SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, DB_POOL_SIZE etc. to measure other
+settings for the configured engine. Each engine gets its own throwaway database
+in a temporary directory; booktable.db is not touched.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+workdir = tempfile.mkdtemp(prefix="bench_concurrency_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+from sqlalchemy import create_engine, event, text  # noqa: E402
+from app.db import database  # noqa: E402
+from app.db.database import is_locked_error, make_engine, pool_stats  # noqa: E402
+
+TABLES = 40
+DAYS = 30
+
+
+# The engine as the app first created it: SQLite's defaults and SQLAlchemy's default pool
+def original_engine(url):
+    new_engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    @event.listens_for(new_engine, "connect")
+    def _rollback_journal(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=DELETE")
+        cursor.execute("PRAGMA synchronous=FULL")
+        cursor.close()
+
+    return new_engine
+
+
+def prepare(target):
+    with target.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE bench_reservations (id INTEGER PRIMARY KEY, table_id INTEGER, day INTEGER, "
+            "minute INTEGER, people INTEGER)"
+        ))
+        conn.execute(text("CREATE INDEX ix_bench_reservations_slot ON bench_reservations (table_id, day, minute)"))
+        conn.execute(text("INSERT INTO bench_reservations (table_id, day, minute, people) VALUES "
+                          "(:table_id, :day, :minute, 2)"),
+                     [{"table_id": t, "day": d, "minute": 18 * 60} for t in range(TABLES) for d in range(DAYS)])
+
+
+def run(target, readers: int, writers: int, seconds: float) -> dict:
+    """Availability-style reads and booking-style inserts from concurrent threads for the given time."""
+    stop = time.perf_counter() + seconds
+    read_ms, writes, errors, peak = [], [0], {"locked": 0, "other": 0}, [0]
+    lock = threading.Lock()
+
+    @event.listens_for(target, "checkout")
+    def _track_checkouts(dbapi_connection, connection_record, connection_proxy):
+        with lock:
+            peak[0] = max(peak[0], getattr(target.pool, "checkedout", lambda: 0)())
+
+    def reader():
+        latencies = []
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                with target.connect() as conn:
+                    conn.execute(text("SELECT count(*) FROM bench_reservations WHERE table_id = :table_id "
+                                      "AND day = :day"), {"table_id": random.randrange(TABLES),
+                                                          "day": random.randrange(DAYS)}).scalar()
+            except Exception as e:
+                with lock:
+                    errors["locked" if is_locked_error(e) else "other"] += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+        with lock:
+            read_ms.extend(latencies)
+
+    def writer():
+        done = 0
+        while time.perf_counter() < stop:
+            try:
+                with target.begin() as conn:
+                    conn.execute(text("INSERT INTO bench_reservations (table_id, day, minute, people) VALUES "
+                                      "(:table_id, :day, :minute, 2)"),
+                                 {"table_id": random.randrange(TABLES), "day": random.randrange(DAYS),
+                                  "minute": random.randrange(24 * 60)})
+                done += 1
+            except Exception as e:
+                with lock:
+                    errors["locked" if is_locked_error(e) else "other"] += 1
+        with lock:
+            writes[0] += done
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + \
+              [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    event.remove(target, "checkout", _track_checkouts)
+    return {
+        "reads": len(read_ms) / seconds, "writes": writes[0] / seconds,
+        "mean": statistics.mean(read_ms) if read_ms else 0.0,
+        "p95": sorted(read_ms)[int(len(read_ms) * 0.95)] if read_ms else 0.0,
+        "locked": errors["locked"], "other": errors["other"], "peak": peak[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    random.seed(42)
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per engine; configured engine: "
+          f"journal_mode={database.SQLITE_JOURNAL_MODE} synchronous={database.SQLITE_SYNCHRONOUS} "
+          f"busy_timeout={database.SQLITE_BUSY_TIMEOUT_MS}ms pool={database.DB_POOL_SIZE}+{database.DB_MAX_OVERFLOW}")
+    print(f"{'engine':>11} {'reads/s':>9} {'writes/s':>9} {'read ms':>8} {'p95 ms':>7} {'locked':>7} {'other':>6} "
+          f"{'peak conns':>11} {'pool':>6}")
+    for name, build in (("original", original_engine), ("configured", make_engine)):
+        target = build(f"sqlite:///{os.path.join(workdir, name + '.db')}")
+        try:
+            prepare(target)
+            result = run(target, args.readers, args.writers, args.seconds)
+            stats = pool_stats(target)
+            print(f"{name:>11} {result['reads']:>9.0f} {result['writes']:>9.0f} {result['mean']:>8.2f} "
+                  f"{result['p95']:>7.2f} {result['locked']:>7} {result['other']:>6} {result['peak']:>11} "
+                  f"{stats.get('size', '-'):>6}")
+        finally:
+            target.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Typo-tolerant lookup cost as the catalog grows: the trigram posting-list index
+against comparing the query with every term.
+
+    python -m benchmarks.fuzzy_lookup [--sizes 1000,10000,100000] [--queries 300]
+
+Runs against a throwaway database in a temporary directory; booktable.db is not touched.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+workdir = tempfile.mkdtemp(prefix="bench_fuzzy_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+from sqlalchemy import insert  # noqa: E402
+from app.db import models  # noqa: E402
+from app.db.database import SessionLocal, engine  # noqa: E402
+from app.db.migrations import run_migrations  # noqa: E402
+from app.utils.fuzzy import MIN_SIMILARITY, FuzzyIndex, trigrams  # noqa: E402
+from app.utils.suggest import load_search_terms, normalize  # noqa: E402
+
+CITIES = [
+    "San Jose", "San Francisco", "Oakland", "Palo Alto", "Berkeley", "Sacramento", "Los Angeles", "San Diego",
+    "Fresno", "Seattle", "Portland", "Denver", "Phoenix", "Austin", "Dallas", "Houston", "Chicago", "Boston",
+    "New York", "Brooklyn", "Philadelphia", "Atlanta", "Miami", "Orlando", "Nashville", "Minneapolis",
+]
+CUISINES = [
+    "Italian", "Mexican", "Vietnamese", "Thai", "Indian", "Chinese", "Japanese", "Korean", "French", "Greek",
+    "Ethiopian", "Peruvian", "Spanish", "Lebanese", "American", "Mediterranean", "Turkish", "Brazilian",
+]
+# Invented names with a long-tailed vocabulary, like real ones: words built from
+# ~2,500 syllables, and a common suffix ("Bistro", "Grill") on about half of them
+ONSETS = ["b", "c", "d", "f", "g", "h", "j", "k", "l", "m", "n", "p", "r", "s", "t", "v", "w", "z",
+          "br", "ch", "cl", "dr", "fl", "gr", "pl", "sh", "st", "th", "tr", "qu"]
+VOWELS = ["a", "e", "i", "o", "u", "ai", "ou", "ea"]
+CODAS = ["", "", "", "n", "r", "l", "s", "m", "nd", "st", "rk"]
+SYLLABLES = [o + v + c for o in ONSETS for v in VOWELS for c in CODAS]
+KINDS = ["Bistro", "Grill", "Kitchen", "Cafe", "House", "Diner", "Tavern", "Cantina", "Eatery", "Trattoria",
+         "Bar", "Bakery", "Noodle Bar", "Taqueria", "Pizzeria", "Steakhouse", "Brasserie", "Izakaya"]
+
+
+def restaurant_name() -> str:
+    words = [
+        "".join(random.choice(SYLLABLES) for _ in range(random.randint(1, 3))).capitalize()
+        for _ in range(random.randint(1, 2))
+    ]
+    if random.random() < 0.5:
+        words.append(random.choice(KINDS))
+    return " ".join(words)
+
+
+def add_restaurants(count: int):
+    rows = [
+        {"name": restaurant_name(), "cuisine": random.choice(CUISINES), "cost_rating": 2, "city": random.choice(CITIES),
+         "state": "CA", "zip_code": "95113", "rating": 4.0, "total_bookings": 0}
+        for _ in range(count)
+    ]
+    with engine.begin() as conn:
+        for start in range(0, count, 10000):
+            conn.execute(insert(models.Restaurant), rows[start:start + 10000])
+
+
+# One typo: a dropped, doubled or swapped letter
+def misspell(text: str) -> str:
+    i = random.randrange(1, len(text) - 1)
+    edit = random.choice(("drop", "double", "swap"))
+    if edit == "drop":
+        return text[:i] + text[i + 1:]
+    if edit == "double":
+        return text[:i] + text[i] + text[i:]
+    return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+
+
+# Baseline: Dice similarity against every term
+def scan(terms, term_grams, query: str, limit: int = 5):
+    grams = trigrams(normalize(query))
+    scored = []
+    for (kind, text, weight), other in zip(terms, term_grams):
+        similarity = 2 * len(grams & other) / (len(grams) + len(other))
+        if similarity >= MIN_SIMILARITY:
+            scored.append((-similarity, -weight, text))
+    return sorted(scored)[:limit]
+
+
+def mean_ms(lookup, queries) -> float:
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        lookup(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return statistics.mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+    random.seed(42)
+    run_migrations(engine)
+
+    # Typo corrections (search with fuzzy=true) go through the one-edit lookup;
+    # ranked near matches (/restaurants/fuzzy) through the trigram posting lists
+    print(f"{'restaurants':>11} {'terms':>7} {'correct ms':>11} {'fixed':>7} {'top-5 ms':>9} {'scan ms':>9} {'agrees':>7}")
+    loaded = 0
+    db = SessionLocal()
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            add_restaurants(size - loaded)
+            loaded = size
+            terms = load_search_terms(db)
+            term_grams = [trigrams(normalize(text)) for _, text, _ in terms]
+            index = FuzzyIndex()
+            index.match(db, "warm up")
+
+            typed = [text for _, text, _ in terms if len(text) >= 4]
+            originals = random.sample(typed, min(args.queries, len(typed)))
+            queries = [misspell(text) for text in originals]
+            correct_ms = mean_ms(lambda q: index.correct(db, q), queries)
+            top5_ms = mean_ms(lambda q: index.match(db, q, limit=5), queries)
+            scan_ms = mean_ms(lambda q: scan(terms, term_grams, q), queries[:max(1, args.queries // 10)])
+            # Corrections should give back the intended term; ranked matches must equal the scan's
+            fixed = sum(normalize(index.correct(db, q)) == normalize(original) for q, original in zip(queries, originals))
+            agrees = sum(
+                [m["text"] for m in index.match(db, q, limit=5)] == [text for _, _, text in scan(terms, term_grams, q, 5)]
+                for q in queries[:50]
+            )
+            print(f"{size:>11} {len(terms):>7} {correct_ms:>11.3f} {fixed * 100 / len(queries):>6.1f}% "
+                  f"{top5_ms:>9.3f} {scan_ms:>9.3f} {agrees:>4}/{min(50, len(queries))}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+"Near me" search over a synthetic catalog: R*Tree bounding-box prefilter plus
+exact distances, against scanning every restaurant's coordinates.
+
+    python -m benchmarks.geo_search [--restaurants 100000] [--queries 200] [--scan-queries 10]
+
+Runs against a throwaway database in a temporary directory; booktable.db is not touched.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+workdir = tempfile.mkdtemp(prefix="bench_geo_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+from sqlalchemy import insert, select  # noqa: E402
+from app.db import models, spatial  # noqa: E402
+from app.db.database import engine  # noqa: E402
+from app.db.migrations import run_migrations  # noqa: E402
+from app.utils.geo import _zip_centroids, bounding_box, haversine_km  # noqa: E402
+
+
+# Restaurants scattered around real zip centroids, so density follows population like the real catalog
+def build_catalog(count: int):
+    centroids = list(_zip_centroids().items())
+    rows = []
+    for i in range(count):
+        zip_code, (lat, lng) = random.choice(centroids)
+        rows.append({
+            "name": f"Restaurant {i}", "cuisine": "Test", "cost_rating": 2, "city": "City", "state": "ST",
+            "zip_code": zip_code, "rating": 4.0, "total_bookings": 0,
+            "latitude": lat + random.uniform(-0.02, 0.02), "longitude": lng + random.uniform(-0.02, 0.02)
+        })
+    with engine.begin() as conn:
+        for start in range(0, count, 10000):
+            conn.execute(insert(models.Restaurant), rows[start:start + 10000])
+    return rows
+
+
+def indexed(conn, lat, lng, radius_km):
+    box = spatial.restaurants_in_box(*bounding_box(lat, lng, radius_km))
+    query = select(models.Restaurant.id, models.Restaurant.latitude, models.Restaurant.longitude).join(
+        box, box.c.id == models.Restaurant.id
+    )
+    return sorted(
+        (haversine_km(lat, lng, r.latitude, r.longitude), r.id)
+        for r in conn.execute(query) if haversine_km(lat, lng, r.latitude, r.longitude) <= radius_km
+    )
+
+
+def full_scan(conn, lat, lng, radius_km):
+    query = select(models.Restaurant.id, models.Restaurant.latitude, models.Restaurant.longitude).where(
+        models.Restaurant.latitude.isnot(None)
+    )
+    return sorted(
+        (haversine_km(lat, lng, r.latitude, r.longitude), r.id)
+        for r in conn.execute(query) if haversine_km(lat, lng, r.latitude, r.longitude) <= radius_km
+    )
+
+
+def timed(search, conn, points, radius_km):
+    latencies, found = [], 0
+    for lat, lng in points:
+        started = time.perf_counter()
+        found += len(search(conn, lat, lng, radius_km))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return statistics.mean(latencies), sorted(latencies)[int(len(latencies) * 0.95)], found / len(points)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--restaurants", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scan-queries", type=int, default=10)
+    args = parser.parse_args()
+    random.seed(42)
+
+    run_migrations(engine)
+    started = time.perf_counter()
+    rows = build_catalog(args.restaurants)
+    print(f"Catalog: {args.restaurants} restaurants loaded in {time.perf_counter() - started:.1f}s")
+
+    points = [(r["latitude"], r["longitude"]) for r in random.sample(rows, args.queries)]
+    with engine.connect() as conn:
+        # Both strategies must return the same restaurants
+        for lat, lng in points[:10]:
+            assert indexed(conn, lat, lng, 10) == full_scan(conn, lat, lng, 10)
+        print(f"{'radius':>8} {'strategy':>10} {'mean ms':>9} {'p95 ms':>9} {'results':>9}")
+        # The full scan reads the whole catalog per query, so it gets a smaller sample
+        for radius_km in (2, 10, 50):
+            for name, search, sample in (("rtree", indexed, points), ("scan", full_scan, points[:args.scan_queries])):
+                mean, p95, found = timed(search, conn, sample, radius_km)
+                print(f"{radius_km:>6}km {name:>10} {mean:>9.2f} {p95:>9.2f} {found:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Booking throughput as reservations are split over more shards: several worker
+processes (like uvicorn --workers) book distinct slots across the restaurants
+at once, each booking in the shape book_table commits it (conflict check,
+reservation, booking count and outbox row in one write transaction).
+
+    python -m benchmarks.shard_scaling [--shards 0,1,2,4] [--workers 4] [--seconds 5]
+
+Lock wait is the time a booking spent getting its database's write lock, which
+is what spreading the bookings over more databases removes; throughput only
+grows with the shards while the workers have CPUs to run on, so give them as
+many CPUs as workers. Workers exit
+without flushing their booking counts, as on a crash; a fresh process then
+folds them in, and "lost counts" compares the restaurant counters with the
+reservations made. Run with SQLITE_SYNCHRONOUS=FULL to have every commit wait
+for its fsync. Each configuration gets its own throwaway databases in a
+temporary directory; booktable.db is not touched.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RESTAURANTS = 16
+TABLES = 10
+HOURS = 24
+
+
+def prepare():
+    from app.auth.auth_handler import hash_password
+    from app.db import models
+    from app.db.database import SessionLocal, engine
+    from app.db.migrations import run_migrations
+    from app.db.shards import shard_router
+
+    shard_router.install()
+    run_migrations(engine)
+    db = SessionLocal()
+    try:
+        db.add(models.User(email="diner@example.com", hashed_password=hash_password("Passw0rd!"),
+                           full_name="Diner", role="Customer"))
+        for i in range(RESTAURANTS):
+            restaurant = models.Restaurant(name=f"Bench Bistro {i}", cuisine="Test", cost_rating=2, city="San Jose",
+                                           state="CA", zip_code="95113", rating=4.0, total_bookings=0)
+            db.add(restaurant)
+            db.flush()
+            for _ in range(TABLES):
+                db.add(models.Table(restaurant_id=restaurant.id, size=4))
+        db.commit()
+    finally:
+        db.close()
+
+
+# Book distinct slots from `start_at` for `seconds`; prints the bookings made and their latencies
+def book(worker: int, start_at: float, seconds: float):
+    from datetime import date, datetime, timedelta
+    from app.db import models
+    from app.db.database import SessionLocal, begin_immediate, retry_on_lock
+    from app.db.shards import shard_router
+    from app.utils import outbox
+    from app.utils.availability_index import find_conflict
+    from app.utils.booking_counter import booking_counter
+
+    db = SessionLocal()
+    tables = {}
+    for restaurant_id, table_id in db.query(models.Table.restaurant_id, models.Table.id).order_by(models.Table.id):
+        tables.setdefault(restaurant_id, []).append(table_id)
+    restaurant_ids = sorted(tables)
+    user_id = db.query(models.User.id).filter(models.User.email == "diner@example.com").scalar()
+    first_day = date.today() + timedelta(days=1 + worker * 1000)
+    per_day = TABLES * HOURS
+    # Restaurants in random order, each worker its own; slots of a restaurant in turn
+    choose = random.Random(worker).choice
+    booked = dict.fromkeys(restaurant_ids, 0)
+
+    booking_counter.start()
+    time.sleep(max(0.0, start_at - time.time()))
+    latencies, lock_waits = [], []
+    while time.time() < start_at + seconds:
+        restaurant_id = choose(restaurant_ids)
+        i = booked[restaurant_id]
+        booked[restaurant_id] += 1
+        table_id = tables[restaurant_id][i % TABLES]
+        start = datetime.combine(first_day + timedelta(days=i // per_day),
+                                 datetime.min.time()) + timedelta(hours=(i // TABLES) % HOURS)
+        started = time.perf_counter()
+        with shard_router.session(db, restaurant_id) as rdb:
+            def work():
+                waited = time.perf_counter()
+                begin_immediate(rdb)
+                lock_waits.append((time.perf_counter() - waited) * 1000)
+                if find_conflict(rdb, table_id, start):
+                    rdb.rollback()
+                    return
+                reservation = models.Reservation(user_id=user_id, restaurant_id=restaurant_id, table_id=table_id,
+                                                 date=start.date(), time=start.time(), number_of_people=2,
+                                                 status="confirmed")
+                rdb.add(reservation)
+                rdb.flush()
+                booking_counter.record(rdb, restaurant_id, added=1)
+                outbox.enqueue(rdb, "booking_confirmation", "diner@example.com", {"id": str(reservation.id)})
+                rdb.commit()
+            retry_on_lock(rdb, work, attempts=20)
+        latencies.append((time.perf_counter() - started) * 1000)
+    db.close()
+    print(json.dumps({"bookings": len(latencies), "latencies": latencies, "lock_waits": lock_waits}))
+    sys.stdout.flush()
+    # No booking_counter.stop(): counts not yet folded in are left behind, as on a crash
+    os._exit(0)
+
+
+# Fold the counts the workers left behind, then compare the counters with the reservations
+def check():
+    from app.db import models
+    from app.db.database import SessionLocal
+    from app.db.shards import shard_router
+    from app.utils.booking_counter import booking_counter
+
+    booking_counter.flush()
+    db = SessionLocal()
+    try:
+        counted = db.query(models.Restaurant.total_bookings).all()
+        made = sum(shard_router.gather(db, lambda rdb: rdb.query(models.Reservation).count()))
+        print(json.dumps({"made": made, "counted": sum(total for (total,) in counted)}))
+    finally:
+        db.close()
+
+
+def child(shards: int, workdir: str, *args) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               RESERVATION_SHARDS=str(shards), SQLITE_LOCAL_REPLICAS="0")
+    return subprocess.Popen([sys.executable, "-m", "benchmarks.shard_scaling", *args], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+
+# Last line of a child's output, where it prints its JSON result
+def result(process: subprocess.Popen) -> dict:
+    output, _ = process.communicate()
+    if process.returncode != 0 or not output.strip():
+        raise RuntimeError(f"benchmark process failed: {process.args}")
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(shards: int, workers: int, seconds: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"bench_shards{shards}_")
+    preparing = child(shards, workdir, "--prepare")
+    preparing.communicate()
+    # Workers start booking together, once every one of them has imported the app
+    start_at = time.time() + 3
+    processes = [child(shards, workdir, "--worker", str(w), "--start-at", str(start_at), "--seconds", str(seconds))
+                 for w in range(workers)]
+    results = [result(process) for process in processes]
+    counts = result(child(shards, workdir, "--check"))
+    latencies = sorted(ms for r in results for ms in r["latencies"])
+    lock_waits = [ms for r in results for ms in r["lock_waits"]]
+    return {
+        "bookings": sum(r["bookings"] for r in results) / seconds,
+        "mean": statistics.mean(latencies), "p95": latencies[int(len(latencies) * 0.95)], "max": latencies[-1],
+        "lock_wait": statistics.mean(lock_waits), "lost": counts["made"] - counts["counted"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", default="0,1,2,4")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--prepare", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--check", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        return prepare()
+    if args.worker is not None:
+        return book(args.worker, args.start_at, args.seconds)
+    if args.check:
+        return check()
+
+    print(f"{args.workers} worker processes on {os.cpu_count()} CPUs, {args.seconds:g}s per configuration, "
+          f"synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+    print(f"{'shards':>6} {'bookings/s':>11} {'mean ms':>8} {'p95 ms':>7} {'max ms':>8} {'lock wait ms':>13} "
+          f"{'lost counts':>12}")
+    for shards in (int(s) for s in args.shards.split(",")):
+        r = run(shards, args.workers, args.seconds)
+        print(f"{shards:>6} {r['bookings']:>11.0f} {r['mean']:>8.2f} {r['p95']:>7.2f} {r['max']:>8.1f} "
+              f"{r['lock_wait']:>13.2f} {r['lost']:>12}")
+
+
+if __name__ == "__main__":
+    main()
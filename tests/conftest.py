@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+import pytest
+
+# The suite runs against a throwaway database; booktable.db is never touched
+workdir = tempfile.mkdtemp(prefix="booktable_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'test.db')}"
+os.environ.pop("RESERVATION_SHARDS", None)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    # Entering the client runs startup: migrations and the seed data
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def login(client, email: str, password: str) -> dict:
+    response = client.post("/users/login", json={"email": email, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def customers(client):
+    # Seeded customers
+    return [login(client, "alice@gmail.com", "alice123"), login(client, "bob@example.com", "bob123")]
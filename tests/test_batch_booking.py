@@ -0,0 +1,42 @@
+from datetime import date, timedelta
+
+from app.db import models
+from app.db.database import SessionLocal
+from app.db.shards import shard_router
+
+DAY = date.today() + timedelta(days=42)
+
+
+def booking(table_id, time):
+    return {"table_id": table_id, "date": DAY.isoformat(), "time": time, "number_of_people": 2}
+
+
+def confirmed_on_day():
+    db = SessionLocal()
+    try:
+        with shard_router.session(db, 1) as rdb:
+            return sorted((table_id, t.strftime("%H:%M")) for table_id, t in rdb.query(
+                models.Reservation.table_id, models.Reservation.time
+            ).filter(models.Reservation.date == DAY, models.Reservation.status == "confirmed"))
+    finally:
+        db.close()
+
+
+def test_batch_books_every_table(client, customers):
+    alice, _ = customers
+    response = client.post("/restaurants/1/book/batch", json={"bookings": [booking(1, "19:00"), booking(2, "19:00")]},
+                           headers=alice)
+    assert response.status_code == 200, response.text
+    assert len(response.json()["reservation_ids"]) == 2
+    assert {(1, "19:00"), (2, "19:00")} <= set(confirmed_on_day())
+
+
+def test_batch_with_a_taken_slot_books_nothing(client, customers):
+    alice, bob = customers
+    assert client.post("/restaurants/1/book", json=booking(2, "18:00"), headers=alice).status_code == 200
+
+    response = client.post("/restaurants/1/book/batch", json={"bookings": [booking(1, "18:00"), booking(2, "18:00")]},
+                           headers=bob)
+    assert response.status_code == 409, response.text
+    # Table 1 at 18:00 was free, but the batch is all or nothing
+    assert (1, "18:00") not in confirmed_on_day()
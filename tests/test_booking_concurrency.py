@@ -0,0 +1,70 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from threading import Barrier, BrokenBarrierError
+
+from app.db import models
+from app.db.database import SessionLocal
+from app.db.shards import shard_router
+
+REQUESTS_PER_TEST = 200
+THREADS = 50
+
+
+# Fire requests_per_slot bookings at each (table_id, time) slot of restaurant 1 at once
+def book_concurrently(client, customers, slots, requests_per_slot, day):
+    attempts = [(slot, customers[i % len(customers)]) for slot in slots for i in range(requests_per_slot)]
+    barrier = Barrier(THREADS)
+
+    def book(attempt):
+        (table_id, time), headers = attempt
+        # Release the first wave together so the requests really race
+        try:
+            barrier.wait(timeout=5)
+        except BrokenBarrierError:
+            pass
+        response = client.post(
+            "/restaurants/1/book",
+            json={"table_id": table_id, "date": day.isoformat(), "time": time, "number_of_people": 2},
+            headers=headers
+        )
+        return (table_id, time), response.status_code
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return Counter(pool.map(book, attempts))
+
+
+def confirmed_bookings(day, table_id, time):
+    db = SessionLocal()
+    try:
+        with shard_router.session(db, 1) as rdb:
+            return rdb.query(models.Reservation).filter(
+                models.Reservation.table_id == table_id,
+                models.Reservation.date == day,
+                models.Reservation.time == datetime.strptime(time, "%H:%M").time(),
+                models.Reservation.status == "confirmed"
+            ).count()
+    finally:
+        db.close()
+
+
+def test_one_slot_has_exactly_one_winner(client, customers):
+    day = date.today() + timedelta(days=30)
+    results = book_concurrently(client, customers, [(1, "18:00")], REQUESTS_PER_TEST, day)
+
+    assert results[((1, "18:00"), 200)] == 1
+    assert results[((1, "18:00"), 409)] == REQUESTS_PER_TEST - 1
+    assert confirmed_bookings(day, 1, "18:00") == 1
+
+
+def test_each_slot_has_exactly_one_winner(client, customers):
+    day = date.today() + timedelta(days=31)
+    # An hour apart, so no winner blocks another slot
+    slots = [(1, "18:00"), (1, "19:00"), (2, "18:00"), (2, "19:00")]
+    per_slot = REQUESTS_PER_TEST // len(slots)
+    results = book_concurrently(client, customers, slots, per_slot, day)
+
+    for table_id, time in slots:
+        assert results[((table_id, time), 200)] == 1
+        assert results[((table_id, time), 409)] == per_slot - 1
+        assert confirmed_bookings(day, table_id, time) == 1
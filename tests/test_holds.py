@@ -0,0 +1,78 @@
+import time
+from datetime import date, datetime, timedelta
+
+from app.db import models
+from app.db.database import SessionLocal
+from app.db.shards import shard_router
+from app.utils.holds import hold_sweeper
+
+DAY = date.today() + timedelta(days=40)
+
+
+def slot(time, table_id=1):
+    return {"table_id": table_id, "date": DAY.isoformat(), "time": time, "number_of_people": 2}
+
+
+def reservation_status(reservation_id):
+    db = SessionLocal()
+    try:
+        with shard_router.session(db, 1) as rdb:
+            return rdb.query(models.Reservation.status).filter(models.Reservation.id == reservation_id).scalar()
+    finally:
+        db.close()
+
+
+def test_hold_blocks_the_slot_until_released(client, customers):
+    alice, bob = customers
+    response = client.post("/restaurants/1/holds", json=slot("18:00"), headers=alice)
+    assert response.status_code == 200, response.text
+    hold_id = response.json()["hold_id"]
+
+    assert client.post("/restaurants/1/book", json=slot("18:00"), headers=bob).status_code == 409
+    assert client.post("/restaurants/1/holds", json=slot("18:00"), headers=bob).status_code == 409
+    # Only the customer holding the slot can release it
+    assert client.delete(f"/restaurants/holds/{hold_id}", headers=bob).status_code == 403
+    assert client.delete(f"/restaurants/holds/{hold_id}", headers=alice).status_code == 200
+
+    response = client.post("/restaurants/1/holds", json=slot("18:00"), headers=bob)
+    assert response.status_code == 200, response.text
+    assert client.delete(f"/restaurants/holds/{response.json()['hold_id']}", headers=bob).status_code == 200
+
+
+def test_booking_with_the_hold_confirms_it(client, customers):
+    alice, bob = customers
+    hold_id = client.post("/restaurants/1/holds", json=slot("18:00", table_id=2), headers=alice).json()["hold_id"]
+
+    # Someone else's hold is not found for them
+    assert client.post("/restaurants/1/book", json={**slot("18:00", table_id=2), "hold_id": hold_id},
+                       headers=bob).status_code == 404
+    response = client.post("/restaurants/1/book", json={**slot("18:00", table_id=2), "hold_id": hold_id}, headers=alice)
+    assert response.status_code == 200, response.text
+    assert response.json()["reservation_id"] == hold_id
+    assert reservation_status(hold_id) == "confirmed"
+
+
+def test_expired_hold_is_swept_and_frees_the_slot(client, customers):
+    alice, bob = customers
+    hold_id = client.post("/restaurants/1/holds", json=slot("19:00"), headers=alice).json()["hold_id"]
+
+    # Expire the hold now instead of waiting out its minutes
+    expired = datetime.now() - timedelta(seconds=1)
+    db = SessionLocal()
+    try:
+        with shard_router.session(db, 1) as rdb:
+            rdb.query(models.Reservation).filter(models.Reservation.id == hold_id).update(
+                {"hold_expires_at": expired}, synchronize_session=False
+            )
+            rdb.commit()
+    finally:
+        db.close()
+    hold_sweeper.schedule(expired, hold_id, 1, 1, DAY, 19 * 60)
+
+    deadline = time.monotonic() + 5
+    while reservation_status(hold_id) is not None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert reservation_status(hold_id) is None
+
+    response = client.post("/restaurants/1/book", json=slot("19:00"), headers=bob)
+    assert response.status_code == 200, response.text
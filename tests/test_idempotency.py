@@ -0,0 +1,26 @@
+from datetime import date, timedelta
+
+DAY = date.today() + timedelta(days=43)
+
+
+def test_retried_booking_is_replayed_not_booked_twice(client, customers):
+    alice, _ = customers
+    headers = {**alice, "Idempotency-Key": "test-booking-retry"}
+    booking = {"table_id": 1, "date": DAY.isoformat(), "time": "18:00", "number_of_people": 2}
+
+    first = client.post("/restaurants/1/book", json=booking, headers=headers)
+    assert first.status_code == 200, first.text
+    retry = client.post("/restaurants/1/book", json=booking, headers=headers)
+    assert retry.status_code == 200, retry.text
+    assert retry.json() == first.json()
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+
+
+def test_key_reused_with_a_different_body_is_rejected(client, customers):
+    alice, _ = customers
+    headers = {**alice, "Idempotency-Key": "test-booking-mismatch"}
+    booking = {"table_id": 1, "date": DAY.isoformat(), "time": "19:00", "number_of_people": 2}
+
+    assert client.post("/restaurants/1/book", json=booking, headers=headers).status_code == 200
+    response = client.post("/restaurants/1/book", json={**booking, "table_id": 2}, headers=headers)
+    assert response.status_code == 422, response.text
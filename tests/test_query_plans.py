@@ -0,0 +1,16 @@
+import pytest
+
+from app.db.database import engine
+from app.db.query_plans import HOT_QUERIES, full_scans, query_plans
+
+
+@pytest.fixture(scope="module")
+def plans(client):
+    # The client has run the migrations that create the indexes
+    return query_plans(engine)
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(plans, name):
+    assert plans[name], f"{name} sent no query"
+    assert not full_scans(plans[name]), f"{name}: {'; '.join(plans[name])}"
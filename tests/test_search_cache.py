@@ -0,0 +1,44 @@
+from datetime import date, timedelta
+
+from conftest import login
+from app.utils.search_cache import restaurant_cache
+
+DAY = date.today() + timedelta(days=44)
+
+
+def names(response):
+    assert response.status_code == 200, response.text
+    return [r["name"] for r in response.json()]
+
+
+def test_catalog_edit_invalidates_cached_searches(client):
+    manager = login(client, "syedanida.khader@sjsu.edu", "manager123")
+    search = "/restaurants/search?q=zanzibar"
+    original = client.get("/restaurants/5").json()["name"]
+
+    assert names(client.get(search)) == []
+    hits = restaurant_cache.stats()["hits"]
+    assert names(client.get(search)) == []
+    assert restaurant_cache.stats()["hits"] == hits + 1
+
+    try:
+        response = client.put("/manager/restaurants/5", json={"name": "Zanzibar Grill"}, headers=manager)
+        assert response.status_code == 200, response.text
+        assert names(client.get(search)) == ["Zanzibar Grill"]
+        assert client.get("/restaurants/5").json()["name"] == "Zanzibar Grill"
+    finally:
+        client.put("/manager/restaurants/5", json={"name": original}, headers=manager)
+
+
+def test_booking_keeps_searches_of_other_restaurants_cached(client, customers):
+    alice, _ = customers
+    search = "/restaurants/search?city=san jose"
+    ids = [r["id"] for r in client.get(search).json()]
+    assert ids and 1 not in ids
+
+    booking = {"table_id": 1, "date": DAY.isoformat(), "time": "18:00", "number_of_people": 2}
+    assert client.post("/restaurants/1/book", json=booking, headers=alice).status_code == 200
+
+    hits = restaurant_cache.stats()["hits"]
+    client.get(search)
+    assert restaurant_cache.stats()["hits"] == hits + 1
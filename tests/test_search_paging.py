@@ -0,0 +1,37 @@
+import pytest
+
+
+# Follow X-Next-Cursor from the first page to the last; returns the ids in order
+def walk(client, query, limit):
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get(f"/restaurants/search?{query}", params=params)
+        assert response.status_code == 200, response.text
+        page = [r["id"] for r in response.json()]
+        assert len(page) <= limit
+        ids.extend(page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+@pytest.mark.parametrize("query", ["fields=id", "city=san&fields=id", "sort=rank&fields=id"])
+def test_cursor_pages_cover_the_results_once(client, query):
+    everything = [r["id"] for r in client.get(f"/restaurants/search?{query}", params={"limit": 100}).json()]
+    assert len(everything) > 3
+
+    paged = walk(client, query, limit=3)
+    assert paged == everything
+
+
+def test_bad_cursor_is_rejected(client):
+    assert client.get("/restaurants/search", params={"cursor": "not-a-cursor"}).status_code == 400
+    # A cursor from one sort order does not page another
+    cursor = client.get("/restaurants/search", params={"limit": 1, "sort": "rank"}).headers["X-Next-Cursor"]
+    assert client.get("/restaurants/search", params={"cursor": cursor}).status_code == 400
+
+
+@pytest.mark.parametrize("limit", [0, -1, 101])
+def test_out_of_range_limit_is_rejected(client, limit):
+    assert client.get("/restaurants/search", params={"limit": limit}).status_code == 422
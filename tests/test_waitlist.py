@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+
+DAY = date.today() + timedelta(days=41)
+
+
+def test_cancellation_promotes_the_waiting_customer(client, customers):
+    alice, bob = customers
+    booking = {"table_id": 1, "date": DAY.isoformat(), "time": "18:00", "number_of_people": 2}
+    response = client.post("/restaurants/1/book", json=booking, headers=alice)
+    assert response.status_code == 200, response.text
+    reservation_id = response.json()["reservation_id"]
+
+    # 18:30 +/- 30 minutes covers the 18:00 slot alice holds
+    response = client.post("/restaurants/1/waitlist", json={"date": DAY.isoformat(), "time": "18:30", "number_of_people": 2},
+                           headers=bob)
+    assert response.status_code == 200, response.text
+    waitlist_id = response.json()["waitlist_id"]
+
+    response = client.delete(f"/restaurants/cancel/{reservation_id}", headers=alice)
+    assert response.status_code == 200, response.text
+    assert response.json()["waitlist_promoted"] is True
+
+    entry = next(e for e in client.get("/restaurants/my-waitlist", headers=bob).json() if e["waitlist_id"] == waitlist_id)
+    assert entry["status"] == "promoted"
+    promoted = [r for r in client.get("/restaurants/my-reservations", headers=bob).json()
+                if r["reservation_id"] == entry["reservation_id"]]
+    assert len(promoted) == 1